@@ -0,0 +1,333 @@
+"""Cached AI tutor explanations.
+
+The tutor prompt only depends on the level and the fixed system message, so
+explanations are cached under a hash of (provider, model, system message,
+rendered prompt): first in a per-worker LRU, then in the ``tutor_cache``
+collection shared by all workers, which expires entries through a TTL index.
+Concurrent misses for the same key within a worker share one upstream call.
+``open_stream`` serves the same cache as a stream of text deltas: misses are
+relayed from the upstream model as they arrive, hits are replayed in chunks.
+
+Upstream calls go through ``llm_gateway`` for concurrency limits, deadlines
+and circuit breaking. ``AI_TUTOR_BACKEND=local`` swaps the LLM for a deterministic stand-in, for
+development and tests without an API key.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from pymongo.errors import PyMongoError
+
+from llm_gateway import LlmGateway
+
+logger = logging.getLogger(__name__)
+
+AI_TUTOR_PROVIDER = os.environ.get("AI_TUTOR_PROVIDER", "openai")
+AI_TUTOR_MODEL = os.environ.get("AI_TUTOR_MODEL", "gpt-4o-mini")
+AI_TUTOR_BACKEND = os.environ.get("AI_TUTOR_BACKEND", "emergent")
+AI_TUTOR_CACHE_SIZE = int(os.environ.get("AI_TUTOR_CACHE_SIZE", "1024"))
+AI_TUTOR_CACHE_TTL_SECONDS = int(os.environ.get("AI_TUTOR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Cached explanations are replayed to streaming clients in pieces of this size
+REPLAY_CHUNK_CHARS = 96
+
+SYSTEM_MESSAGE = """You are an expert Python programming tutor. Your job is to explain programming concepts in a clear, engaging way with practical examples. 
+
+Key guidelines:
+1. Explain the concept clearly for beginners
+2. Provide 2-3 practical code examples
+3. Include common use cases and best practices
+4. Keep explanations concise but comprehensive
+5. Use encouraging and supportive tone
+6. Focus on the learning objective of the challenge
+
+Format your response with:
+- **Concept Explanation**: Clear overview
+- **Code Examples**: 2-3 practical examples with comments
+- **Common Use Cases**: Where this is used in real programming
+- **Tips**: Best practices and common mistakes to avoid"""
+
+
+class TutorUnavailable(Exception):
+    pass
+
+
+class TutorAbandoned(TutorUnavailable):
+    """The streaming request that owned an upstream call went away before it finished"""
+
+
+def render_prompt(level: Dict[str, Any]) -> str:
+    return f"""
+Explain this Python programming concept for a learning challenge:
+
+**Challenge Title**: {level['title']}
+**Description**: {level['description']}
+**Category**: {level['category']}
+**Difficulty**: {level['difficulty']}
+
+**Current Challenge Code**:
+```python
+{level.get('starter_code', '')}
+```
+
+**Expected Output**: {level['expected_output']}
+
+Please provide a comprehensive tutorial explanation that helps the user understand:
+1. The core concept being taught
+2. How to approach this type of problem
+3. Step-by-step breakdown with examples
+4. Import statements needed and why
+
+Make it educational and engaging for a {level['difficulty'].lower()} level programmer.
+"""
+
+
+def cache_key(provider: str, model: str, system_message: str, prompt: str) -> str:
+    digest = hashlib.sha256()
+    for part in (provider, model, system_message, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+async def emergent_completion(system_message: str, prompt: str, session_id: str) -> str:
+    # Imported lazily so the API can start (and the local backend can run) without the package
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+    api_key = os.environ.get("EMERGENT_LLM_KEY")
+    if not api_key:
+        raise TutorUnavailable("AI service not configured")
+    chat = LlmChat(
+        api_key=api_key,
+        session_id=session_id,
+        system_message=system_message
+    ).with_model(AI_TUTOR_PROVIDER, AI_TUTOR_MODEL)
+    return await chat.send_message(UserMessage(text=prompt))
+
+
+async def local_completion(system_message: str, prompt: str, session_id: str) -> str:
+    title = next((line.split("**: ", 1)[1] for line in prompt.splitlines() if line.startswith("**Challenge Title**")), "")
+    return (
+        f"**Concept Explanation**: {title}\n\n"
+        "**Code Examples**:\n```python\nprint('Hello, PythonQuest!')\n```\n\n"
+        "**Tips**: Read the expected output carefully and run your code often."
+    )
+
+
+def replay_chunks(text: str, size: int = REPLAY_CHUNK_CHARS):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+async def emergent_stream(system_message: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+    # The emergentintegrations chat client has no streaming call; relay the
+    # whole completion as one delta. Cancelling still aborts the request.
+    yield await emergent_completion(system_message, prompt, session_id)
+
+
+async def local_stream(system_message: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+    text = await local_completion(system_message, prompt, session_id)
+    for piece in replay_chunks(text, 16):
+        await asyncio.sleep(0.01)
+        yield piece
+
+
+BACKENDS = {
+    "emergent": emergent_completion,
+    "local": local_completion,
+}
+STREAM_BACKENDS = {
+    "emergent": emergent_stream,
+    "local": local_stream,
+}
+
+
+class TutorService:
+    def __init__(
+        self,
+        completion: Optional[Callable[[str, str, str], Awaitable[str]]] = None,
+        stream_completion: Optional[Callable[[str, str, str], AsyncIterator[str]]] = None,
+        gateway: Optional[LlmGateway] = None,
+        maxsize: int = AI_TUTOR_CACHE_SIZE,
+        ttl: int = AI_TUTOR_CACHE_TTL_SECONDS
+    ):
+        self.completion = completion or BACKENDS[AI_TUTOR_BACKEND]
+        self.stream_completion = stream_completion or STREAM_BACKENDS[AI_TUTOR_BACKEND]
+        self.gateway = gateway or LlmGateway()
+        self.provider = AI_TUTOR_PROVIDER
+        self.model = AI_TUTOR_MODEL
+        self.lane = f"{self.provider}/{self.model}"
+        self._memory: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._counters = {
+            "memory_hits": 0, "store_hits": 0, "upstream_calls": 0, "coalesced": 0,
+            "errors": 0, "streams": 0, "abandoned_streams": 0
+        }
+
+    def _key(self, level: Dict[str, Any]) -> Tuple[str, str]:
+        prompt = render_prompt(level)
+        return cache_key(self.provider, self.model, SYSTEM_MESSAGE, prompt), prompt
+
+    async def _cached(self, db, key: str) -> Optional[str]:
+        cached = self._memory.get(key)
+        if cached is not None:
+            self._counters["memory_hits"] += 1
+            return cached[1]
+        try:
+            stored = await db.tutor_cache.find_one({"_id": key}, {"level_id": 1, "response": 1})
+        except PyMongoError as e:
+            logger.error(f"Tutor cache read failed: {str(e)}")
+            return None
+        if stored is None:
+            return None
+        self._counters["store_hits"] += 1
+        self._memory[key] = (stored.get("level_id"), stored["response"])
+        return stored["response"]
+
+    async def _store(self, db, key: str, level_id: int, text: str):
+        self._memory[key] = (level_id, text)
+        try:
+            await db.tutor_cache.update_one(
+                {"_id": key},
+                {"$set": {
+                    "level_id": level_id,
+                    "provider": self.provider,
+                    "model": self.model,
+                    "response": text,
+                    "created_at": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+        except PyMongoError as e:
+            logger.error(f"Tutor cache write failed: {str(e)}")
+
+    def _begin(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def _fail(self, future: asyncio.Future, error: BaseException):
+        if not isinstance(error, TutorAbandoned):
+            self._counters["errors"] += 1
+        if not future.done():
+            future.set_exception(error)
+            # Waiters observe the exception; this marks it retrieved for the owner
+            future.exception()
+
+    def _finish(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    async def _wait(self, db, level: Dict[str, Any], future: asyncio.Future) -> str:
+        self._counters["coalesced"] += 1
+        try:
+            return await asyncio.shield(future)
+        except TutorAbandoned:
+            # The owner was a stream whose client left; ask again ourselves
+            return (await self.explain(db, level))[0]
+
+    async def explain(self, db, level: Dict[str, Any]) -> Tuple[str, bool]:
+        """Explanation for a level (with heavy fields); returns (text, served_from_cache)"""
+        key, prompt = self._key(level)
+        text = await self._cached(db, key)
+        if text is not None:
+            return text, True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await self._wait(db, level, inflight), True
+
+        future = self._begin(key)
+        try:
+            self._counters["upstream_calls"] += 1
+            text = await self.gateway.complete(self.lane, self.completion, SYSTEM_MESSAGE, prompt, f"tutor_{key[:16]}")
+            await self._store(db, key, level["level_id"], text)
+            future.set_result(text)
+            return text, False
+        except BaseException as e:
+            self._fail(future, e if isinstance(e, Exception) else TutorAbandoned())
+            raise
+        finally:
+            self._finish(key, future)
+
+    async def open_stream(self, db, level: Dict[str, Any]) -> Tuple[bool, AsyncIterator[str]]:
+        """Returns (served_from_cache, text deltas) for a level's explanation"""
+        self._counters["streams"] += 1
+        key, prompt = self._key(level)
+        text = await self._cached(db, key)
+        if text is not None:
+            return True, self._replay(text)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return True, self._replay_when_ready(db, level, inflight)
+        # Registered before the first read so concurrent requests coalesce onto it
+        future = self._begin(key)
+        return False, TutorStream(self, key, future, self._relay(db, key, future, level["level_id"], prompt))
+
+    async def _replay(self, text: str) -> AsyncIterator[str]:
+        for chunk in replay_chunks(text):
+            yield chunk
+
+    async def _replay_when_ready(self, db, level: Dict[str, Any], future: asyncio.Future) -> AsyncIterator[str]:
+        for chunk in replay_chunks(await self._wait(db, level, future)):
+            yield chunk
+
+    async def _relay(self, db, key: str, future: asyncio.Future, level_id: int, prompt: str) -> AsyncIterator[str]:
+        upstream = self.gateway.stream(self.lane, self.stream_completion, SYSTEM_MESSAGE, prompt, f"tutor_{key[:16]}")
+        parts = []
+        try:
+            self._counters["upstream_calls"] += 1
+            async for delta in upstream:
+                parts.append(delta)
+                yield delta
+            text = "".join(parts)
+            await self._store(db, key, level_id, text)
+            future.set_result(text)
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client disconnected: stop generating and let coalesced waiters retry
+            self._counters["abandoned_streams"] += 1
+            self._fail(future, TutorAbandoned())
+            raise
+        except Exception as e:
+            self._fail(future, e)
+            raise
+        finally:
+            self._finish(key, future)
+            await upstream.aclose()
+
+    def _abandon(self, key: str, future: asyncio.Future):
+        if not future.done():
+            self._counters["abandoned_streams"] += 1
+            self._fail(future, TutorAbandoned())
+        self._finish(key, future)
+
+    async def invalidate_level(self, db, level_id: int):
+        for key in [key for key, (cached_level, _) in list(self._memory.items()) if cached_level == level_id]:
+            self._memory.pop(key, None)
+        await db.tutor_cache.delete_many({"level_id": level_id})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory_entries": len(self._memory), "backend": AI_TUTOR_BACKEND, "model": self.model, **self._counters}
+
+
+class TutorStream:
+    """Upstream relay that also releases its in-flight slot when closed before it was ever read"""
+
+    def __init__(self, service: TutorService, key: str, future: asyncio.Future, deltas: AsyncIterator[str]):
+        self._service = service
+        self._key = key
+        self._future = future
+        self._deltas = deltas
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self._deltas.__anext__()
+
+    async def aclose(self):
+        await self._deltas.aclose()
+        self._service._abandon(self._key, self._future)
@@ -0,0 +1,173 @@
+"""Write-behind buffer for failed submission attempts.
+
+A failed submission only increments ``attempts`` on the user's progress
+document. The increments are accumulated per (user, level) in memory and
+written in one unordered ``bulk_write`` every few seconds, when the buffer
+grows past ``max_keys``, and on shutdown. A worker crash loses at most one
+flush interval of attempt counts; completions are never buffered.
+
+To answer a failed submission without reading the progress document every
+time, the buffer also remembers each pair's stored progress the first time
+it sees the pair. It then advances that baseline as its own flushes land.
+Attempts made through other workers show up once the baseline expires.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from cachetools import TTLCache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_FLUSH_SECONDS = float(os.environ.get("ATTEMPT_FLUSH_SECONDS", "2"))
+ATTEMPT_BUFFER_MAX_KEYS = int(os.environ.get("ATTEMPT_BUFFER_MAX_KEYS", "5000"))
+ATTEMPT_BASELINE_SIZE = int(os.environ.get("ATTEMPT_BASELINE_SIZE", "20000"))
+ATTEMPT_BASELINE_TTL_SECONDS = float(os.environ.get("ATTEMPT_BASELINE_TTL_SECONDS", "300"))
+DUPLICATE_KEY = 11000
+
+
+class AttemptBuffer:
+    def __init__(self, flush_seconds: float = ATTEMPT_FLUSH_SECONDS, max_keys: int = ATTEMPT_BUFFER_MAX_KEYS):
+        self.flush_seconds = flush_seconds
+        self.max_keys = max_keys
+        self._pending: Dict[str, Dict[int, int]] = {}
+        self._keys = 0
+        self._db = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self._baselines: TTLCache = TTLCache(maxsize=ATTEMPT_BASELINE_SIZE, ttl=ATTEMPT_BASELINE_TTL_SECONDS)
+        self._counters = {"buffered": 0, "flushes": 0, "written": 0, "failed_flushes": 0}
+
+    def _merge(self, user_id: str, level_id: int, count: int) -> int:
+        levels = self._pending.setdefault(user_id, {})
+        if level_id not in levels:
+            self._keys += 1
+        levels[level_id] = levels.get(level_id, 0) + count
+        return levels[level_id]
+
+    def add(self, user_id: str, level_id: int, count: int = 1) -> int:
+        """Buffer attempts; returns this worker's unflushed count for the pair"""
+        total = self._merge(user_id, level_id, count)
+        self._counters["buffered"] += count
+        if self._keys >= self.max_keys and self._db is not None and not self._flush_lock.locked():
+            task = asyncio.create_task(self._flush_logged(self._db))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return total
+
+    def remember(self, user_id: str, level_id: int, stored: Dict[str, Any]):
+        """Record the progress document as read from the database, before this worker's pending attempts"""
+        self._baselines[(user_id, level_id)] = dict(stored)
+
+    def progress(self, user_id: str, level_id: int) -> Optional[Dict[str, Any]]:
+        """The pair's progress including unflushed attempts, or None if no baseline is known"""
+        baseline = self._baselines.get((user_id, level_id))
+        if baseline is None:
+            return None
+        pending = self._pending.get(user_id, {}).get(level_id, 0)
+        return {**baseline, "attempts": baseline.get("attempts", 0) + pending}
+
+    def take(self, user_id: str, level_id: int) -> int:
+        """Remove and return the unflushed count, for callers writing the document anyway"""
+        # The caller is about to change the document (a completion), so the baseline is stale
+        self._baselines.pop((user_id, level_id), None)
+        levels = self._pending.get(user_id)
+        if not levels or level_id not in levels:
+            return 0
+        self._keys -= 1
+        count = levels.pop(level_id)
+        if not levels:
+            del self._pending[user_id]
+        return count
+
+    def restore(self, user_id: str, level_id: int, count: int):
+        """Put back attempts returned by ``take`` whose write failed"""
+        if count:
+            self._merge(user_id, level_id, count)
+
+    def pending_for_user(self, user_id: str) -> Dict[int, int]:
+        return dict(self._pending.get(user_id, {}))
+
+    @staticmethod
+    def _operation(user_id: str, level_id: int, count: int) -> UpdateOne:
+        return UpdateOne(
+            {"user_id": user_id, "level_id": level_id},
+            {
+                "$inc": {"attempts": count},
+                "$setOnInsert": {"_id": str(uuid.uuid4()), "is_completed": False, "stars": 0, "xp_earned": 0}
+            },
+            upsert=True
+        )
+
+    async def _write(self, db, operations: List[UpdateOne]):
+        try:
+            await db.user_progress.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            # A concurrent upsert created the document first; it matches now
+            await db.user_progress.bulk_write([operations[err["index"]] for err in errors], ordered=False)
+
+    async def flush(self, db):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending, self._keys = self._pending, {}, 0
+            operations = [
+                self._operation(user_id, level_id, count)
+                for user_id, levels in pending.items()
+                for level_id, count in levels.items()
+            ]
+            try:
+                await self._write(db, operations)
+            except PyMongoError as e:
+                # Keep the counts and retry with the next flush
+                self._counters["failed_flushes"] += 1
+                logger.error(f"Attempt buffer flush of {len(operations)} updates failed: {str(e)}")
+                for user_id, levels in pending.items():
+                    for level_id, count in levels.items():
+                        self._merge(user_id, level_id, count)
+                return
+            self._counters["flushes"] += 1
+            self._counters["written"] += len(operations)
+            for user_id, levels in pending.items():
+                for level_id, count in levels.items():
+                    baseline = self._baselines.get((user_id, level_id))
+                    if baseline is not None:
+                        baseline["attempts"] = baseline.get("attempts", 0) + count
+
+    async def _flush_logged(self, db):
+        try:
+            await self.flush(db)
+        except Exception as e:
+            logger.error(f"Attempt buffer flush failed: {str(e)}")
+
+    async def _run(self, db):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self._flush_logged(db)
+
+    def start(self, db):
+        self._db = db
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._db is not None:
+            await self.flush(self._db)
+
+    def stats(self):
+        return {"pending_keys": self._keys, "baselines": len(self._baselines), **self._counters}
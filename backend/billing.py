@@ -0,0 +1,534 @@
+"""Subscription ledger and incrementally maintained revenue metrics.
+
+Billing changes are appended to the ledger and never rewritten:
+``subscription_events`` records plan changes (new, upgrade, downgrade,
+cancel) and plan creation; ``transactions`` records payments and refunds,
+a refund being a negative row that points at the payment it refunds.
+``subscriptions`` holds each user's current plan. ``refund_balances``
+holds, per refunded payment, the sum of its refund rows; refunds reserve
+their amount there first so concurrent refunds cannot exceed the payment,
+and release it again if the refund row cannot be written.
+
+With every ledger write the same amounts are ``$inc``remented into
+``revenue_metrics``: a ``current`` document (MRR, active subscribers and
+all-time revenue per plan) and one document per UTC day and per month (net
+revenue, MRR movement and subscription event counts). Money is kept in
+integer cents. Revenue screens read the current document plus at most 90
+daily and 12 monthly ones, whatever the size of the ledger. ``recompute``
+folds the whole ledger again to verify or repair the aggregates and the
+refund balances.
+"""
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+CURRENT_ID = "current"
+REVENUE_WINDOW_DAYS = 90
+TREND_MONTHS = 12
+DUPLICATE_KEY = 11000
+PLAN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+PERIOD_LENGTHS = {"monthly": timedelta(days=30), "yearly": timedelta(days=365)}
+EVENT_COUNTERS = {
+    "new": "new_subscriptions",
+    "cancel": "cancelled_subscriptions",
+    "upgrade": "upgraded_subscriptions",
+    "downgrade": "downgraded_subscriptions"
+}
+
+BUILTIN_PLANS: Dict[str, Dict[str, Any]] = {
+    "free": {
+        "_id": "free",
+        "name": "Free Plan",
+        "price": 0,
+        "currency": "USD",
+        "billing_period": "forever",
+        "features": ["Basic Challenges", "Community Access", "Progress Tracking"],
+        "is_active": True
+    },
+    "pro": {
+        "_id": "pro",
+        "name": "Pro Plan",
+        "price": 9.99,
+        "currency": "USD",
+        "billing_period": "monthly",
+        "features": ["All Challenges", "Priority Support", "Certificates", "Advanced Analytics", "Offline Access"],
+        "is_active": True
+    },
+    "enterprise": {
+        "_id": "enterprise",
+        "name": "Enterprise Plan",
+        "price": 49.99,
+        "currency": "USD",
+        "billing_period": "monthly",
+        "features": ["Custom Tracks", "Team Management", "API Access", "White Label", "Dedicated Support"],
+        "is_active": True
+    }
+}
+
+
+class PlanNotFound(Exception):
+    pass
+
+
+class TransactionNotFound(Exception):
+    pass
+
+
+class RefundRejected(ValueError):
+    pass
+
+
+class SubscriptionConflict(Exception):
+    pass
+
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def from_cents(cents: int) -> float:
+    return round(cents / 100, 2)
+
+
+def monthly_cents(plan: Dict[str, Any]) -> int:
+    """Normalized monthly price of a plan, the plan's contribution to MRR"""
+    price = to_cents(plan.get("price", 0))
+    if plan.get("billing_period") == "yearly":
+        return int(round(price / 12))
+    if plan.get("billing_period") == "monthly":
+        return price
+    return 0
+
+
+def day_id(moment: datetime) -> str:
+    return f"day:{moment:%Y-%m-%d}"
+
+
+def month_id(moment: datetime) -> str:
+    return f"month:{moment:%Y-%m}"
+
+
+async def get_plan(db, plan_id: str) -> Optional[Dict[str, Any]]:
+    return await db.subscription_plans.find_one({"_id": plan_id}) or BUILTIN_PLANS.get(plan_id)
+
+
+async def list_plans(db) -> List[Dict[str, Any]]:
+    plans = dict(BUILTIN_PLANS)
+    async for plan in db.subscription_plans.find({}):
+        plans[plan["_id"]] = plan
+    return list(plans.values())
+
+
+# Ledger entry -> aggregate increments. Shared by the live path and recompute.
+def event_effects(event: Dict[str, Any]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    if event["kind"] not in EVENT_COUNTERS:
+        return {}, {}
+    previous_plan, previous_mrr = event.get("previous_plan_id"), event.get("previous_mrr_cents", 0)
+    plan, mrr = event.get("plan_id"), event.get("mrr_cents", 0)
+    current: Dict[str, int] = defaultdict(int)
+    current["mrr_cents"] += mrr - previous_mrr
+    if previous_mrr:
+        current[f"active_by_plan.{previous_plan}"] -= 1
+        current[f"mrr_by_plan.{previous_plan}"] -= previous_mrr
+    if mrr:
+        current[f"active_by_plan.{plan}"] += 1
+        current[f"mrr_by_plan.{plan}"] += mrr
+    period = {EVENT_COUNTERS[event["kind"]]: 1, "mrr_delta_cents": mrr - previous_mrr}
+    if event["kind"] == "cancel":
+        period["churned_mrr_cents"] = previous_mrr
+    return dict(current), period
+
+
+def transaction_effects(transaction: Dict[str, Any]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    cents, plan = transaction["amount_cents"], transaction.get("plan_id") or "unknown"
+    current = {"revenue_cents": cents, f"revenue_by_plan.{plan}": cents}
+    period = {"revenue_cents": cents, f"revenue_by_plan.{plan}": cents}
+    if transaction["kind"] == "refund":
+        period.update({"refunds": 1, "refunded_cents": -cents})
+    else:
+        period["payments"] = 1
+    return current, period
+
+
+def _operations(at: datetime, current: Dict[str, int], period: Dict[str, int]) -> List[UpdateOne]:
+    operations = []
+    if current:
+        operations.append(UpdateOne({"_id": CURRENT_ID}, {"$inc": current}, upsert=True))
+    if period:
+        operations.extend(UpdateOne({"_id": bucket_id}, {"$inc": period}, upsert=True) for bucket_id in (day_id(at), month_id(at)))
+    return operations
+
+
+async def _apply(db, at: datetime, effects: Tuple[Dict[str, int], Dict[str, int]]):
+    operations = _operations(at, *effects)
+    if not operations:
+        return
+    try:
+        await db.revenue_metrics.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY for err in errors):
+            raise
+        # A concurrent upsert created the document first; it matches now
+        await db.revenue_metrics.bulk_write([operations[err["index"]] for err in errors], ordered=False)
+
+
+async def _append_event(db, event: Dict[str, Any]):
+    await db.subscription_events.insert_one(event)
+    await _apply(db, event["at"], event_effects(event))
+
+
+async def _append_transaction(db, transaction: Dict[str, Any]):
+    await db.transactions.insert_one(transaction)
+    await _apply(db, transaction["transaction_date"], transaction_effects(transaction))
+
+
+async def record_plan_created(db, plan: Dict[str, Any], admin_id: str):
+    await _append_event(db, {
+        "_id": str(uuid.uuid4()),
+        "kind": "plan_created",
+        "plan_id": plan["_id"],
+        "price": plan["price"],
+        "billing_period": plan["billing_period"],
+        "created_by": admin_id,
+        "at": plan["created_at"]
+    })
+
+
+def _change_kind(previous_mrr: int, mrr: int) -> str:
+    if not previous_mrr:
+        return "new"
+    if not mrr:
+        return "cancel"
+    return "upgrade" if mrr >= previous_mrr else "downgrade"
+
+
+async def _claim_subscription(db, user_id: str, plan: Dict[str, Any], payment_method: str, now: datetime):
+    """Move the user's subscription to ``plan``; returns (previous plan id, subscription) or None on a race"""
+    subscription = await db.subscriptions.find_one({"user_id": user_id})
+    previous_plan_id = subscription["plan_id"] if subscription and subscription["status"] == "active" else "free"
+    if previous_plan_id == plan["_id"]:
+        return previous_plan_id, subscription
+
+    paid = monthly_cents(plan) > 0
+    period_end = now + PERIOD_LENGTHS.get(plan.get("billing_period"), timedelta(days=30))
+    fields = {
+        "plan_id": plan["_id"] if paid else previous_plan_id,
+        "plan_name": plan["name"] if paid else (subscription or {}).get("plan_name"),
+        "status": "active" if paid else "cancelled",
+        "current_period_start": now if paid else (subscription or {}).get("current_period_start"),
+        "current_period_end": period_end if paid else now,
+        "next_billing_date": period_end if paid else None,
+        "payment_method": payment_method,
+        "updated_at": now
+    }
+    if paid and subscription and subscription["status"] != "active":
+        fields["cancelled_at"] = None
+    if not paid:
+        fields["cancelled_at"] = now
+
+    if subscription is None:
+        subscription = {"_id": str(uuid.uuid4()), "user_id": user_id, "created_at": now, "total_paid_cents": 0, **fields}
+        try:
+            await db.subscriptions.insert_one(subscription)
+        except DuplicateKeyError:
+            return None
+        return previous_plan_id, subscription
+
+    # Only applies if nobody changed the subscription since we read it
+    updated = await db.subscriptions.find_one_and_update(
+        {"_id": subscription["_id"], "plan_id": subscription["plan_id"], "status": subscription["status"]},
+        {"$set": fields},
+        return_document=ReturnDocument.AFTER
+    )
+    return (previous_plan_id, updated) if updated else None
+
+
+async def change_plan(db, user_id: str, plan_id: str, payment_method: str) -> Dict[str, Any]:
+    """Switch a user to ``plan_id``, charging the first period of a paid plan.
+
+    Returns the subscription, the ledger event and the payment (both None when
+    the user already was on the plan).
+    """
+    plan = await get_plan(db, plan_id)
+    if plan is None or not plan.get("is_active", True):
+        raise PlanNotFound(plan_id)
+    now = datetime.now(timezone.utc)
+
+    for _ in range(3):
+        claimed = await _claim_subscription(db, user_id, plan, payment_method, now)
+        if claimed is not None:
+            break
+    else:
+        raise SubscriptionConflict(user_id)
+    previous_plan_id, subscription = claimed
+    if previous_plan_id == plan_id:
+        return {"subscription": subscription, "event": None, "transaction": None}
+
+    previous_plan = await get_plan(db, previous_plan_id) or BUILTIN_PLANS["free"]
+    previous_mrr, mrr = monthly_cents(previous_plan), monthly_cents(plan)
+    event = {
+        "_id": str(uuid.uuid4()),
+        "kind": _change_kind(previous_mrr, mrr),
+        "user_id": user_id,
+        "subscription_id": subscription["_id"],
+        "plan_id": plan_id,
+        "previous_plan_id": previous_plan_id,
+        "mrr_cents": mrr,
+        "previous_mrr_cents": previous_mrr,
+        "at": now
+    }
+    await _append_event(db, event)
+
+    transaction = None
+    if to_cents(plan.get("price", 0)) > 0:
+        # Mock processor: the first period is charged in full, no proration
+        cents = to_cents(plan["price"])
+        transaction = {
+            "_id": str(uuid.uuid4()),
+            "kind": "payment",
+            "user_id": user_id,
+            "subscription_id": subscription["_id"],
+            "plan_id": plan_id,
+            "amount": from_cents(cents),
+            "amount_cents": cents,
+            "currency": plan.get("currency", "USD"),
+            "status": "completed",
+            "payment_method": payment_method,
+            "transaction_date": now,
+            "description": f"{plan['name']} - {str(plan.get('billing_period', 'monthly')).capitalize()} Subscription"
+        }
+        await _append_transaction(db, transaction)
+        await db.subscriptions.update_one({"_id": subscription["_id"]}, {"$inc": {"total_paid_cents": cents}})
+    return {"subscription": subscription, "event": event, "transaction": transaction}
+
+
+async def refund(db, transaction_id: str, amount: Optional[float], reason: Optional[str], admin_id: str) -> Dict[str, Any]:
+    """Refund all or part of a payment; returns the refund transaction"""
+    payment = await db.transactions.find_one({"_id": transaction_id, "kind": "payment"})
+    if payment is None:
+        raise TransactionNotFound(transaction_id)
+    balance = await db.refund_balances.find_one({"_id": transaction_id}) or {}
+    refunded = balance.get("refunded_cents", 0)
+    cents = to_cents(amount) if amount is not None else payment["amount_cents"] - refunded
+    if cents <= 0:
+        raise RefundRejected("Refund amount must be positive")
+    if cents > payment["amount_cents"]:
+        raise RefundRejected("Refund exceeds the refundable amount")
+
+    # Reserve the amount atomically so concurrent refunds cannot exceed the
+    # payment; a balance that has no room left fails the match and the upsert
+    # then collides with the existing document
+    try:
+        await db.refund_balances.update_one(
+            {"_id": transaction_id, "refunded_cents": {"$lte": payment["amount_cents"] - cents}},
+            {"$inc": {"refunded_cents": cents}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise RefundRejected("Refund exceeds the refundable amount")
+
+    refund_transaction = {
+        "_id": str(uuid.uuid4()),
+        "kind": "refund",
+        "user_id": payment["user_id"],
+        "subscription_id": payment.get("subscription_id"),
+        "plan_id": payment.get("plan_id"),
+        "refunded_transaction_id": transaction_id,
+        "amount": -from_cents(cents),
+        "amount_cents": -cents,
+        "currency": payment.get("currency", "USD"),
+        "status": "completed",
+        "payment_method": payment.get("payment_method"),
+        "transaction_date": datetime.now(timezone.utc),
+        "description": f"Refund: {reason}" if reason else "Refund",
+        "processed_by": admin_id
+    }
+    try:
+        await db.transactions.insert_one(refund_transaction)
+    except Exception:
+        # No refund row was written, so release the reservation
+        await db.refund_balances.update_one({"_id": transaction_id}, {"$inc": {"refunded_cents": -cents}})
+        raise
+    await _apply(db, refund_transaction["transaction_date"], transaction_effects(refund_transaction))
+    if payment.get("subscription_id"):
+        await db.subscriptions.update_one({"_id": payment["subscription_id"]}, {"$inc": {"total_paid_cents": -cents}})
+    return refund_transaction
+
+
+# Reads
+def _sum(docs: List[Dict[str, Any]], field: str) -> int:
+    return sum(doc.get(field, 0) for doc in docs)
+
+
+def _sum_nested(docs: List[Dict[str, Any]], field: str) -> Dict[str, int]:
+    total: Dict[str, int] = defaultdict(int)
+    for doc in docs:
+        for key, value in doc.get(field, {}).items():
+            total[key] += value
+    return dict(total)
+
+
+async def _metric_docs(db, now: datetime) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[datetime, Dict[str, Any]]]]:
+    days = [day_id(now - timedelta(days=offset)) for offset in range(REVENUE_WINDOW_DAYS)]
+    months, month_start = [], now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(TREND_MONTHS):
+        months.append(month_start)
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+    ids = [CURRENT_ID, *days, *(month_id(start) for start in months)]
+    docs = {doc["_id"]: doc async for doc in db.revenue_metrics.find({"_id": {"$in": ids}})}
+    return (
+        docs.get(CURRENT_ID, {}),
+        [docs.get(bucket_id, {}) for bucket_id in days],
+        [(start, docs.get(month_id(start), {})) for start in reversed(months)]
+    )
+
+
+async def plans_with_usage(db) -> List[Dict[str, Any]]:
+    current = await db.revenue_metrics.find_one({"_id": CURRENT_ID}) or {}
+    active, mrr, revenue = current.get("active_by_plan", {}), current.get("mrr_by_plan", {}), current.get("revenue_by_plan", {})
+    total_users = await db.users.estimated_document_count()
+    plans = []
+    for plan in await list_plans(db):
+        plan_id = plan["_id"]
+        plan = {"id": plan_id, **{k: v for k, v in plan.items() if k not in ("_id", "created_by")}}
+        # Everyone without an active paid subscription is on the free plan
+        plan["user_count"] = max(0, total_users - sum(active.values())) if plan_id == "free" else active.get(plan_id, 0)
+        plan["mrr"] = from_cents(mrr.get(plan_id, 0))
+        plan["revenue"] = from_cents(revenue.get(plan_id, 0))
+        plans.append(plan)
+    return plans
+
+
+async def revenue_summary(db) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    current, days, months = await _metric_docs(db, now)
+    last_30 = days[:30]
+    mrr = current.get("mrr_cents", 0)
+    subscribers = sum(current.get("active_by_plan", {}).values())
+
+    new_30, cancelled_30 = _sum(last_30, "new_subscriptions"), _sum(last_30, "cancelled_subscriptions")
+    # Paid subscribers 30 days ago, reconstructed from the movements since
+    subscribers_30d_ago = subscribers - new_30 + cancelled_30
+    churn_rate = round(100 * cancelled_30 / subscribers_30d_ago, 1) if subscribers_30d_ago else 0.0
+    mrr_30d_ago = mrr - _sum(last_30, "mrr_delta_cents")
+    arpu = mrr / subscribers if subscribers else 0
+    revenue_by_plan = _sum_nested(last_30, "revenue_by_plan")
+
+    return {
+        "mrr": from_cents(mrr),
+        "arr": from_cents(mrr * 12),
+        "total_revenue_30d": from_cents(_sum(last_30, "revenue_cents")),
+        "total_revenue_90d": from_cents(_sum(days, "revenue_cents")),
+        "refunds_30d": from_cents(_sum(last_30, "refunded_cents")),
+        "churn_rate": churn_rate,
+        # There is no trial flow yet, so there is nothing to convert
+        "trial_conversion_rate": None,
+        "paid_subscribers": subscribers,
+        "average_revenue_per_user": from_cents(arpu),
+        "ltv": from_cents(arpu / (churn_rate / 100)) if churn_rate else None,
+        "monthly_growth_rate": round(100 * (mrr - mrr_30d_ago) / mrr_30d_ago, 1) if mrr_30d_ago else None,
+
+        # Net revenue by plan over the last 30 days, and current MRR by plan
+        "revenue_by_plan": {plan: from_cents(cents) for plan, cents in revenue_by_plan.items()},
+        "mrr_by_plan": {plan: from_cents(cents) for plan, cents in current.get("mrr_by_plan", {}).items()},
+
+        # Monthly net revenue trend, oldest first
+        "monthly_revenue": [
+            {"month": f"{start:%b}", "year": start.year, "revenue": from_cents(doc.get("revenue_cents", 0))}
+            for start, doc in months
+        ],
+
+        "subscription_metrics": {
+            "new_subscriptions_30d": new_30,
+            "cancelled_subscriptions_30d": cancelled_30,
+            "upgraded_subscriptions_30d": _sum(last_30, "upgraded_subscriptions"),
+            "downgraded_subscriptions_30d": _sum(last_30, "downgraded_subscriptions")
+        }
+    }
+
+
+# Verification
+def _flatten(doc: Dict[str, Any], prefix: str = "") -> Dict[str, int]:
+    flat = {}
+    for key, value in doc.items():
+        if key == "_id":
+            continue
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif value:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _unflatten(flat: Dict[str, int]) -> Dict[str, Any]:
+    doc: Dict[str, Any] = {}
+    for path, value in flat.items():
+        *parents, leaf = path.split(".")
+        target = doc
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return doc
+
+
+async def recompute(db, repair: bool = True) -> List[Dict[str, Any]]:
+    """Fold the whole ledger into fresh aggregates and refund balances and compare them with the stored ones.
+
+    Returns the documents that differed; with ``repair`` they are replaced.
+    """
+    expected: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def fold(at: datetime, effects: Tuple[Dict[str, int], Dict[str, int]]):
+        current, period = effects
+        for key, value in current.items():
+            expected[CURRENT_ID][key] += value
+        for bucket_id in (day_id(at), month_id(at)) if period else ():
+            for key, value in period.items():
+                expected[bucket_id][key] += value
+
+    async for event in db.subscription_events.find({}):
+        fold(event["at"], event_effects(event))
+    refunded: Dict[str, int] = defaultdict(int)
+    async for transaction in db.transactions.find(
+        {}, {"kind": 1, "plan_id": 1, "amount_cents": 1, "transaction_date": 1, "refunded_transaction_id": 1}
+    ):
+        fold(transaction["transaction_date"], transaction_effects(transaction))
+        if transaction["kind"] == "refund":
+            refunded[transaction["refunded_transaction_id"]] -= transaction["amount_cents"]
+
+    expected_flat = {bucket_id: {k: v for k, v in counters.items() if v} for bucket_id, counters in expected.items()}
+    stored_flat = {doc["_id"]: _flatten(doc) async for doc in db.revenue_metrics.find({})}
+    differences = [
+        {"_id": bucket_id, "stored": stored_flat.get(bucket_id, {}), "expected": expected_flat.get(bucket_id, {})}
+        for bucket_id in sorted(set(expected_flat) | set(stored_flat))
+        if stored_flat.get(bucket_id, {}) != expected_flat.get(bucket_id, {})
+    ]
+    # A reservation whose refund row never landed shows up as a surplus here
+    stored_refunded = {doc["_id"]: doc.get("refunded_cents", 0) async for doc in db.refund_balances.find({})}
+    balance_differences = [
+        {"_id": payment_id, "stored": stored_refunded.get(payment_id, 0), "expected": refunded.get(payment_id, 0)}
+        for payment_id in sorted(set(refunded) | set(stored_refunded))
+        if stored_refunded.get(payment_id, 0) != refunded.get(payment_id, 0)
+    ]
+
+    if repair:
+        for difference in balance_differences:
+            await db.refund_balances.replace_one(
+                {"_id": difference["_id"]}, {"refunded_cents": difference["expected"]}, upsert=True
+            )
+        for difference in differences:
+            if difference["expected"]:
+                await db.revenue_metrics.replace_one(
+                    {"_id": difference["_id"]}, _unflatten(difference["expected"]), upsert=True
+                )
+            else:
+                await db.revenue_metrics.delete_one({"_id": difference["_id"]})
+    return differences + [
+        {**difference, "_id": f"refund_balance:{difference['_id']}"} for difference in balance_differences
+    ]
@@ -0,0 +1,47 @@
+"""Response compression that leaves streams and compressed bodies alone.
+
+Starlette's ``GZipMiddleware`` compresses every response of at least
+``minimum_size`` bytes. That buffers Server-Sent Events inside the gzip
+stream, and it compresses a ``.gz`` export a second time. ``CompressionMiddleware``
+decides per response instead: it reads the ``Content-Type`` of the response
+start message, passes event streams and already-compressed media types
+through unchanged, and hands everything else to Starlette's gzip responder.
+"""
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PASSTHROUGH_TYPES = frozenset({
+    "text/event-stream",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+})
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, compresslevel: int = 9):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("Accept-Encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        responder.send = send
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal passthrough
+            if message["type"] == "http.response.start":
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                passthrough = content_type.split(";")[0].strip().lower() in PASSTHROUGH_TYPES
+            if passthrough:
+                await send(message)
+            else:
+                await responder.send_with_gzip(message)
+
+        await self.app(scope, receive, send_compressed)
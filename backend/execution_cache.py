@@ -0,0 +1,79 @@
+"""Content-addressed cache for sandbox execution results.
+
+Learners re-run the same starter code over and over, so results are keyed on
+the level and a hash of the source's AST: whitespace, comments and formatting
+changes map to the same entry. Failed runs are keyed on the exact source
+instead, so the line numbers in a cached traceback always match the code the
+learner submitted.
+
+Keys also carry the level catalog version. Editing a level bumps it on
+every worker, so results cached for the old content are never served
+again and simply age out.
+"""
+import ast
+import hashlib
+import os
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+EXECUTION_CACHE_SIZE = int(os.environ.get("EXECUTION_CACHE_SIZE", "10000"))
+EXECUTION_CACHE_TTL_SECONDS = int(os.environ.get("EXECUTION_CACHE_TTL_SECONDS", "3600"))
+
+
+def normalize_source(code: str) -> str:
+    try:
+        return ast.dump(ast.parse(code))
+    except (SyntaxError, ValueError):
+        # Unparseable code still benefits from ignoring trailing whitespace
+        return "\n".join(line.rstrip() for line in code.strip().splitlines())
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class ExecutionCache:
+    def __init__(self, maxsize: int = EXECUTION_CACHE_SIZE, ttl: int = EXECUTION_CACHE_TTL_SECONDS):
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._hits: Dict[int, int] = defaultdict(int)
+        self._misses: Dict[int, int] = defaultdict(int)
+
+    def _keys(self, level_id: int, version: int, code: str) -> Tuple[tuple, tuple]:
+        return (
+            (level_id, version, "ast", _digest(normalize_source(code))),
+            (level_id, version, "src", _digest(code))
+        )
+
+    def get(self, level_id: int, version: int, code: str) -> Optional[Dict[str, Any]]:
+        normalized_key, exact_key = self._keys(level_id, version, code)
+        result = self._entries.get(normalized_key) or self._entries.get(exact_key)
+        if result is None:
+            self._misses[level_id] += 1
+            return None
+        self._hits[level_id] += 1
+        return dict(result)
+
+    def put(self, level_id: int, version: int, code: str, result: Dict[str, Any]):
+        # Timeouts and sandbox failures depend on load, not on the code
+        if result.get("timed_out") or result.get("exit_code") is None:
+            return
+        normalized_key, exact_key = self._keys(level_id, version, code)
+        self._entries[normalized_key if result["exit_code"] == 0 else exact_key] = dict(result)
+
+    def stats(self) -> Dict[str, Any]:
+        levels = {}
+        for level_id in sorted(set(self._hits) | set(self._misses)):
+            hits, misses = self._hits[level_id], self._misses[level_id]
+            levels[level_id] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0
+            }
+        return {
+            "entries": len(self._entries),
+            "maxsize": int(self._entries.maxsize),
+            "ttl_seconds": self._entries.ttl,
+            "levels": levels
+        }
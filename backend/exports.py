@@ -0,0 +1,118 @@
+"""Streaming NDJSON/CSV exports.
+
+Export endpoints walk a Motor cursor batch by batch and stream the rows
+through a ``StreamingResponse``. Memory stays bounded by one cursor batch
+plus one output chunk, however many rows are exported. Output can
+optionally be gzipped on the fly.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Sequence
+
+from fastapi.responses import StreamingResponse
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Rows are written out in chunks of roughly this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ";".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=_json_default)
+    return value
+
+
+async def _ndjson_chunks(cursor, fields: Sequence[str]) -> AsyncIterator[bytes]:
+    buffer: List[str] = []
+    size = 0
+    async for doc in cursor:
+        line = json.dumps({field: doc.get(field) for field in fields}, default=_json_default) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+async def _csv_chunks(cursor, fields: Sequence[str]) -> AsyncIterator[bytes]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(fields)
+    async for doc in cursor:
+        writer.writerow([_csv_value(doc.get(field)) for field in fields])
+        if output.tell() >= EXPORT_CHUNK_BYTES:
+            yield output.getvalue().encode("utf-8")
+            output.seek(0)
+            output.truncate()
+    if output.tell():
+        yield output.getvalue().encode("utf-8")
+
+
+async def _gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def _closing(cursor, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Release the server-side cursor when the client disconnects mid-export
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await cursor.close()
+
+
+def export_response(
+    collection,
+    filter_query: Dict[str, Any],
+    fields: Sequence[str],
+    name: str,
+    export_format: str = "ndjson",
+    gzip: bool = False,
+    sort=None
+) -> StreamingResponse:
+    projection = {field: 1 for field in fields}
+    cursor = collection.find(filter_query, projection, batch_size=EXPORT_BATCH_SIZE)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    chunks = _csv_chunks(cursor, fields) if export_format == "csv" else _ndjson_chunks(cursor, fields)
+    filename = f"{name}.{export_format}"
+    media_type = FORMATS[export_format]
+    if gzip:
+        chunks = _gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        _closing(cursor, chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,192 @@
+"""Feedback listing and statistics in a single round trip.
+
+The admin feedback screen used to run the page query plus a separate count
+or aggregation per breakdown, each scanning the whole collection. A filtered
+page and its total now come from one ``$facet`` aggregation behind an indexed
+``$match``. The collection-wide breakdowns (status, category, rating) are
+kept incrementally in a single ``feedback_counters`` document, updated by
+``record_submitted`` and ``record_status_change``; the statistics endpoint
+reads it together with the 7-day window in one aggregation. With counters
+disabled, one ``$facet`` pass computes everything instead.
+
+``rebuild_counters`` (``manage.py rebuild-feedback-counters``) corrects the
+document without stopping live updates: it stamps a cutoff, scans feedback
+submitted before it, and ``$inc``s the difference between the scan and the
+counters as they stood at the cutoff, so feedback arriving meanwhile is
+counted once. A status change that lands during the scan can be seen by
+both sides, so run it while triage is quiet. Reads never rebuild.
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_ID = "all"
+FEEDBACK_COUNTERS_ENABLED = os.environ.get("FEEDBACK_COUNTERS", "true").lower() == "true"
+RECENT_WINDOW = timedelta(days=7)
+
+BREAKDOWNS = {
+    "status": "$status",
+    "category": "$category",
+    "rating": "$rating",
+}
+
+
+def _key(value: Any) -> str:
+    # Breakdown values become field names in the counters document
+    return str(value).replace(".", "_").replace("$", "_")
+
+
+def _counts(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    return {_key(row["_id"]): row["count"] for row in rows if row["count"]}
+
+
+def _recent_since() -> datetime:
+    return datetime.now(timezone.utc) - RECENT_WINDOW
+
+
+def _breakdown_facets() -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        name: [{"$group": {"_id": field, "count": {"$sum": 1}}}, {"$sort": {"_id": 1}}]
+        for name, field in BREAKDOWNS.items()
+    }
+
+
+async def page(db, filter_query: Dict[str, Any], skip: int, limit: int) -> Dict[str, Any]:
+    """One page of feedback, newest first, with the filtered total"""
+    result = await db.feedback.aggregate([
+        {"$match": filter_query},
+        {"$facet": {
+            "items": [{"$sort": {"submitted_at": -1}}, {"$skip": max(skip, 0)}, {"$limit": max(limit, 1)}],
+            "total": [{"$count": "count"}]
+        }}
+    ]).to_list(length=1)
+    facets = result[0] if result else {"items": [], "total": []}
+    return {
+        "items": facets["items"],
+        "total": facets["total"][0]["count"] if facets["total"] else 0
+    }
+
+
+def _scan_facets() -> Dict[str, List[Dict[str, Any]]]:
+    return {**_breakdown_facets(), "total": [{"$count": "count"}]}
+
+
+def _from_facets(facets: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "total": facets["total"][0]["count"] if facets.get("total") else 0,
+        **{name: _counts(facets.get(name, [])) for name in BREAKDOWNS}
+    }
+
+
+async def _scan_counters(db, match: Dict[str, Any]) -> Dict[str, Any]:
+    result = await db.feedback.aggregate([
+        {"$match": match}, {"$facet": _scan_facets()}
+    ], allowDiskUse=True).to_list(length=1)
+    return _from_facets(result[0] if result else {})
+
+
+def _flatten(counters: Dict[str, Any]) -> Dict[str, int]:
+    flat = {"total": counters.get("total", 0)}
+    for name in BREAKDOWNS:
+        flat.update({f"{name}.{key}": count for key, count in counters.get(name, {}).items()})
+    return flat
+
+
+def _visible(counters: Dict[str, Any]) -> Dict[str, Any]:
+    # Decremented buckets stay behind at zero
+    return {
+        "total": counters.get("total", 0),
+        **{name: {key: count for key, count in counters.get(name, {}).items() if count} for name in BREAKDOWNS}
+    }
+
+
+_warned = False
+
+
+def _warn_if_never_rebuilt(counters: Dict[str, Any]):
+    global _warned
+    if "rebuilt_at" not in counters and not _warned:
+        _warned = True
+        logger.warning("Feedback counters were never rebuilt; run 'python manage.py rebuild-feedback-counters'")
+
+
+async def rebuild_counters(db) -> Dict[str, Any]:
+    """Correct the counters document from one pass over the feedback submitted before a cutoff"""
+    cutoff = datetime.now(timezone.utc)
+    at_cutoff = await db.feedback_counters.find_one_and_update(
+        {"_id": COUNTERS_ID},
+        {"$set": {"rebuild_cutoff": cutoff}},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    ) or {}
+    scanned, stored = _flatten(await _scan_counters(db, {"submitted_at": {"$lt": cutoff}})), _flatten(at_cutoff)
+    correction = {
+        path: scanned.get(path, 0) - stored.get(path, 0)
+        for path in set(scanned) | set(stored)
+        if scanned.get(path, 0) != stored.get(path, 0)
+    }
+    # $inc rather than replace: increments that landed after the cutoff stay
+    update = {"$set": {"rebuilt_at": datetime.now(timezone.utc)}, "$unset": {"rebuild_cutoff": ""}}
+    if correction:
+        update["$inc"] = correction
+    counters = await db.feedback_counters.find_one_and_update(
+        {"_id": COUNTERS_ID}, update, return_document=ReturnDocument.AFTER
+    )
+    return _visible(counters)
+
+
+async def get_counters(db) -> Dict[str, Any]:
+    """Collection-wide total and per-status/category/rating counts"""
+    if not FEEDBACK_COUNTERS_ENABLED:
+        return await _scan_counters(db, {})
+    counters = await db.feedback_counters.find_one({"_id": COUNTERS_ID}) or {}
+    _warn_if_never_rebuilt(counters)
+    return _visible(counters)
+
+
+async def statistics(db) -> Dict[str, Any]:
+    """Collection-wide counters plus the number of feedback entries from the last 7 days"""
+    recent = [{"$match": {"submitted_at": {"$gte": _recent_since()}}}, {"$count": "count"}]
+    if not FEEDBACK_COUNTERS_ENABLED:
+        result = await db.feedback.aggregate([
+            {"$facet": {**_scan_facets(), "recent": recent}}
+        ], allowDiskUse=True).to_list(length=1)
+        facets = result[0] if result else {}
+        return {**_from_facets(facets), "recent": facets["recent"][0]["count"] if facets.get("recent") else 0}
+    # The counters document and the indexed 7-day count in one round trip
+    result = await db.feedback_counters.aggregate([
+        {"$match": {"_id": COUNTERS_ID}},
+        {"$lookup": {"from": "feedback", "pipeline": recent, "as": "recent"}}
+    ]).to_list(length=1)
+    counters = result[0] if result else {}
+    _warn_if_never_rebuilt(counters)
+    return {**_visible(counters), "recent": counters["recent"][0]["count"] if counters.get("recent") else 0}
+
+
+async def record_submitted(db, feedback: Dict[str, Any]):
+    if not FEEDBACK_COUNTERS_ENABLED:
+        return
+    # Upsert: increments landing before the first rebuild are kept, the rebuild corrects around them
+    await db.feedback_counters.update_one(
+        {"_id": COUNTERS_ID},
+        {"$inc": {
+            "total": 1,
+            **{f"{name}.{_key(feedback.get(name))}": 1 for name in BREAKDOWNS}
+        }},
+        upsert=True
+    )
+
+
+async def record_status_change(db, old_status: Optional[str], new_status: str):
+    if not FEEDBACK_COUNTERS_ENABLED or old_status == new_status:
+        return
+    await db.feedback_counters.update_one(
+        {"_id": COUNTERS_ID},
+        {"$inc": {f"status.{_key(old_status)}": -1, f"status.{_key(new_status)}": 1}},
+        upsert=True
+    )
@@ -0,0 +1,232 @@
+"""Index declarations and query-plan verification.
+
+``INDEXES`` declares every index the endpoints rely on, per collection, and
+``ensure_indexes`` creates them idempotently at startup. Indexes listed in
+``REQUIRED_INDEXES`` enforce correctness rather than speed (a unique index that
+makes an upsert award XP only once), so startup refuses to serve without
+them; ``missing_required_indexes`` reports which are absent. ``QUERY_SHAPES`` lists
+the filters/sorts the endpoints actually issue; ``check_query_plans`` runs
+``explain`` on each of them and reports any shape whose winning plan still
+contains a collection scan.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from ai_tutor import AI_TUTOR_CACHE_TTL_SECONDS
+from principal_cache import PRINCIPAL_INVALIDATION_TTL_SECONDS
+from submission_receipts import SUBMISSION_DEDUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+    ],
+    "user_progress": [
+        IndexModel([("user_id", ASCENDING), ("level_id", ASCENDING)], unique=True, name="user_level_unique"),
+        IndexModel([("is_completed", ASCENDING), ("user_id", ASCENDING)], name="completed_user"),
+        IndexModel([("completed_at", ASCENDING)], name="completed_at"),
+    ],
+    "levels": [
+        IndexModel([("level_id", ASCENDING)], unique=True, name="level_id_unique"),
+        IndexModel([("is_active", ASCENDING), ("level_id", ASCENDING)], name="active_level"),
+    ],
+    "feedback": [
+        IndexModel([("submitted_at", DESCENDING)], name="submitted_at"),
+        IndexModel([("status", ASCENDING), ("submitted_at", DESCENDING)], name="status_submitted_at"),
+        IndexModel([("category", ASCENDING), ("submitted_at", DESCENDING)], name="category_submitted_at"),
+        IndexModel([("level_id", ASCENDING), ("submitted_at", DESCENDING)], name="level_submitted_at"),
+        IndexModel([("user_id", ASCENDING), ("submitted_at", DESCENDING)], name="user_submitted_at"),
+    ],
+    "subscriptions": [
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_unique"),
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="updated_at_id"),
+        IndexModel([("status", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="status_updated_at_id"),
+        IndexModel([("plan_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="plan_updated_at_id"),
+        IndexModel(
+            [("status", ASCENDING), ("plan_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+            name="status_plan_updated_at_id"
+        ),
+    ],
+    "subscription_events": [
+        IndexModel([("at", ASCENDING)], name="at"),
+    ],
+    "transactions": [
+        IndexModel([("user_id", ASCENDING), ("transaction_date", DESCENDING)], name="user_transaction_date"),
+        IndexModel([("transaction_date", DESCENDING), ("_id", DESCENDING)], name="transaction_date_id"),
+        IndexModel([("status", ASCENDING), ("transaction_date", DESCENDING), ("_id", DESCENDING)], name="status_transaction_date_id"),
+        IndexModel([("plan_id", ASCENDING), ("transaction_date", DESCENDING), ("_id", DESCENDING)], name="plan_transaction_date_id"),
+    ],
+    "submission_receipts": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=SUBMISSION_DEDUP_SECONDS, name="created_at_ttl"),
+    ],
+    "analytics_rollups": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "principal_invalidations": [
+        IndexModel([("at", ASCENDING)], expireAfterSeconds=PRINCIPAL_INVALIDATION_TTL_SECONDS, name="at_ttl"),
+    ],
+    "quota_usage": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "tutor_cache": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=AI_TUTOR_CACHE_TTL_SECONDS, name="created_at_ttl"),
+        IndexModel([("level_id", ASCENDING)], name="level_id"),
+    ],
+    "user_stats": [
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+        IndexModel([("completed_levels", ASCENDING)], name="completed_levels"),
+    ],
+}
+
+# Unique indexes the write paths depend on for correctness, not just speed
+REQUIRED_INDEXES: Dict[str, List[str]] = {
+    "user_progress": ["user_level_unique"],
+}
+
+
+def _recent() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=7)
+
+
+# (collection, description, kind, spec). ``kind`` is "find", "count" or
+# "aggregate"; values are representative samples, only the shape matters.
+QUERY_SHAPES = [
+    ("users", "login by email", "find", {"filter": {"email": "probe@example.com"}}),
+    ("users", "signup duplicate check", "find", {"filter": {"$or": [{"email": "probe@example.com"}, {"username": "probe"}]}}),
+    ("users", "admin user list", "find", {"filter": {}, "sort": [("created_at", DESCENDING), ("_id", DESCENDING)], "limit": 51}),
+    ("users", "admin user list after cursor", "find", {
+        "filter": {"$or": [{"created_at": {"$lt": _recent}}, {"created_at": _recent, "_id": {"$lt": "probe"}}]},
+        "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 51
+    }),
+    ("user_progress", "progress for user and level", "find", {"filter": {"user_id": "probe", "level_id": 100}}),
+    ("user_progress", "progress for user", "find", {"filter": {"user_id": "probe"}}),
+    ("user_progress", "stats rebuild for user", "aggregate", {"pipeline": [{"$match": {"is_completed": True, "user_id": "probe"}}]}),
+    ("user_progress", "incremental progress export", "find", {"filter": {"completed_at": {"$gte": _recent}}}),
+    ("levels", "level by id", "find", {"filter": {"level_id": 100}}),
+    ("levels", "active levels", "find", {"filter": {"is_active": True}, "sort": [("level_id", ASCENDING)]}),
+    ("feedback", "feedback page", "find", {"filter": {}, "sort": [("submitted_at", DESCENDING)], "limit": 50}),
+    ("feedback", "feedback by status", "find", {"filter": {"status": "pending"}, "sort": [("submitted_at", DESCENDING)], "limit": 50}),
+    ("feedback", "feedback by category", "find", {"filter": {"category": "bug"}, "sort": [("submitted_at", DESCENDING)], "limit": 50}),
+    ("feedback", "feedback by level", "find", {"filter": {"level_id": 100}, "sort": [("submitted_at", DESCENDING)], "limit": 50}),
+    ("feedback", "feedback by user", "find", {"filter": {"user_id": "probe"}, "sort": [("submitted_at", DESCENDING)], "limit": 50}),
+    ("feedback", "feedback page facet", "aggregate", {"pipeline": [
+        {"$match": {"status": "pending", "category": "bug"}},
+        {"$facet": {"items": [{"$sort": {"submitted_at": -1}}, {"$limit": 50}], "total": [{"$count": "count"}]}}
+    ]}),
+    ("feedback", "recent feedback window", "aggregate", {"pipeline": [
+        {"$match": {"submitted_at": {"$gte": _recent}}}, {"$count": "count"}
+    ]}),
+    ("feedback", "feedback counters rebuild", "aggregate", {"pipeline": [{"$match": {"submitted_at": {"$lt": _recent}}}]}),
+    ("subscriptions", "subscription page", "find", {
+        "filter": {}, "sort": [("updated_at", DESCENDING), ("_id", DESCENDING)], "limit": 51
+    }),
+    ("subscriptions", "subscriptions by status and plan after cursor", "find", {
+        "filter": {
+            "status": "active",
+            "plan_id": "pro",
+            "$or": [{"updated_at": {"$lt": _recent}}, {"updated_at": _recent, "_id": {"$lt": "probe"}}]
+        },
+        "sort": [("updated_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 51
+    }),
+    ("transactions", "transaction page", "find", {
+        "filter": {}, "sort": [("transaction_date", DESCENDING), ("_id", DESCENDING)], "limit": 51
+    }),
+    ("transactions", "transactions by status and date range after cursor", "find", {
+        "filter": {
+            "status": "completed",
+            "transaction_date": {"$gte": _recent},
+            "$or": [{"transaction_date": {"$lt": _recent}}, {"transaction_date": _recent, "_id": {"$lt": "probe"}}]
+        },
+        "sort": [("transaction_date", DESCENDING), ("_id", DESCENDING)],
+        "limit": 51
+    }),
+    ("transactions", "transactions by plan", "find", {
+        "filter": {"plan_id": "pro"}, "sort": [("transaction_date", DESCENDING), ("_id", DESCENDING)], "limit": 51
+    }),
+    ("principal_invalidations", "principal invalidation poll", "find", {"filter": {"at": {"$gte": _recent}}}),
+    ("user_stats", "leaderboard load", "find", {"filter": {"completed_levels": {"$gt": 0}}}),
+    ("user_stats", "leaderboard refresh", "find", {"filter": {"updated_at": {"$gt": _recent}}}),
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create all declared indexes; existing identical indexes are left untouched"""
+    created = {}
+    for collection, models in INDEXES.items():
+        try:
+            created[collection] = await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # Typically duplicate values blocking a unique index, or an index
+            # of the same name with different options. Keep serving, loudly.
+            logger.error(f"Could not create indexes on {collection}: {e.details.get('errmsg', str(e)) if e.details else str(e)}")
+    return created
+
+
+async def missing_required_indexes(db) -> List[str]:
+    """Return "collection.index" for every required index that does not exist"""
+    missing = []
+    for collection, names in REQUIRED_INDEXES.items():
+        existing = await db[collection].index_information()
+        missing.extend(f"{collection}.{name}" for name in names if name not in existing)
+    return missing
+
+
+def _resolve(value: Any) -> Any:
+    if callable(value):
+        return value()
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v) for v in value]
+    return value
+
+
+def _stages(plan: Any):
+    """Yield every stage name in an explain document, skipping rejected plans"""
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == "rejectedPlans":
+                continue
+            if key == "stage" and isinstance(value, str):
+                yield value
+            else:
+                yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+async def _explain(db, collection: str, kind: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    if kind == "find":
+        cursor = db[collection].find(spec["filter"])
+        if spec.get("sort"):
+            cursor = cursor.sort(spec["sort"])
+        if spec.get("limit"):
+            cursor = cursor.limit(spec["limit"])
+        return await cursor.explain()
+    if kind == "count":
+        command = {"count": collection, "query": spec["filter"]}
+    else:
+        command = {"aggregate": collection, "pipeline": spec["pipeline"], "cursor": {}}
+    return await db.command({"explain": command, "verbosity": "queryPlanner"})
+
+
+async def check_query_plans(db) -> List[Dict[str, Any]]:
+    """Explain every known query shape; returns the shapes that fall back to COLLSCAN"""
+    failures = []
+    for collection, description, kind, spec in QUERY_SHAPES:
+        explain = await _explain(db, collection, kind, _resolve(spec))
+        stages = list(_stages(explain))
+        if "COLLSCAN" in stages:
+            failures.append({"collection": collection, "query": description, "stages": stages})
+            logger.error(f"COLLSCAN on {collection} for '{description}': {' -> '.join(stages)}")
+    return failures
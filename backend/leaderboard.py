@@ -0,0 +1,124 @@
+"""In-memory ranked leaderboard backed by the materialized ``user_stats`` documents.
+
+Entries are kept in a ``SortedList`` ordered by ``(-total_xp, user_id)``, so
+an update is O(log n), pages are index slices and a user's rank is a binary
+search. The board is loaded from ``user_stats`` at startup, updated in place
+when a level is completed, and periodically catches up with other workers by
+reading only the stats documents changed since the last refresh. Renames
+touch the stats document too, so they travel the same way.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sortedcontainers import SortedList
+
+from user_stats import derive_stats
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get("LEADERBOARD_REFRESH_SECONDS", "15"))
+# Re-read a little before the last sync point to tolerate clock skew between workers
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class Leaderboard:
+    def __init__(self, refresh_seconds: float = LEADERBOARD_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._order: SortedList = SortedList()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._usernames: Dict[str, str] = {}
+        self._synced_until: Optional[datetime] = None
+        self._last_refresh = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    @staticmethod
+    def _key(user_id: str, total_xp: int) -> tuple:
+        return (-total_xp, user_id)
+
+    def update(self, user_id: str, stats: Dict[str, Any], username: Optional[str] = None):
+        """Set a user's standing from their current stats payload"""
+        if username:
+            self._usernames[user_id] = username
+        previous = self._entries.pop(user_id, None)
+        if previous is not None:
+            self._order.remove(self._key(user_id, previous["total_xp"]))
+        # Only users with at least one completed level are ranked
+        if stats.get("completed_levels", 0) > 0:
+            self._entries[user_id] = {
+                "total_xp": stats["total_xp"],
+                "completed_levels": stats["completed_levels"],
+                "current_level": stats["current_level"]
+            }
+            self._order.add(self._key(user_id, stats["total_xp"]))
+
+    async def rename(self, db, user_id: str, username: str):
+        """Show the new username here at once and on other workers at their next refresh"""
+        if user_id in self._usernames:
+            self._usernames[user_id] = username
+        await db.user_stats.update_one({"_id": user_id}, {"$set": {"updated_at": datetime.now(timezone.utc)}})
+
+    def _row(self, rank: int, user_id: str) -> Dict[str, Any]:
+        return {
+            "rank": rank,
+            "username": self._usernames.get(user_id, "unknown"),
+            **self._entries[user_id]
+        }
+
+    def page(self, offset: int = 0, limit: int = 10) -> List[Dict[str, Any]]:
+        offset = max(offset, 0)
+        return [
+            self._row(offset + i + 1, user_id)
+            for i, (_, user_id) in enumerate(self._order.islice(offset, offset + max(limit, 0)))
+        ]
+
+    def rank_of(self, user_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return self._row(self._order.index(self._key(user_id, entry["total_xp"])) + 1, user_id)
+
+    async def _apply_stats_since(self, db, since: Optional[datetime]):
+        query = {"updated_at": {"$gt": since - REFRESH_OVERLAP}} if since else {"completed_levels": {"$gt": 0}}
+        started_at = datetime.now(timezone.utc)
+        changed = await db.user_stats.find(query).to_list(length=None)
+
+        # Usernames are re-read for every changed row: a rename only shows up as a touched stats document
+        if changed:
+            users = db.users.find({"_id": {"$in": [doc["_id"] for doc in changed]}}, {"username": 1})
+            async for user in users:
+                self._usernames[user["_id"]] = user["username"]
+
+        for doc in changed:
+            self.update(doc["_id"], derive_stats(doc))
+        self._synced_until = started_at
+        self._last_refresh = asyncio.get_running_loop().time()
+        return len(changed)
+
+    async def load(self, db):
+        """Rehydrate the whole board from user_stats"""
+        self._order, self._entries = SortedList(), {}
+        loaded = await self._apply_stats_since(db, None)
+        logger.info(f"Leaderboard loaded with {loaded} ranked users")
+
+    def refresh_if_stale(self, db):
+        """Catch up with other workers' updates in the background when the board is stale"""
+        if self._synced_until is None:
+            return
+        now = asyncio.get_running_loop().time()
+        if now - self._last_refresh < self.refresh_seconds:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._last_refresh = now
+            self._refresh_task = asyncio.create_task(self._refresh(db))
+
+    async def _refresh(self, db):
+        try:
+            await self._apply_stats_since(db, self._synced_until)
+        except Exception as e:
+            logger.error(f"Leaderboard refresh failed: {str(e)}")
@@ -0,0 +1,124 @@
+"""In-process, immutable snapshot of the level catalog.
+
+The catalog is small and read on almost every request, so each worker keeps
+the slim part of every level in memory (heavy fields are served by
+``level_content``), indexed by ``level_id`` and by category. Writers bump a
+version counter in ``catalog_meta``; every worker watches that document
+(change stream when the deployment supports it, polling otherwise) and swaps
+in a freshly loaded snapshot when the version moves.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from level_content import SLIM_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+CATALOG_POLL_SECONDS = float(os.environ.get("CATALOG_POLL_SECONDS", "2"))
+CATALOG_META_ID = "levels"
+
+
+class CatalogSnapshot:
+    def __init__(self, levels, version: int):
+        ordered = sorted(levels, key=lambda level: level["level_id"])
+        frozen = tuple(MappingProxyType(dict(level)) for level in ordered)
+        by_category = defaultdict(list)
+        for level in frozen:
+            by_category[level["category"]].append(level)
+
+        self.version = version
+        self.levels: Tuple[Mapping[str, Any], ...] = frozen
+        self.active: Tuple[Mapping[str, Any], ...] = tuple(level for level in frozen if level.get("is_active", True))
+        self.by_id: Mapping[int, Mapping[str, Any]] = MappingProxyType({level["level_id"]: level for level in frozen})
+        self.by_category: Mapping[str, Tuple[Mapping[str, Any], ...]] = MappingProxyType(
+            {category: tuple(levels) for category, levels in by_category.items()}
+        )
+
+
+class LevelCatalog:
+    def __init__(self, poll_seconds: float = CATALOG_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._snapshot = CatalogSnapshot([], 0)
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def get(self, level_id: int) -> Optional[Mapping[str, Any]]:
+        return self._snapshot.by_id.get(level_id)
+
+    def active_levels(self) -> Tuple[Mapping[str, Any], ...]:
+        return self._snapshot.active
+
+    def levels_in_category(self, category: str) -> Tuple[Mapping[str, Any], ...]:
+        return self._snapshot.by_category.get(category, ())
+
+    async def _stored_version(self, db) -> int:
+        meta = await db.catalog_meta.find_one({"_id": CATALOG_META_ID})
+        return meta["version"] if meta else 0
+
+    async def load(self, db):
+        # Read the version first: a concurrent bump then only causes one extra reload
+        version = await self._stored_version(db)
+        levels = await db.levels.find({}, SLIM_PROJECTION).to_list(length=None)
+        self._snapshot = CatalogSnapshot(levels, version)
+        logger.info(f"Level catalog v{version} loaded with {len(levels)} levels")
+
+    async def bump(self, db):
+        """Record a catalog change for every worker and reload this one immediately"""
+        await db.catalog_meta.find_one_and_update(
+            {"_id": CATALOG_META_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await self.load(db)
+
+    async def _reload_if_changed(self, db):
+        if await self._stored_version(db) != self._snapshot.version:
+            await self.load(db)
+
+    async def _watch(self, db):
+        try:
+            pipeline = [{"$match": {"documentKey._id": CATALOG_META_ID}}]
+            async with db.catalog_meta.watch(pipeline) as stream:
+                logger.info("Level catalog following catalog_meta change stream")
+                async for _ in stream:
+                    await self._reload_if_changed(db)
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError:
+            # Standalone servers have no change streams; fall back to polling
+            logger.info(f"Level catalog polling catalog_meta every {self.poll_seconds}s")
+
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self._reload_if_changed(db)
+            except PyMongoError as e:
+                logger.error(f"Level catalog refresh failed: {str(e)}")
+
+    def start_watching(self, db):
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch(db))
+
+    async def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
@@ -0,0 +1,134 @@
+"""Verification and benchmarking of level content against the real sandbox.
+
+``check_levels`` executes every level's ``starter_code`` on a dedicated
+``SandboxPool`` (same resource limits and preloaded libraries as grading,
+but its own workers so a run never competes with learners) and compares the
+output with ``expected_output`` using the grader's own comparison. Levels run
+concurrently, one per worker; with ``repeat`` each level is run several times
+in a row and the median wall/CPU time is reported, so the report doubles as
+a benchmark of which levels are expensive to grade.
+"""
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sandbox import SandboxPool
+
+LEVEL_CHECK_WORKERS = int(os.environ.get("LEVEL_CHECK_WORKERS", "4"))
+LEVEL_CHECK_MAX_WORKERS = int(os.environ.get("LEVEL_CHECK_MAX_WORKERS", "16"))
+LEVEL_CHECK_MAX_TIMEOUT = float(os.environ.get("LEVEL_CHECK_MAX_TIMEOUT", "30"))
+MAX_REPEAT = 10
+
+# Content modules, selected by level id range or category
+MODULES: Dict[str, Dict[str, Any]] = {
+    "python-basics": {"name": "Python Basics", "level_ids": (100, 199)},
+    "control-flow": {"name": "Control Flow", "categories": ("Control Flow",)},
+    "data-analysis": {"name": "Data Analysis", "level_ids": (200, 299)},
+    "projects": {"name": "Projects", "categories": ("Comprehensive Project",)},
+    "all": {"name": "All Levels"},
+}
+
+
+def in_module(module_id: str, level: Dict[str, Any]) -> bool:
+    module = MODULES[module_id]
+    if "level_ids" in module:
+        low, high = module["level_ids"]
+        return low <= level["level_id"] <= high
+    if "categories" in module:
+        return level["category"] in module["categories"]
+    return True
+
+
+def _first_difference(expected: str, actual: str) -> Optional[Dict[str, Any]]:
+    expected_lines, actual_lines = expected.strip().splitlines(), actual.strip().splitlines()
+    for line_number, (want, got) in enumerate(zip(expected_lines, actual_lines), start=1):
+        if want != got:
+            return {"line": line_number, "expected": want[:200], "actual": got[:200]}
+    if len(expected_lines) != len(actual_lines):
+        line_number = min(len(expected_lines), len(actual_lines)) + 1
+        return {
+            "line": line_number,
+            "expected": expected_lines[line_number - 1][:200] if line_number <= len(expected_lines) else None,
+            "actual": actual_lines[line_number - 1][:200] if line_number <= len(actual_lines) else None
+        }
+    return None
+
+
+async def _check_level(pool: SandboxPool, level: Dict[str, Any], repeat: int, matches: Callable[[str, str], bool]) -> Dict[str, Any]:
+    runs = []
+    # Runs of one level are sequential so they measure the level, not contention with itself
+    for _ in range(repeat):
+        runs.append(await pool.run(level.get("starter_code") or ""))
+    failures = [
+        run for run in runs
+        if run["exit_code"] != 0 or run["timed_out"] or not matches(run["stdout"], level["expected_output"])
+    ]
+    report = {
+        "level_id": level["level_id"],
+        "title": level.get("title"),
+        "category": level.get("category"),
+        "passed": not failures,
+        "runs": repeat,
+        "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 2),
+        "cpu_ms": round(statistics.median(run["cpu_ms"] for run in runs), 2),
+        "max_rss_kb": max(run.get("max_rss_kb", 0) for run in runs),
+        "queue_ms": round(max(run.get("queue_ms", 0.0) for run in runs), 2)
+    }
+    if failures:
+        failure = failures[0]
+        report.update({
+            "exit_code": failure["exit_code"],
+            "timed_out": failure["timed_out"],
+            "difference": _first_difference(level["expected_output"], failure["stdout"]),
+            "stderr": failure["stderr"][-1000:]
+        })
+    return report
+
+
+async def check_levels(
+    levels: Sequence[Dict[str, Any]],
+    matches: Callable[[str, str], bool],
+    workers: int = LEVEL_CHECK_WORKERS,
+    repeat: int = 1,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """Run every level's starter code and report pass/fail, wall/CPU time and peak RSS per level"""
+    workers = min(max(workers, 1), LEVEL_CHECK_MAX_WORKERS, max(len(levels), 1))
+    repeat = min(max(repeat, 1), MAX_REPEAT)
+    pool_options = {"size": workers, "max_queue": max(len(levels), 1)}
+    if timeout:
+        pool_options["timeout"] = min(max(timeout, 0.1), LEVEL_CHECK_MAX_TIMEOUT)
+    pool = SandboxPool(**pool_options)
+
+    started = time.perf_counter()
+    await pool.start()
+    pool_start_ms = (time.perf_counter() - started) * 1000
+    try:
+        reports: List[Dict[str, Any]] = await asyncio.gather(
+            *[_check_level(pool, level, repeat, matches) for level in levels]
+        )
+    finally:
+        await pool.stop()
+    elapsed_ms = (time.perf_counter() - started) * 1000 - pool_start_ms
+
+    reports.sort(key=lambda report: report["level_id"])
+    failed = [report["level_id"] for report in reports if not report["passed"]]
+    return {
+        "levels_tested": [report["level_id"] for report in reports],
+        "passed": len(reports) - len(failed),
+        "failed": len(failed),
+        "failed_levels": failed,
+        "workers": workers,
+        "repeat": repeat,
+        "pool_start_ms": round(pool_start_ms, 2),
+        "execution_time": f"{elapsed_ms / 1000:.2f}s",
+        "wall_ms": round(elapsed_ms, 2),
+        "total_cpu_ms": round(sum(report["cpu_ms"] * repeat for report in reports), 2),
+        "most_expensive": [
+            {"level_id": report["level_id"], "cpu_ms": report["cpu_ms"], "max_rss_kb": report["max_rss_kb"]}
+            for report in sorted(reports, key=lambda report: report["cpu_ms"], reverse=True)[:5]
+        ],
+        "levels": reports
+    }
@@ -0,0 +1,41 @@
+"""Lazily loaded heavy level fields.
+
+The in-memory catalog only holds the slim part of each level. The large
+fields (starter code, hints, tutorial links) are fetched from Mongo the first
+time a level is opened and kept in a bounded LRU cache. Entries are keyed by
+catalog version, so an edited level is re-read after the next version bump.
+"""
+import os
+from typing import Any, Dict, Iterable
+
+from cachetools import LRUCache
+
+HEAVY_FIELDS = ("starter_code", "hints", "tutorial_links")
+SLIM_PROJECTION = {field: 0 for field in HEAVY_FIELDS}
+CONTENT_PROJECTION = {"_id": 0, "level_id": 1, **{field: 1 for field in HEAVY_FIELDS}}
+
+LEVEL_CONTENT_CACHE_SIZE = int(os.environ.get("LEVEL_CONTENT_CACHE_SIZE", "512"))
+
+
+class LevelContentStore:
+    def __init__(self, maxsize: int = LEVEL_CONTENT_CACHE_SIZE):
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+
+    async def get_many(self, db, level_ids: Iterable[int], version: int) -> Dict[int, Dict[str, Any]]:
+        """Heavy fields for each level id; all cache misses are fetched in one query"""
+        found, missing = {}, []
+        for level_id in level_ids:
+            content = self._cache.get((version, level_id))
+            if content is None:
+                missing.append(level_id)
+            else:
+                found[level_id] = content
+        if missing:
+            async for doc in db.levels.find({"level_id": {"$in": missing}}, CONTENT_PROJECTION):
+                level_id = doc.pop("level_id")
+                self._cache[(version, level_id)] = doc
+                found[level_id] = doc
+        return found
+
+    async def get(self, db, level_id: int, version: int) -> Dict[str, Any]:
+        return (await self.get_many(db, [level_id], version)).get(level_id, {})
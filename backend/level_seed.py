@@ -0,0 +1,111 @@
+"""Versioned, idempotent seeding of the built-in level catalog.
+
+The built-in levels live in ``data/levels``: ``index.json`` holds the slim
+catalog fields and ``content/<level_id>.json`` the heavy ones (starter code,
+hints, tutorial links). Each merged level is hashed, and the hash of all level
+hashes identifies the catalog revision. Startup compares that revision with
+the one recorded in ``catalog_meta`` and returns after a single point read when
+nothing changed; otherwise only levels whose content hash differs are upserted (keyed by ``level_id``, keeping existing ``_id``s) and the
+applied revision is recorded in ``level_migrations``.
+"""
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+LEVELS_DIR = Path(__file__).parent / "data" / "levels"
+SEED_META_ID = "seed"
+DUPLICATE_KEY = 11000
+
+
+def load_seed_levels() -> List[Dict[str, Any]]:
+    with open(LEVELS_DIR / "index.json", encoding="utf-8") as f:
+        levels = json.load(f)
+    for level in levels:
+        content_file = LEVELS_DIR / "content" / f"{level['level_id']}.json"
+        if content_file.exists():
+            with open(content_file, encoding="utf-8") as f:
+                level.update(json.load(f))
+    return levels
+
+
+def content_hash(level: Dict[str, Any]) -> str:
+    canonical = json.dumps(level, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def catalog_hash(hashes: Dict[int, str]) -> str:
+    joined = "\n".join(f"{level_id}:{hashes[level_id]}" for level_id in sorted(hashes))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+async def seed_levels(db, force: bool = False) -> Dict[str, Any]:
+    """Bring the built-in levels in Mongo up to date; returns a summary of what changed"""
+    levels = load_seed_levels()
+    hashes = {level["level_id"]: content_hash(level) for level in levels}
+    revision = catalog_hash(hashes)
+
+    meta = await db.catalog_meta.find_one({"_id": SEED_META_ID})
+    if meta and meta.get("revision") == revision and not force:
+        return {"revision": revision, "changed": [], "retired": [], "up_to_date": True}
+
+    stored = {
+        doc["level_id"]: doc.get("content_hash")
+        for doc in await db.levels.find({}, {"level_id": 1, "content_hash": 1}).to_list(length=None)
+    }
+    changed = [level for level in levels if stored.get(level["level_id"]) != hashes[level["level_id"]]]
+    retired = await db.levels.distinct("level_id", {"seeded": True, "is_active": True, "level_id": {"$nin": list(hashes)}})
+
+    operations = [
+        UpdateOne(
+            {"level_id": level["level_id"]},
+            {
+                "$set": {**level, "content_hash": hashes[level["level_id"]], "seeded": True},
+                "$setOnInsert": {"_id": str(uuid.uuid4())}
+            },
+            upsert=True
+        )
+        for level in changed
+    ]
+    if retired:
+        # Levels dropped from the data file are deactivated, never deleted,
+        # so existing progress keeps pointing at a real level.
+        operations.append(UpdateMany({"level_id": {"$in": retired}}, {"$set": {"is_active": False}}))
+
+    if operations:
+        try:
+            await db.levels.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Another worker inserted the same level first; its content is identical
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+            if errors:
+                raise
+
+    now = datetime.now(timezone.utc)
+    changed_ids = [level["level_id"] for level in changed]
+    # Keyed by revision so workers racing through the same seed record it once
+    await db.level_migrations.update_one(
+        {"_id": revision},
+        {"$setOnInsert": {
+            "previous_revision": meta.get("revision") if meta else None,
+            "changed_levels": changed_ids,
+            "retired_levels": retired,
+            "applied_at": now
+        }},
+        upsert=True
+    )
+    await db.catalog_meta.update_one(
+        {"_id": SEED_META_ID},
+        {"$set": {"revision": revision, "level_count": len(levels), "applied_at": now}},
+        upsert=True
+    )
+    logger.info(f"Seeded level catalog revision {revision[:12]}: {len(changed_ids)} changed, {len(retired)} retired")
+    return {"revision": revision, "changed": changed_ids, "retired": retired, "up_to_date": False}
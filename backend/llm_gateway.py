@@ -0,0 +1,234 @@
+"""Admission control around upstream LLM calls.
+
+Every call goes through ``LlmGateway``, which applies, per model:
+
+* a concurrency limit with a bounded wait queue (``LlmBusy`` when full),
+* a deadline covering queueing plus generation (``LlmTimeout``),
+* a circuit breaker that opens when the recent error rate is too high and
+  then rejects calls immediately (``CircuitOpen``) until a cool-down has
+  passed and a single trial call succeeds.
+
+Callers treat all three as "tutor unavailable" and serve the fallback
+explanation, so a degraded provider costs milliseconds instead of a worker's
+capacity.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from metrics import percentiles
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "30"))
+LLM_BREAKER_WINDOW = int(os.environ.get("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.environ.get("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.environ.get("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+class LlmUnavailable(Exception):
+    pass
+
+
+class LlmBusy(LlmUnavailable):
+    pass
+
+
+class LlmTimeout(LlmUnavailable):
+    pass
+
+
+class CircuitOpen(LlmUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        window: int = LLM_BREAKER_WINDOW,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        error_rate: float = LLM_BREAKER_ERROR_RATE,
+        cooldown: float = LLM_BREAKER_COOLDOWN_SECONDS
+    ):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._outcomes: deque = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record(self, success: bool):
+        if self.state == self.HALF_OPEN:
+            self._trial_running = False
+            if success:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+            self._open()
+
+    def release_trial(self):
+        # A trial call that ended without an outcome (e.g. client disconnect)
+        if self.state == self.HALF_OPEN:
+            self._trial_running = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def current_error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return round(self._outcomes.count(False) / len(self._outcomes), 4)
+
+
+class _ModelLane:
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.breaker = CircuitBreaker()
+        self.latencies: deque = deque(maxlen=2048)
+        self.counters = {"calls": 0, "errors": 0, "timeouts": 0, "rejected": 0, "short_circuited": 0}
+
+
+class LlmGateway:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        deadline: float = LLM_DEADLINE_SECONDS
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._lanes: Dict[str, _ModelLane] = {}
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _ModelLane(self.max_concurrency)
+        return lane
+
+    async def _admit(self, model: str, lane: _ModelLane, deadline_at: float):
+        if not lane.breaker.allow():
+            lane.counters["short_circuited"] += 1
+            raise CircuitOpen(f"{model} circuit is open")
+        if lane.in_flight + lane.queued >= self.max_concurrency + self.max_queue:
+            lane.counters["rejected"] += 1
+            lane.breaker.release_trial()
+            raise LlmBusy(f"{model} queue is full")
+        lane.queued += 1
+        try:
+            await asyncio.wait_for(lane.semaphore.acquire(), timeout=max(deadline_at - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            lane.counters["timeouts"] += 1
+            lane.breaker.release_trial()
+            raise LlmTimeout(f"{model} queue wait exceeded the deadline")
+        except BaseException:
+            lane.breaker.release_trial()
+            raise
+        finally:
+            lane.queued -= 1
+        lane.in_flight += 1
+        lane.counters["calls"] += 1
+
+    def _done(self, lane: _ModelLane, started: float, success: Optional[bool]):
+        lane.in_flight -= 1
+        lane.semaphore.release()
+        if success is None:
+            lane.breaker.release_trial()
+            return
+        lane.breaker.record(success)
+        if success:
+            lane.latencies.append((time.monotonic() - started) * 1000)
+        else:
+            lane.counters["errors"] += 1
+
+    async def complete(self, model: str, call: Callable[..., Awaitable[Any]], *args) -> Any:
+        lane = self._lane(model)
+        deadline_at = time.monotonic() + self.deadline
+        await self._admit(model, lane, deadline_at)
+        started = time.monotonic()
+        success = None
+        try:
+            result = await asyncio.wait_for(call(*args), timeout=max(deadline_at - time.monotonic(), 0))
+            success = True
+            return result
+        except asyncio.TimeoutError:
+            success = False
+            lane.counters["timeouts"] += 1
+            raise LlmTimeout(f"{model} call exceeded {self.deadline}s")
+        except Exception:
+            success = False
+            raise
+        finally:
+            self._done(lane, started, success)
+
+    async def stream(self, model: str, call: Callable[..., AsyncIterator[str]], *args) -> AsyncIterator[str]:
+        lane = self._lane(model)
+        deadline_at = time.monotonic() + self.deadline
+        await self._admit(model, lane, deadline_at)
+        started = time.monotonic()
+        success = None
+        upstream = call(*args)
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(
+                        upstream.__anext__(), timeout=max(deadline_at - time.monotonic(), 0)
+                    )
+                except StopAsyncIteration:
+                    break
+                yield delta
+            success = True
+        except asyncio.TimeoutError:
+            success = False
+            lane.counters["timeouts"] += 1
+            raise LlmTimeout(f"{model} stream exceeded {self.deadline}s")
+        except Exception:
+            success = False
+            raise
+        finally:
+            # success stays None when the consumer went away: not the provider's fault
+            self._done(lane, started, success)
+            await upstream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            model: {
+                "state": lane.breaker.state,
+                "in_flight": lane.in_flight,
+                "queued": lane.queued,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "error_rate": lane.breaker.current_error_rate(),
+                **lane.counters,
+                "latency_ms": percentiles(lane.latencies),
+            }
+            for model, lane in self._lanes.items()
+        }
@@ -0,0 +1,207 @@
+"""Maintenance commands for the PythonQuest backend.
+
+Usage:
+    python manage.py rebuild-stats [--user-id USER_ID]
+    python manage.py ensure-indexes
+    python manage.py check-indexes
+    python manage.py seed-levels [--force]
+    python manage.py rebuild-feedback-counters
+    python manage.py rebuild-rollups
+    python manage.py recompute-revenue [--check]
+    python manage.py migrate-admin-roles [--apply] [--exclude USERNAME ...]
+    python manage.py dedupe-progress [--apply]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import billing
+import feedback_stats
+import rollups
+import user_stats
+from indexes import ensure_indexes, check_query_plans, missing_required_indexes
+from level_catalog import LevelCatalog
+from level_seed import seed_levels
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("manage")
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "pythonquest")
+
+
+async def rebuild_stats(db, args):
+    rebuilt = await user_stats.rebuild_user_stats(db, args.user_id)
+    logger.info(f"Rebuilt stats for {rebuilt} user(s)")
+
+
+async def create_indexes(db, args):
+    created = await ensure_indexes(db)
+    for collection, names in created.items():
+        logger.info(f"{collection}: {', '.join(names)}")
+
+
+async def check_indexes(db, args):
+    await ensure_indexes(db)
+    failures = await check_query_plans(db)
+    if failures:
+        logger.error(f"{len(failures)} query shape(s) fall back to a collection scan")
+        sys.exit(1)
+    logger.info("All query shapes use an index")
+
+
+async def seed(db, args):
+    summary = await seed_levels(db, force=args.force)
+    if not (summary["changed"] or summary["retired"]):
+        logger.info(f"Level catalog already at revision {summary['revision'][:12]}")
+        return
+    # Running servers pick the new catalog up through the version counter
+    await LevelCatalog().bump(db)
+    logger.info(f"Changed levels: {summary['changed']}, retired levels: {summary['retired']}")
+
+
+async def rebuild_feedback_counters(db, args):
+    counters = await feedback_stats.rebuild_counters(db)
+    logger.info(f"Rebuilt feedback counters: {counters['total']} feedback entries")
+
+
+async def rebuild_rollups(db, args):
+    written = await rollups.rebuild(db)
+    logger.info(f"Rebuilt signups, completions and activity in {written} rollup buckets")
+
+
+async def recompute_revenue(db, args):
+    differences = await billing.recompute(db, repair=not args.check)
+    for difference in differences:
+        logger.warning(f"{difference['_id']}: stored {difference['stored']}, ledger {difference['expected']}")
+    if args.check and differences:
+        logger.error(f"{len(differences)} revenue aggregate(s) disagree with the ledger")
+        sys.exit(1)
+    logger.info(f"Revenue aggregates {'checked' if args.check else 'recomputed'}: {len(differences)} difference(s)")
+
+
+async def migrate_admin_roles(db, args):
+    # Before roles existed, any username containing "admin" was an admin. Those
+    # accounts get an explicit admin role once; review the list first, since
+    # anyone could sign up with such a name while the rule was live.
+    legacy = {"roles": {"$exists": False}}
+    candidates = await db.users.find(
+        {**legacy, "username": {"$regex": "admin", "$options": "i"}}, {"username": 1, "email": 1}
+    ).to_list(None)
+    excluded = set(args.exclude or [])
+    promoted = [user for user in candidates if user["username"] not in excluded]
+    for user in candidates:
+        action = "skip" if user["username"] in excluded else "admin"
+        logger.info(f"{action}: {user['username']} <{user.get('email')}> ({user['_id']})")
+    if not args.apply:
+        logger.info(f"{len(promoted)} user(s) would become admins; re-run with --apply to write roles")
+        return
+    if promoted:
+        await db.users.update_many({**legacy, "_id": {"$in": [user["_id"] for user in promoted]}}, {"$set": {"roles": ["admin"]}})
+    result = await db.users.update_many(legacy, {"$set": {"roles": []}})
+    logger.info(f"Assigned the admin role to {len(promoted)} user(s), no roles to {result.modified_count} other(s)")
+
+
+def _merge_progress(docs):
+    """Collapse duplicate progress documents of one (user, level) into the one to keep"""
+    completed = [doc for doc in docs if doc.get("is_completed")]
+    if completed:
+        # The earliest completion is the one that paid XP first
+        keep = min(completed, key=lambda doc: (doc.get("completed_at") is None, doc.get("completed_at") or 0))
+    else:
+        keep = docs[0]
+    merged = {
+        "attempts": sum(doc.get("attempts", 0) for doc in docs),
+        "stars": max(doc.get("stars", 0) for doc in docs)
+    }
+    return keep, merged
+
+
+async def dedupe_progress(db, args):
+    # The unique user_level_unique index is what awards XP only once; it cannot
+    # be built while duplicates from the old find-then-insert path remain, and
+    # the server refuses to start without it.
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "level_id": "$level_id"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    groups = await db.user_progress.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    removed = 0
+    users = set()
+    for group in groups:
+        docs = await db.user_progress.find({"_id": {"$in": group["ids"]}}).sort("_id", 1).to_list(None)
+        keep, merged = _merge_progress(docs)
+        extra = [doc["_id"] for doc in docs if doc["_id"] != keep["_id"]]
+        logger.info(
+            f"{group['_id']['user_id']} level {group['_id']['level_id']}: keep {keep['_id']}, "
+            f"drop {len(extra)}, attempts {merged['attempts']}"
+        )
+        if args.apply:
+            await db.user_progress.update_one({"_id": keep["_id"]}, {"$set": merged})
+            await db.user_progress.delete_many({"_id": {"$in": extra}})
+        removed += len(extra)
+        users.add(group["_id"]["user_id"])
+    if not args.apply:
+        logger.info(f"{removed} duplicate progress document(s) for {len(users)} user(s); re-run with --apply to remove them")
+        return
+    for user_id in users:
+        # Duplicated completions were counted twice in the materialized stats
+        await user_stats.rebuild_user_stats(db, user_id)
+    await ensure_indexes(db)
+    missing = await missing_required_indexes(db)
+    if missing:
+        logger.error(f"Removed {removed} duplicate(s) but required indexes are still missing: {missing}")
+        sys.exit(1)
+    logger.info(f"Removed {removed} duplicate(s), rebuilt stats for {len(users)} user(s); required indexes are in place")
+
+
+COMMANDS = {
+    "rebuild-stats": rebuild_stats,
+    "ensure-indexes": create_indexes,
+    "check-indexes": check_indexes,
+    "seed-levels": seed,
+    "rebuild-feedback-counters": rebuild_feedback_counters,
+    "rebuild-rollups": rebuild_rollups,
+    "recompute-revenue": recompute_revenue,
+    "migrate-admin-roles": migrate_admin_roles,
+    "dedupe-progress": dedupe_progress,
+}
+
+
+async def run(args):
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        await COMMANDS[args.command](client[DB_NAME], args)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PythonQuest maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-stats", help="Recompute materialized user_stats from user_progress")
+    rebuild.add_argument("--user-id", help="Only rebuild this user's stats")
+    subparsers.add_parser("ensure-indexes", help="Create all declared indexes")
+    subparsers.add_parser("check-indexes", help="Explain every endpoint query shape and fail on COLLSCAN")
+    seed_parser = subparsers.add_parser("seed-levels", help="Upsert changed built-in levels from data/levels")
+    seed_parser.add_argument("--force", action="store_true", help="Compare every level even if the revision is unchanged")
+    subparsers.add_parser("rebuild-feedback-counters", help="Recompute the feedback counters document from feedback")
+    subparsers.add_parser("rebuild-rollups", help="Backfill analytics rollups from users and user_progress")
+    revenue = subparsers.add_parser("recompute-revenue", help="Rebuild revenue aggregates and refund balances from the billing ledger")
+    revenue.add_argument("--check", action="store_true", help="Only report aggregates that disagree with the ledger")
+    migrate = subparsers.add_parser("migrate-admin-roles", help="Give legacy 'admin' usernames an explicit admin role")
+    migrate.add_argument("--apply", action="store_true", help="Write the roles instead of only listing them")
+    migrate.add_argument("--exclude", nargs="*", metavar="USERNAME", help="Usernames that must not become admins")
+    dedupe = subparsers.add_parser("dedupe-progress", help="Merge duplicate user_progress documents and build the unique index")
+    dedupe.add_argument("--apply", action="store_true", help="Merge and delete instead of only listing them")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
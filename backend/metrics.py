@@ -0,0 +1,13 @@
+"""Small helpers shared by the in-process latency metrics."""
+from typing import Dict, Iterable
+
+
+def percentiles(samples: Iterable[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
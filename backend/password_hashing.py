@@ -0,0 +1,101 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (~200 ms per call at the default cost), so running
+it inside a request handler stalls every other request on the worker. Hashes
+and verifications run on a bounded thread pool instead (the bcrypt C code
+releases the GIL, so threads hash in parallel). When more than ``max_pending``
+operations are waiting, new ones are rejected with ``HashingBusy`` so a login
+storm degrades into fast 503s instead of ever-growing latency. Verification
+also reports a fresh hash when the stored one uses outdated cost parameters.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from metrics import percentiles
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "64"))
+BCRYPT_MAX_BYTES = 72
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _truncate(password: str) -> str:
+    # bcrypt only looks at the first 72 bytes and newer releases reject longer input
+    encoded = password.encode("utf-8")
+    if len(encoded) > BCRYPT_MAX_BYTES:
+        return encoded[:BCRYPT_MAX_BYTES].decode("utf-8", errors="ignore")
+    return password
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        rounds: int = BCRYPT_ROUNDS
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._latencies: deque = deque(maxlen=2048)
+        self._counters = {"hashes": 0, "verifications": 0, "rehashes": 0, "rejected": 0}
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self._counters["rejected"] += 1
+            raise HashingBusy()
+        self._pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return started, fn(*args)
+
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self._pending -= 1
+        finished = time.perf_counter()
+        self._latencies.append(((started - submitted) * 1000, (finished - started) * 1000))
+        return result
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(self.context.hash, _truncate(password))
+        self._counters["hashes"] += 1
+        return hashed
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check a password; also returns a replacement hash when the stored one is outdated"""
+        valid, new_hash = await self._run(self.context.verify_and_update, _truncate(password), hashed)
+        self._counters["verifications"] += 1
+        if new_hash:
+            self._counters["rehashes"] += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            **self._counters,
+            "queue_ms": percentiles(q for q, _ in self._latencies),
+            "hash_ms": percentiles(h for _, h in self._latencies),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
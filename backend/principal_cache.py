@@ -0,0 +1,124 @@
+"""Short-lived cache of authenticated principals.
+
+Every authenticated request used to load the user document after decoding the
+JWT. The decoded user (without the password hash) is now cached per worker
+for a few seconds, tagged with the user's ``token_version``. A token is served
+from the cache only when its ``ver`` claim matches that version.
+
+Endpoints that change a user call ``invalidate_everywhere``. It records the
+change in ``principal_invalidations``, and every worker follows that
+collection (change stream when the deployment supports it, polling
+otherwise) to drop its copy. Staff principals don't wait for that: the
+server re-checks their version and roles on every request (see
+``server.get_current_user``).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_INVALIDATION_POLL_SECONDS = float(os.environ.get("PRINCIPAL_INVALIDATION_POLL_SECONDS", "1"))
+# Polls re-read this much history, so a writer whose clock lags or whose
+# insert lands late is still seen; dropping an entry twice is harmless
+PRINCIPAL_INVALIDATION_OVERLAP_SECONDS = 5
+PRINCIPAL_INVALIDATION_TTL_SECONDS = 3600
+
+# Never cached or handed to request handlers
+PRINCIPAL_PROJECTION = {"password": 0}
+
+
+def token_version(user: Dict[str, Any]) -> int:
+    return user.get("token_version", 0)
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.remote_invalidations = 0
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def get(self, user_id: str, version: int) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Handlers get their own copy so they cannot mutate the cached principal
+        return dict(entry[1])
+
+    def put(self, user: Dict[str, Any]):
+        self._cache[user["_id"]] = (token_version(user), dict(user))
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id, None)
+
+    async def invalidate_everywhere(self, db, user_id: str):
+        """Drop the user's cached principal on this worker now and on the others within a poll interval"""
+        self.invalidate(user_id)
+        await db.principal_invalidations.insert_one({"user_id": user_id, "at": datetime.now(timezone.utc)})
+
+    def _apply(self, user_id: str):
+        if user_id in self._cache:
+            self.remote_invalidations += 1
+            self.invalidate(user_id)
+
+    async def _poll(self, db, since: datetime) -> datetime:
+        polled_at = datetime.now(timezone.utc)
+        cursor = db.principal_invalidations.find({"at": {"$gte": since}}, {"user_id": 1})
+        async for entry in cursor:
+            self._apply(entry["user_id"])
+        return polled_at - timedelta(seconds=PRINCIPAL_INVALIDATION_OVERLAP_SECONDS)
+
+    async def _watch(self, db):
+        since = datetime.now(timezone.utc)
+        try:
+            pipeline = [{"$match": {"operationType": "insert"}}]
+            async with db.principal_invalidations.watch(pipeline) as stream:
+                logger.info("Principal cache following principal_invalidations change stream")
+                async for change in stream:
+                    self._apply(change["fullDocument"]["user_id"])
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError:
+            # Standalone servers have no change streams; fall back to polling
+            logger.info(f"Principal cache polling principal_invalidations every {PRINCIPAL_INVALIDATION_POLL_SECONDS}s")
+
+        while True:
+            await asyncio.sleep(PRINCIPAL_INVALIDATION_POLL_SECONDS)
+            try:
+                since = await self._poll(db, since)
+            except PyMongoError as e:
+                logger.error(f"Principal invalidation poll failed: {str(e)}")
+
+    def start_watching(self, db):
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch(db))
+
+    async def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "remote_invalidations": self.remote_invalidations
+        }
@@ -0,0 +1,200 @@
+"""Per-user usage quotas backed by atomic counters.
+
+A ``Quota`` allows ``limit`` uses per user per window. With a fixed window
+there is one counter per user per window (for a daily quota, per UTC day). A
+sliding window also reads the previous window's counter and weights it by how
+much of it still overlaps the sliding period, the usual approximation that
+avoids storing every timestamp.
+
+Counters live in a pluggable backend: ``MongoQuotaBackend`` (shared by every
+worker, old counters removed by a TTL index) or ``MemoryQuotaBackend`` (single
+process). Both increment conditionally, so concurrent requests can never push
+a counter past the limit, and a use that produced nothing can be refunded.
+"""
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+QUOTA_BACKEND = os.environ.get("QUOTA_BACKEND", "mongo")
+QUOTA_WINDOW = os.environ.get("QUOTA_WINDOW", "fixed")
+AI_TUTOR_FREE_DAILY_LIMIT = int(os.environ.get("AI_TUTOR_FREE_DAILY_LIMIT", "3"))
+DAY_SECONDS = 24 * 3600
+
+
+class MemoryQuotaBackend:
+    """Counters in a dict; check-and-increment is atomic because nothing awaits in between"""
+
+    PRUNE_SECONDS = 60
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, float]] = {}
+        self._next_prune = 0.0
+
+    def _prune(self):
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.PRUNE_SECONDS
+        for key in [key for key, (_, expires_at) in self._counters.items() if expires_at <= now]:
+            del self._counters[key]
+
+    async def increment(self, key: str, cap: int, expires_at: float) -> Optional[int]:
+        self._prune()
+        count, _ = self._counters.get(key, (0, expires_at))
+        if count >= cap:
+            return None
+        self._counters[key] = (count + 1, expires_at)
+        return count + 1
+
+    async def decrement(self, key: str):
+        count, expires_at = self._counters.get(key, (0, 0.0))
+        if count > 0:
+            self._counters[key] = (count - 1, expires_at)
+
+    async def count(self, key: str) -> int:
+        return self._counters.get(key, (0, 0.0))[0]
+
+
+class MongoQuotaBackend:
+    """Counters in ``quota_usage``, incremented with a conditional upsert"""
+
+    def __init__(self, db):
+        self.collection = db.quota_usage
+
+    async def increment(self, key: str, cap: int, expires_at: float) -> Optional[int]:
+        if cap <= 0:
+            return None
+        update = {
+            "$inc": {"count": 1},
+            "$setOnInsert": {"expires_at": datetime.fromtimestamp(expires_at, timezone.utc)}
+        }
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": key, "count": {"$lt": cap}},
+                update,
+                projection={"count": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Either the counter is already at the cap (the filter missed and the
+            # upsert collided with it) or a concurrent request created it first
+            doc = await self.collection.find_one_and_update(
+                {"_id": key, "count": {"$lt": cap}},
+                {"$inc": {"count": 1}},
+                projection={"count": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        return doc["count"] if doc else None
+
+    async def decrement(self, key: str):
+        await self.collection.update_one({"_id": key, "count": {"$gt": 0}}, {"$inc": {"count": -1}})
+
+    async def count(self, key: str) -> int:
+        doc = await self.collection.find_one({"_id": key}, {"count": 1})
+        return doc["count"] if doc else 0
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, decision: Dict[str, Any]):
+        super().__init__(f"Quota of {decision['limit']} exhausted")
+        self.decision = decision
+
+
+class Quota:
+    def __init__(self, name: str, limit: int, backend, window_seconds: int = DAY_SECONDS, sliding: bool = QUOTA_WINDOW == "sliding"):
+        self.name = name
+        self.limit = limit
+        self.backend = backend
+        self.window_seconds = window_seconds
+        self.sliding = sliding
+        self._allowed = 0
+        self._rejected = 0
+        self._refunded = 0
+
+    def _window(self, now: float) -> int:
+        return int(now // self.window_seconds) * self.window_seconds
+
+    def _key(self, subject: str, window: int) -> str:
+        return f"{self.name}:{subject}:{window}"
+
+    async def _carried_over(self, subject: str, window: int, now: float) -> int:
+        """Uses from the previous fixed window that still fall inside the sliding window"""
+        if not self.sliding:
+            return 0
+        overlap = 1 - (now - window) / self.window_seconds
+        previous = await self.backend.count(self._key(subject, window - self.window_seconds))
+        return math.ceil(previous * overlap)
+
+    def _decision(self, allowed: bool, used: int, window: int) -> Dict[str, Any]:
+        # For a sliding window this is when the current counter stops being
+        # the current one; carried-over uses keep draining after it
+        return {
+            "allowed": allowed,
+            "limit": self.limit,
+            "used": min(used, self.limit),
+            "remaining": max(0, self.limit - used),
+            "window_start": window,
+            "reset": window + self.window_seconds
+        }
+
+    async def consume(self, subject: str) -> Dict[str, Any]:
+        """Count one use against ``subject``; raises ``QuotaExceeded`` once the limit is reached"""
+        now = time.time()
+        window = self._window(now)
+        carried = await self._carried_over(subject, window, now)
+        count = await self.backend.increment(
+            self._key(subject, window),
+            self.limit - carried,
+            window + self.window_seconds * (2 if self.sliding else 1)
+        )
+        if count is None:
+            self._rejected += 1
+            raise QuotaExceeded(self._decision(False, self.limit, window))
+        self._allowed += 1
+        return self._decision(True, carried + count, window)
+
+    async def refund(self, subject: str, decision: Dict[str, Any]):
+        """Give back a use that produced nothing (e.g. the upstream call failed)"""
+        self._refunded += 1
+        await self.backend.decrement(self._key(subject, decision["window_start"]))
+
+    async def peek(self, subject: str) -> Dict[str, Any]:
+        now = time.time()
+        window = self._window(now)
+        used = await self._carried_over(subject, window, now) + await self.backend.count(self._key(subject, window))
+        return self._decision(used < self.limit, used, window)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "window": "sliding" if self.sliding else "fixed",
+            "backend": type(self.backend).__name__,
+            "allowed": self._allowed,
+            "rejected": self._rejected,
+            "refunded": self._refunded
+        }
+
+
+def backend_for(db):
+    if QUOTA_BACKEND == "memory":
+        return MemoryQuotaBackend()
+    return MongoQuotaBackend(db)
+
+
+def rate_limit_headers(decision: Dict[str, Any]) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(decision["limit"]),
+        "X-RateLimit-Remaining": str(decision["remaining"]),
+        "X-RateLimit-Reset": str(decision["reset"])
+    }
+    if not decision["allowed"]:
+        headers["Retry-After"] = str(max(1, decision["reset"] - int(time.time())))
+    return headers
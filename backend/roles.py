@@ -0,0 +1,56 @@
+"""Staff roles and the admin permissions they grant.
+
+Users carry a ``roles`` list; nothing else grants permissions. Each distinct combination of roles is compiled
+once into a frozenset of permissions, and the result is attached to the
+cached principal, so an admin endpoint's authorization check is a single set
+membership test. Endpoints that change another user additionally require
+``can_manage``: a caller may only act on users whose roles grant nothing the
+caller lacks, so support cannot suspend or edit an admin.
+"""
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List
+
+FEEDBACK_READ = "feedback.read"
+FEEDBACK_MANAGE = "feedback.manage"
+USERS_READ = "users.read"
+USERS_MANAGE = "users.manage"
+USERS_ROLES = "users.roles"
+CONTENT_MANAGE = "content.manage"
+BILLING_READ = "billing.read"
+BILLING_MANAGE = "billing.manage"
+ANALYTICS_READ = "analytics.read"
+SUPPORT_READ = "support.read"
+SUPPORT_MANAGE = "support.manage"
+SYSTEM_READ = "system.read"
+
+ALL_PERMISSIONS = frozenset({
+    FEEDBACK_READ, FEEDBACK_MANAGE, USERS_READ, USERS_MANAGE, USERS_ROLES, CONTENT_MANAGE,
+    BILLING_READ, BILLING_MANAGE, ANALYTICS_READ, SUPPORT_READ, SUPPORT_MANAGE, SYSTEM_READ,
+})
+
+ROLE_PERMISSIONS: Dict[str, FrozenSet[str]] = {
+    "admin": ALL_PERMISSIONS,
+    "support": frozenset({
+        USERS_READ, USERS_MANAGE, FEEDBACK_READ, FEEDBACK_MANAGE, SUPPORT_READ, SUPPORT_MANAGE, ANALYTICS_READ,
+    }),
+    "content-editor": frozenset({CONTENT_MANAGE, FEEDBACK_READ, ANALYTICS_READ}),
+    "billing": frozenset({BILLING_READ, BILLING_MANAGE, USERS_READ, ANALYTICS_READ}),
+}
+
+
+def roles_of(user: Dict[str, Any]) -> List[str]:
+    return [role for role in user.get("roles") or [] if role in ROLE_PERMISSIONS]
+
+
+@lru_cache(maxsize=None)
+def _compile(roles: tuple) -> FrozenSet[str]:
+    return frozenset().union(*(ROLE_PERMISSIONS[role] for role in roles))
+
+
+def permissions_for(roles: Iterable[str]) -> FrozenSet[str]:
+    return _compile(tuple(sorted(set(roles))))
+
+
+def can_manage(permissions: FrozenSet[str], target: Dict[str, Any]) -> bool:
+    """Whether a caller holding ``permissions`` may change ``target``'s account"""
+    return permissions_for(roles_of(target)) <= permissions
@@ -0,0 +1,462 @@
+"""Time-bucketed analytics rollups for the admin dashboard.
+
+Request handlers record events (signups, logins, submissions, completions,
+code executions, HTTP responses) into an in-process ``Rollups`` instance. The
+deltas are kept per bucket in memory and written every few seconds as one
+upsert per touched bucket document in ``analytics_rollups``: one document per
+hour (``hour:2026-10-17T13``), one per UTC day (``day:2026-10-17``) and a
+single all-time document. Counters are ``$inc``remented; distinct active users
+are a HyperLogLog sketch whose registers are merged with ``$max``.
+
+The dashboard reads at most the last 60 daily documents, 24 hourly ones and
+the all-time one. Days that are over never change again, so each worker keeps
+them in memory and, in steady state, only reads today's, the hourly and the
+all-time documents.
+
+HyperLogLog: a user id is hashed to 64 bits, the top ``HLL_PRECISION`` bits
+pick a register and the register keeps the highest position of the first set
+bit seen in the rest. Register-wise max is a union, so weekly and monthly
+actives are the merge of daily sketches. The standard error is about
+1.04 / sqrt(2 ** HLL_PRECISION), roughly 3% at the default precision.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cachetools import TTLCache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FLUSH_SECONDS = float(os.environ.get("ROLLUP_FLUSH_SECONDS", "5"))
+ROLLUP_HOURLY_RETENTION_DAYS = int(os.environ.get("ROLLUP_HOURLY_RETENTION_DAYS", "14"))
+ROLLUP_DAILY_RETENTION_DAYS = int(os.environ.get("ROLLUP_DAILY_RETENTION_DAYS", "400"))
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+ALL_TIME_ID = "all"
+DIFFICULTY_ORDER = ["Easy", "Medium", "Hard", "Expert"]
+DUPLICATE_KEY = 11000
+# A day is final once no worker can still be flushing deltas into it
+CLOSED_DAY_GRACE = timedelta(minutes=10)
+# Counters the backfill derives from users/user_progress; the rest only exist from the request path
+BACKFILLED_COUNTERS = ["signups", "completions", "completions_by_category", "completions_by_difficulty"]
+
+
+def hll_register(value: str) -> Tuple[int, int]:
+    """Map a value to (register index, rank) for a HyperLogLog sketch"""
+    hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+    rest_bits = 64 - HLL_PRECISION
+    rest = hashed & ((1 << rest_bits) - 1)
+    return hashed >> rest_bits, rest_bits - rest.bit_length() + 1
+
+
+def hll_merge(sketches: Iterable[Dict[int, int]]) -> Dict[int, int]:
+    merged: Dict[int, int] = {}
+    for sketch in sketches:
+        for index, rank in sketch.items():
+            if rank > merged.get(index, 0):
+                merged[index] = rank
+    return merged
+
+
+def hll_estimate(sketch: Dict[int, int]) -> int:
+    m = HLL_REGISTERS
+    zeros = m - len(sketch)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / (sum(2.0 ** -rank for rank in sketch.values()) + zeros)
+    if estimate <= 2.5 * m and zeros:
+        # Small-range correction (linear counting)
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+def field_key(name: str) -> str:
+    """Make a category or difficulty name usable as a Mongo field name"""
+    return name.replace(".", "_").replace("$", "_")
+
+
+def as_utc(moment: datetime) -> datetime:
+    # Motor returns naive datetimes unless the client is tz_aware; they are UTC
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def hour_id(start: datetime) -> str:
+    return f"hour:{start:%Y-%m-%dT%H}"
+
+
+def day_id(start: datetime) -> str:
+    return f"day:{start:%Y-%m-%d}"
+
+
+def _add_nested(total: Dict[str, Any], counters: Dict[str, Any]):
+    for name, value in counters.items():
+        if isinstance(value, dict):
+            _add_nested(total.setdefault(name, {}), value)
+        else:
+            total[name] = total.get(name, 0) + value
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h {minutes}m" if days else f"{hours}h {minutes}m"
+
+
+class Rollups:
+    def __init__(self, flush_seconds: float = ROLLUP_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.started_at = time.monotonic()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Parsed documents of days that are over, keyed by bucket id
+        self._closed_days = TTLCache(maxsize=128, ttl=3600)
+        self._db = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._counters = {"events": 0, "flushes": 0, "written": 0, "failed_flushes": 0}
+
+    # Recording
+    def _bucket(self, bucket_id: str, granularity: str, start: Optional[datetime]) -> Dict[str, Any]:
+        bucket = self._pending.get(bucket_id)
+        if bucket is None:
+            bucket = self._pending[bucket_id] = {
+                "granularity": granularity,
+                "start": start,
+                "counters": defaultdict(int),
+                "active": {}
+            }
+        return bucket
+
+    def record(self, counters: Dict[str, float], user_id: Optional[str] = None, at: Optional[datetime] = None):
+        """Add ``counters`` (dotted names allowed) to the current buckets and mark ``user_id`` active"""
+        hour = as_utc(at or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+        day = hour.replace(hour=0)
+        register = hll_register(user_id) if user_id else None
+        self._counters["events"] += 1
+
+        for bucket in (self._bucket(hour_id(hour), "hour", hour), self._bucket(day_id(day), "day", day)):
+            for name, amount in counters.items():
+                bucket["counters"][name] += amount
+            if register is not None:
+                index, rank = register
+                if rank > bucket["active"].get(index, 0):
+                    bucket["active"][index] = rank
+        all_time = self._bucket(ALL_TIME_ID, "all", None)
+        for name, amount in counters.items():
+            all_time["counters"][name] += amount
+
+    def record_signup(self, user_id: str, at: Optional[datetime] = None):
+        self.record({"signups": 1}, user_id, at)
+
+    def record_login(self, user_id: str):
+        self.record({"logins": 1}, user_id)
+
+    def record_submission(self, user_id: str, correct: bool):
+        self.record({"submissions": 1, "correct_submissions": 1 if correct else 0}, user_id)
+
+    def record_completion(self, user_id: str, level: Dict[str, Any], at: Optional[datetime] = None):
+        category, difficulty = field_key(level["category"]), field_key(level["difficulty"])
+        self.record({
+            "completions": 1,
+            f"completions_by_category.{category}": 1,
+            f"completions_by_difficulty.{difficulty}.{category}": 1
+        }, user_id, at)
+
+    def record_execution(self, cached: bool):
+        self.record({"cached_executions" if cached else "executions": 1})
+
+    def record_request(self, status_code: int, elapsed_ms: float):
+        self.record({
+            "requests": 1,
+            "server_errors": 1 if status_code >= 500 else 0,
+            "response_ms": round(elapsed_ms, 1)
+        })
+
+    # Writing
+    @staticmethod
+    def _on_insert(bucket: Dict[str, Any]) -> Dict[str, Any]:
+        on_insert: Dict[str, Any] = {"granularity": bucket["granularity"]}
+        if bucket["start"] is not None:
+            retention = ROLLUP_HOURLY_RETENTION_DAYS if bucket["granularity"] == "hour" else ROLLUP_DAILY_RETENTION_DAYS
+            on_insert.update({"start": bucket["start"], "expires_at": bucket["start"] + timedelta(days=retention)})
+        return on_insert
+
+    @classmethod
+    def _operation(cls, bucket_id: str, bucket: Dict[str, Any]) -> UpdateOne:
+        update: Dict[str, Any] = {"$setOnInsert": cls._on_insert(bucket)}
+        increments = {f"counters.{name}": amount for name, amount in bucket["counters"].items() if amount}
+        if increments:
+            update["$inc"] = increments
+        if bucket["active"]:
+            update["$max"] = {f"active.r{index}": rank for index, rank in bucket["active"].items()}
+        return UpdateOne({"_id": bucket_id}, update, upsert=True)
+
+    async def _write(self, db, pending: Dict[str, Dict[str, Any]]):
+        operations = [self._operation(bucket_id, bucket) for bucket_id, bucket in pending.items()]
+        try:
+            await db.analytics_rollups.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            # Another worker created the bucket first; it matches now
+            await db.analytics_rollups.bulk_write([operations[err["index"]] for err in errors], ordered=False)
+
+    def _merge_back(self, pending: Dict[str, Dict[str, Any]]):
+        for bucket_id, failed in pending.items():
+            bucket = self._bucket(bucket_id, failed["granularity"], failed["start"])
+            for name, amount in failed["counters"].items():
+                bucket["counters"][name] += amount
+            for index, rank in failed["active"].items():
+                bucket["active"][index] = max(rank, bucket["active"].get(index, 0))
+
+    async def flush(self, db):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await self._write(db, pending)
+            except PyMongoError as e:
+                # Keep the deltas and retry with the next flush
+                self._counters["failed_flushes"] += 1
+                logger.error(f"Rollup flush of {len(pending)} buckets failed: {str(e)}")
+                self._merge_back(pending)
+                return
+            self._counters["flushes"] += 1
+            self._counters["written"] += len(pending)
+
+    async def _run(self, db):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush(db)
+            except Exception as e:
+                logger.error(f"Rollup flush failed: {str(e)}")
+
+    def start(self, db):
+        self._db = db
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._db is not None:
+            await self.flush(self._db)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending_buckets": len(self._pending), "cached_days": len(self._closed_days), **self._counters}
+
+    # Reading
+    @staticmethod
+    def _parse(doc: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        doc = doc or {}
+        return {
+            "counters": doc.get("counters", {}),
+            "active": {int(key[1:]): rank for key, rank in doc.get("active", {}).items()}
+        }
+
+    async def _days(self, db, now: datetime, count: int) -> List[Dict[str, Any]]:
+        """The last ``count`` daily buckets, today first"""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        starts = [today - timedelta(days=offset) for offset in range(count)]
+        ids = [day_id(start) for start in starts]
+        missing = [bucket_id for bucket_id in ids if bucket_id not in self._closed_days]
+        fetched = {}
+        if missing:
+            async for doc in db.analytics_rollups.find({"_id": {"$in": missing}}):
+                fetched[doc["_id"]] = doc
+
+        days = []
+        for start, bucket_id in zip(starts, ids):
+            if bucket_id in self._closed_days:
+                days.append(self._closed_days[bucket_id])
+                continue
+            day = self._parse(fetched.get(bucket_id))
+            if start + timedelta(days=1) + CLOSED_DAY_GRACE <= now:
+                self._closed_days[bucket_id] = day
+            days.append(day)
+        return days
+
+    @staticmethod
+    def _total(buckets: List[Dict[str, Any]], counter: str) -> float:
+        return sum(bucket["counters"].get(counter, 0) for bucket in buckets)
+
+    @staticmethod
+    def _nested_total(buckets: List[Dict[str, Any]], counter: str) -> Dict[str, Any]:
+        total: Dict[str, Any] = {}
+        for bucket in buckets:
+            _add_nested(total, bucket["counters"].get(counter, {}))
+        return total
+
+    @staticmethod
+    def _active(buckets: List[Dict[str, Any]]) -> int:
+        return hll_estimate(hll_merge(bucket["active"] for bucket in buckets))
+
+    @staticmethod
+    def _retention(current: List[Dict[str, Any]], previous: List[Dict[str, Any]]) -> float:
+        """Share of the previous period's active users who were active again in the current one"""
+        current_sketch = hll_merge(bucket["active"] for bucket in current)
+        previous_sketch = hll_merge(bucket["active"] for bucket in previous)
+        previous_users = hll_estimate(previous_sketch)
+        if not previous_users:
+            return 0.0
+        # |A and B| = |A| + |B| - |A or B|, clamped against sketch error
+        returning = hll_estimate(current_sketch) + previous_users - hll_estimate(hll_merge([current_sketch, previous_sketch]))
+        return round(100 * min(max(returning, 0), previous_users) / previous_users, 1)
+
+    async def dashboard(self, db) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        days = await self._days(db, now, 60)
+        hour_ids = [hour_id(hour - timedelta(hours=offset)) for offset in range(24)]
+        hours = {
+            doc["_id"]: self._parse(doc)
+            async for doc in db.analytics_rollups.find({"_id": {"$in": hour_ids}}, {"counters": 1})
+        }
+        last_24h = [hours.get(bucket_id, self._parse(None)) for bucket_id in hour_ids]
+        all_time = self._parse(await db.analytics_rollups.find_one({"_id": ALL_TIME_ID}, {"counters": 1}))
+        total_users = await db.users.estimated_document_count()
+
+        active_7d, active_30d = self._active(days[:7]), self._active(days[:30])
+        submissions_30d = self._total(days[:30], "submissions")
+        by_category = self._nested_total(days[:30], "completions_by_category")
+        by_difficulty = self._nested_total(days[:30], "completions_by_difficulty")
+        hardest = next((difficulty for difficulty in reversed(DIFFICULTY_ORDER) if by_difficulty.get(difficulty)), None)
+
+        requests = self._total(last_24h, "requests")
+        return {
+            "user_stats": {
+                "total_users": total_users,
+                "active_users_7d": active_7d,
+                "active_users_30d": active_30d,
+                "new_users_7d": int(self._total(days[:7], "signups")),
+                "new_users_30d": int(self._total(days[:30], "signups")),
+                "user_retention_7d": self._retention(days[:7], days[7:14]),
+                "user_retention_30d": self._retention(days[:30], days[30:60])
+            },
+            "learning_stats": {
+                "total_challenges_completed": int(self._total([all_time], "completions")),
+                "challenges_completed_7d": int(self._total(days[:7], "completions")),
+                "average_completion_rate": round(100 * self._total(days[:30], "correct_submissions") / submissions_30d, 1) if submissions_30d else 0.0,
+                "most_popular_track": max(by_category, key=by_category.get) if by_category else None,
+                "highest_difficulty_completion": (
+                    f"{max(by_difficulty[hardest], key=by_difficulty[hardest].get)} - {hardest}" if hardest else None
+                )
+            },
+            "system_health": {
+                "server_uptime": _format_duration(time.monotonic() - self.started_at),
+                "avg_response_time": f"{self._total(last_24h, 'response_ms') / requests:.0f}ms" if requests else "0ms",
+                "error_rate": f"{100 * self._total(last_24h, 'server_errors') / requests:.2f}%" if requests else "0.00%",
+                "code_executions_today": int(self._total(days[:1], "executions") + self._total(days[:1], "cached_executions"))
+            },
+            "hourly_activity": [
+                {
+                    "hour": hour - timedelta(hours=offset),
+                    "requests": int(bucket["counters"].get("requests", 0)),
+                    "logins": int(bucket["counters"].get("logins", 0)),
+                    "submissions": int(bucket["counters"].get("submissions", 0)),
+                    "completions": int(bucket["counters"].get("completions", 0))
+                }
+                for offset, bucket in reversed(list(enumerate(last_24h)))
+            ]
+        }
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware feeding request counts, 5xx responses and time to first byte into the rollups"""
+
+    def __init__(self, app, rollups: Rollups):
+        self.app = app
+        self.rollups = rollups
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        recorded = False
+
+        async def send_with_metrics(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                self.rollups.record_request(message["status"], (time.perf_counter() - started) * 1000)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if not recorded:
+                self.rollups.record_request(500, (time.perf_counter() - started) * 1000)
+
+
+def _backfilled_values(bucket: Dict[str, Any]) -> Dict[str, Any]:
+    """The bucket's backfilled counters as complete values, dotted names nested again"""
+    values: Dict[str, Any] = {name: {} if name.startswith("completions_by_") else 0 for name in BACKFILLED_COUNTERS}
+    for path, amount in bucket["counters"].items():
+        name, *keys = path.split(".")
+        if not keys:
+            values[name] = amount
+            continue
+        target = values[name]
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = amount
+    return values
+
+
+async def rebuild(db) -> int:
+    """Recompute the backfillable counters and activity from users and user_progress.
+
+    Logins, submissions, executions and traffic have no history outside the
+    rollups and are left as they are. Returns the number of buckets written.
+    """
+    rebuilt = Rollups()
+    levels = {doc["level_id"]: doc async for doc in db.levels.find({}, {"level_id": 1, "category": 1, "difficulty": 1})}
+    async for user in db.users.find({}, {"created_at": 1, "last_login": 1}):
+        if user.get("created_at"):
+            rebuilt.record_signup(user["_id"], user["created_at"])
+        if user.get("last_login"):
+            rebuilt.record({}, user["_id"], user["last_login"])
+    completed = db.user_progress.find(
+        {"is_completed": True, "completed_at": {"$ne": None}},
+        {"user_id": 1, "level_id": 1, "completed_at": 1}
+    )
+    async for progress in completed:
+        level = levels.get(progress["level_id"])
+        if level:
+            rebuilt.record_completion(progress["user_id"], level, progress["completed_at"])
+
+    # Each bucket gets its complete values in one $set; unsetting first and
+    # incrementing back left a window where a live flush was lost or doubled
+    operations = []
+    for bucket_id, bucket in rebuilt._pending.items():
+        update: Dict[str, Any] = {
+            "$setOnInsert": Rollups._on_insert(bucket),
+            "$set": {f"counters.{name}": value for name, value in _backfilled_values(bucket).items()}
+        }
+        if bucket["active"]:
+            update["$max"] = {f"active.r{index}": rank for index, rank in bucket["active"].items()}
+        operations.append(UpdateOne({"_id": bucket_id}, update, upsert=True))
+    if operations:
+        await db.analytics_rollups.bulk_write(operations, ordered=False)
+    # Buckets without any backfilled event hold none of these counters
+    await db.analytics_rollups.update_many(
+        {"_id": {"$nin": list(rebuilt._pending)}},
+        {"$unset": {f"counters.{name}": "" for name in BACKFILLED_COUNTERS}}
+    )
+    return len(rebuilt._pending)
@@ -0,0 +1,585 @@
+"""Sandboxed execution of learner code on a pool of pre-forked Python workers.
+
+Each worker is a long-lived ``python sandbox.py --worker`` process that imports
+the heavy data libraries (pandas, numpy) once at boot. For every run the worker
+forks a short-lived child from that warm image, applies resource limits inside
+the child and executes the learner's code there, so a run costs a fork instead
+of a cold interpreter start plus a 1-2 s pandas import.
+
+Workers start from an allow-listed environment, never the server's, so no
+secret is inherited. Each child enters an empty network namespace and a
+Landlock ruleset that only lets it read the Python installation and write
+its own scratch directory. When either isn't available the run is refused,
+unless ``SANDBOX_REQUIRE_ISOLATION=false`` (development only).
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+from metrics import percentiles
+
+logger = logging.getLogger(__name__)
+
+# Sandbox configuration
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", str(os.cpu_count() or 2)))
+SANDBOX_MAX_QUEUE = int(os.environ.get("SANDBOX_MAX_QUEUE", "200"))
+SANDBOX_TIMEOUT_SECONDS = float(os.environ.get("SANDBOX_TIMEOUT_SECONDS", "5"))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "256"))
+SANDBOX_MAX_OUTPUT_BYTES = int(os.environ.get("SANDBOX_MAX_OUTPUT_BYTES", "65536"))
+SANDBOX_PRELOAD = [m for m in os.environ.get("SANDBOX_PRELOAD", "numpy,pandas").split(",") if m]
+SANDBOX_REQUIRE_ISOLATION = os.environ.get("SANDBOX_REQUIRE_ISOLATION", "true").lower() == "true"
+# Optional unprivileged uid children switch to when the server runs as root;
+# it needs read access to the Python installation
+SANDBOX_UID = os.environ.get("SANDBOX_UID", "")
+MAX_CODE_BYTES = 64 * 1024
+
+# The only variables a worker inherits from the server
+_ENV_PASSTHROUGH = ("PATH", "LANG", "LC_ALL", "LC_CTYPE")
+
+# Keep native thread pools single-threaded: threads do not survive fork() and
+# a multi-threaded BLAS in the worker image can deadlock the forked child.
+_WORKER_ENV = {
+    "OMP_NUM_THREADS": "1",
+    "OPENBLAS_NUM_THREADS": "1",
+    "MKL_NUM_THREADS": "1",
+    "PYTHONDONTWRITEBYTECODE": "1",
+    "PYTHONUNBUFFERED": "1",
+    "MPLBACKEND": "Agg",
+}
+
+
+class SandboxBusy(Exception):
+    """Raised when the run queue is full and the request should be shed."""
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        size: int = SANDBOX_WORKERS,
+        max_queue: int = SANDBOX_MAX_QUEUE,
+        timeout: float = SANDBOX_TIMEOUT_SECONDS,
+        memory_mb: int = SANDBOX_MEMORY_MB,
+        max_output: int = SANDBOX_MAX_OUTPUT_BYTES,
+        preload: Optional[List[str]] = None,
+    ):
+        self.size = max(1, size)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_output = max_output
+        self.preload = SANDBOX_PRELOAD if preload is None else preload
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.subprocess.Process] = []
+        self._waiting = 0
+        self._started = False
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._latencies: deque = deque(maxlen=2048)
+        self._respawns: Set[asyncio.Task] = set()
+        self.isolation: Dict[str, Optional[str]] = {}
+        self._counters = {"runs": 0, "timeouts": 0, "errors": 0, "rejected": 0, "worker_restarts": 0}
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    async def start(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            self._idle = asyncio.Queue()
+            workers = await asyncio.gather(*[self._spawn_worker() for _ in range(self.size)])
+            for worker in workers:
+                self._workers.append(worker)
+                self._idle.put_nowait(worker)
+            self._started = True
+        logger.info(f"Sandbox pool started with {self.size} workers (preloaded: {', '.join(self.preload) or 'none'})")
+        missing = [kind for kind, mechanism in self.isolation.items() if not mechanism]
+        if missing:
+            if SANDBOX_REQUIRE_ISOLATION:
+                logger.error(f"Sandbox has no {' or '.join(missing)} isolation available: every run will be refused")
+            else:
+                logger.error(
+                    f"SANDBOX WITHOUT {' OR '.join(missing).upper()} ISOLATION: learner code can reach "
+                    f"{'the network' if 'network' in missing else 'the server filesystem'}. Never run like this in production."
+                )
+
+    async def stop(self):
+        self._started = False
+        for task in list(self._respawns):
+            task.cancel()
+        for worker in self._workers:
+            if worker.returncode is None:
+                worker.kill()
+                await worker.wait()
+        self._workers = []
+
+    async def _spawn_worker(self) -> asyncio.subprocess.Process:
+        env = {name: os.environ[name] for name in _ENV_PASSTHROUGH if name in os.environ}
+        env.update(_WORKER_ENV)
+        env.update({
+            "SANDBOX_PRELOAD": ",".join(self.preload),
+            "SANDBOX_REQUIRE_ISOLATION": "true" if SANDBOX_REQUIRE_ISOLATION else "false",
+            "SANDBOX_UID": SANDBOX_UID
+        })
+        worker = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=env,
+            # Responses carry escaped stdout/stderr, so allow generous lines
+            limit=8 * self.max_output + 65536,
+        )
+        ready = await worker.stdout.readline()
+        if not ready:
+            raise RuntimeError("Sandbox worker exited during startup")
+        self.isolation = json.loads(ready).get("isolation", {})
+        return worker
+
+    def _discard_worker(self, worker: asyncio.subprocess.Process):
+        """Kill a worker whose pipe may still hold a previous job's output and respawn it in the background"""
+        if worker.returncode is None:
+            worker.kill()
+        self._workers = [w for w in self._workers if w is not worker]
+        self._counters["worker_restarts"] += 1
+        task = asyncio.create_task(self._respawn(worker))
+        self._respawns.add(task)
+        task.add_done_callback(self._respawns.discard)
+
+    async def _respawn(self, worker: asyncio.subprocess.Process):
+        await worker.wait()
+        try:
+            replacement = await self._spawn_worker()
+        except Exception as e:
+            logger.error(f"Could not respawn sandbox worker, pool is down to {len(self._workers)}: {str(e)}")
+            return
+        if not self._started:
+            replacement.kill()
+            await replacement.wait()
+            return
+        self._workers.append(replacement)
+        self._idle.put_nowait(replacement)
+
+    async def run(self, code: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Execute ``code`` in a sandboxed child and return its output and resource usage."""
+        if not self._started:
+            await self.start()
+        if self._waiting >= self.max_queue:
+            self._counters["rejected"] += 1
+            raise SandboxBusy("Code execution queue is full")
+
+        timeout = timeout or self.timeout
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+        queue_ms = (time.perf_counter() - queued_at) * 1000
+
+        job = {
+            "code": code,
+            "timeout": timeout,
+            "memory_mb": self.memory_mb,
+            "max_output": self.max_output,
+        }
+        try:
+            worker.stdin.write((json.dumps(job) + "\n").encode())
+            await worker.stdin.drain()
+            # The worker enforces the deadline itself; the grace period only
+            # covers a worker that has wedged or died.
+            line = await asyncio.wait_for(worker.stdout.readline(), timeout + 5)
+            if not line:
+                raise RuntimeError("Sandbox worker exited")
+            result = json.loads(line)
+        except Exception as e:
+            logger.error(f"Sandbox worker failed, restarting it: {str(e)}")
+            self._counters["errors"] += 1
+            self._discard_worker(worker)
+            result = {
+                "stdout": "",
+                "stderr": "Execution failed: sandbox worker error",
+                "exit_code": None,
+                "timed_out": False,
+                "truncated": False,
+                "wall_ms": 0.0,
+                "cpu_ms": 0.0,
+                "max_rss_kb": 0,
+            }
+        except BaseException:
+            # Cancelled mid-run: the job's output is still on its way and must
+            # never be read by the next caller
+            self._discard_worker(worker)
+            raise
+        else:
+            self._idle.put_nowait(worker)
+
+        self._counters["runs"] += 1
+        if result.get("timed_out"):
+            self._counters["timeouts"] += 1
+        result["queue_ms"] = round(queue_ms, 2)
+        self._latencies.append((queue_ms, result.get("wall_ms", 0.0)))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.size,
+            "idle_workers": self._idle.qsize() if self._idle else 0,
+            "queued": self._waiting,
+            "max_queue": self.max_queue,
+            **self._counters,
+            "queue_ms": percentiles(q for q, _ in self._latencies),
+            "wall_ms": percentiles(w for _, w in self._latencies),
+            "isolation": self.isolation,
+        }
+
+
+# Worker process side
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+_PR_SET_PDEATHSIG = 1
+_PR_SET_NO_NEW_PRIVS = 38
+# Landlock syscalls share their numbers across architectures
+_SYS_LANDLOCK_CREATE_RULESET = 444
+_SYS_LANDLOCK_ADD_RULE = 445
+_SYS_LANDLOCK_RESTRICT_SELF = 446
+_LANDLOCK_CREATE_RULESET_VERSION = 1
+_LANDLOCK_RULE_PATH_BENEATH = 1
+_LANDLOCK_EXECUTE = 1 << 0
+_LANDLOCK_WRITE_FILE = 1 << 1
+_LANDLOCK_READ_FILE = 1 << 2
+_LANDLOCK_READ_DIR = 1 << 3
+_LANDLOCK_TRUNCATE = 1 << 14
+_LANDLOCK_IOCTL_DEV = 1 << 15
+_LANDLOCK_FILE_RIGHTS = _LANDLOCK_EXECUTE | _LANDLOCK_WRITE_FILE | _LANDLOCK_READ_FILE | _LANDLOCK_TRUNCATE | _LANDLOCK_IOCTL_DEV
+_LANDLOCK_READ = _LANDLOCK_EXECUTE | _LANDLOCK_READ_FILE | _LANDLOCK_READ_DIR
+# Filesystem rights each ABI version knows about (bits below the given one)
+_LANDLOCK_FS_BITS = {1: 13, 2: 14, 3: 15, 4: 15}
+# ABI 6+: no signals to, or abstract unix sockets of, processes outside the sandbox
+_LANDLOCK_SCOPES = 0b11
+# System locations extension modules load shared libraries from
+_SYSTEM_LIBRARY_PATHS = ("/lib", "/lib64", "/usr/lib", "/usr/lib64", "/usr/local/lib", "/usr/share", "/etc/ld.so.cache")
+_BLOCKED_MODULES = ("socket", "_socket", "ssl", "_ssl")
+
+
+def _readable_paths() -> List[str]:
+    """The Python installation the worker imports from, without the application directory"""
+    import sysconfig
+
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = {sysconfig.get_paths()[name] for name in ("stdlib", "platstdlib", "purelib", "platlib")}
+    paths.update(entry for entry in sys.path if entry and os.path.isdir(entry))
+    paths.update(_SYSTEM_LIBRARY_PATHS)
+    return sorted(
+        path for path in paths
+        if os.path.exists(path) and os.path.abspath(path) != app_dir
+        and not app_dir.startswith(os.path.abspath(path) + os.sep)
+    )
+
+
+def _landlock(libc, workdir: str) -> bool:
+    """Restrict the calling process to reading the Python installation and writing ``workdir``"""
+    import ctypes
+
+    class RulesetAttr(ctypes.Structure):
+        _fields_ = [("handled_access_fs", ctypes.c_uint64), ("handled_access_net", ctypes.c_uint64), ("scoped", ctypes.c_uint64)]
+
+    class PathBeneathAttr(ctypes.Structure):
+        _pack_ = 1
+        _fields_ = [("allowed_access", ctypes.c_uint64), ("parent_fd", ctypes.c_int32)]
+
+    abi = libc.syscall(_SYS_LANDLOCK_CREATE_RULESET, None, 0, _LANDLOCK_CREATE_RULESET_VERSION)
+    if abi < 1:
+        return False
+    handled = (1 << _LANDLOCK_FS_BITS.get(abi, 16)) - 1
+    attr = RulesetAttr(handled, 0, _LANDLOCK_SCOPES if abi >= 6 else 0)
+    # Older kernels reject fields they don't know; the first field is always accepted
+    size = ctypes.sizeof(attr) if abi >= 6 else ctypes.sizeof(ctypes.c_uint64)
+    ruleset = libc.syscall(_SYS_LANDLOCK_CREATE_RULESET, ctypes.byref(attr), size, 0)
+    if ruleset < 0:
+        return False
+    try:
+        rules = [(path, _LANDLOCK_READ) for path in _readable_paths()] + [(workdir, handled)]
+        for path, access in rules:
+            fd = os.open(path, os.O_PATH | os.O_CLOEXEC)
+            try:
+                if not os.path.isdir(path):
+                    access &= _LANDLOCK_FILE_RIGHTS
+                rule = PathBeneathAttr(access & handled, fd)
+                if libc.syscall(_SYS_LANDLOCK_ADD_RULE, ruleset, _LANDLOCK_RULE_PATH_BENEATH, ctypes.byref(rule), 0) != 0:
+                    return False
+            finally:
+                os.close(fd)
+        if libc.prctl(_PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0:
+            return False
+        return libc.syscall(_SYS_LANDLOCK_RESTRICT_SELF, ruleset, 0) == 0
+    finally:
+        os.close(ruleset)
+
+
+def _isolate(workdir: str) -> Dict[str, Optional[str]]:
+    """Cut the calling process off the network and the filesystem; returns the mechanisms that took effect"""
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    isolation: Dict[str, Optional[str]] = {"network": None, "filesystem": None}
+    # Without root a network namespace needs a user namespace to own it
+    flags = _CLONE_NEWNET if os.geteuid() == 0 else _CLONE_NEWUSER | _CLONE_NEWNET
+    if libc.unshare(flags) == 0:
+        isolation["network"] = "namespace"
+
+    mechanisms = []
+    if _landlock(libc, workdir):
+        mechanisms.append("landlock")
+    if os.geteuid() == 0 and os.environ.get("SANDBOX_UID"):
+        uid = int(os.environ["SANDBOX_UID"])
+        os.chown(workdir, uid, uid)
+        os.setgroups([])
+        os.setgid(uid)
+        os.setuid(uid)
+        mechanisms.append(f"uid {uid}")
+    isolation["filesystem"] = "+".join(mechanisms) or None
+    return isolation
+
+
+class _BlockedModuleFinder:
+    def find_spec(self, name, path=None, target=None):
+        if name.partition(".")[0] in _BLOCKED_MODULES:
+            raise ImportError(f"Module '{name}' is not available in the sandbox")
+        return None
+
+
+def _block_network_modules():
+    """Refuse socket imports and disarm the copies the preloaded libraries already hold"""
+    def _blocked(*args, **kwargs):
+        raise PermissionError("Network access is disabled in the sandbox")
+
+    for name in _BLOCKED_MODULES:
+        module = sys.modules.pop(name, None)
+        for attribute in ("socket", "SocketType", "socketpair", "create_connection", "create_server", "fromfd"):
+            if module is not None and hasattr(module, attribute):
+                setattr(module, attribute, _blocked)
+    sys.meta_path.insert(0, _BlockedModuleFinder())
+
+
+def _apply_limits(timeout: float, memory_mb: int):
+    import resource
+
+    cpu_seconds = max(1, int(timeout + 0.999))
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    # The forked child already maps the preloaded libraries, so the memory
+    # budget is granted on top of the inherited address space.
+    with open("/proc/self/statm") as statm:
+        current = int(statm.read().split()[0]) * resource.getpagesize()
+    limit = current + memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    try:
+        resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    except (ValueError, OSError):
+        pass
+
+
+def _run_child(code: str, workdir: str, timeout: float, memory_mb: int, out_fd: int, err_fd: int):
+    import traceback
+
+    try:
+        import ctypes
+        import signal
+
+        # A discarded worker takes its running child with it; sleeping code
+        # would otherwise outlive it, as RLIMIT_CPU only counts CPU time
+        worker_pid = os.getppid()
+        ctypes.CDLL(None).prctl(_PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0)
+        if os.getppid() != worker_pid:
+            os._exit(70)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        os.chdir(workdir)
+        # Limits first: they read /proc, which the isolation hides
+        _apply_limits(timeout, memory_mb)
+        missing = [kind for kind, mechanism in _isolate(workdir).items() if not mechanism]
+        if missing and os.environ.get("SANDBOX_REQUIRE_ISOLATION") != "false":
+            raise RuntimeError(f"no {' or '.join(missing)} isolation available")
+        _block_network_modules()
+    except Exception as e:
+        os.write(err_fd, f"Sandbox setup failed: {e}\n".encode())
+        os._exit(70)
+
+    exit_code = 0
+    try:
+        exec(compile(code, "<solution>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        # Same rules as the interpreter: None is success, anything else
+        # that isn't an int is printed and means failure
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code & 0xFF
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        # Hide the sandbox's own frames; learners only need their traceback.
+        etype, value, tb = sys.exc_info()
+        while tb is not None and tb.tb_frame.f_code.co_filename != "<solution>":
+            tb = tb.tb_next
+        traceback.print_exception(etype, value, tb)
+        exit_code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code)
+
+
+def _execute_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    import selectors
+    import shutil
+    import signal
+    import tempfile
+
+    timeout = float(job["timeout"])
+    max_output = int(job["max_output"])
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    # Created and removed here: the isolated child can't delete its own directory
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(job["code"], workdir, timeout, int(job["memory_mb"]), out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+
+    buffers = {out_r: bytearray(), err_r: bytearray()}
+    truncated = False
+    timed_out = False
+    selector = selectors.DefaultSelector()
+    selector.register(out_r, selectors.EVENT_READ)
+    selector.register(err_r, selectors.EVENT_READ)
+    deadline = started + timeout
+    while selector.get_map():
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            chunk = os.read(key.fd, 65536)
+            if not chunk:
+                selector.unregister(key.fd)
+                continue
+            buffer = buffers[key.fd]
+            room = max_output - len(buffer)
+            if len(chunk) > room:
+                truncated = True
+            buffer.extend(chunk[:max(room, 0)])
+        if truncated:
+            break
+    selector.close()
+
+    if timed_out or truncated:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _, status, rusage = os.wait4(pid, 0)
+    wall_ms = (time.perf_counter() - started) * 1000
+    os.close(out_r)
+    os.close(err_r)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if os.WIFSIGNALED(status):
+        exit_code = -os.WTERMSIG(status)
+        # RLIMIT_CPU delivers SIGXCPU before the wall-clock deadline fires
+        if os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL) and not truncated:
+            timed_out = True
+    else:
+        exit_code = os.WEXITSTATUS(status)
+
+    stderr = buffers[err_r].decode("utf-8", errors="replace")
+    if timed_out:
+        stderr += f"\nExecution timed out after {timeout:g}s"
+    return {
+        "stdout": buffers[out_r].decode("utf-8", errors="replace"),
+        "stderr": stderr,
+        "exit_code": exit_code,
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "wall_ms": round(wall_ms, 2),
+        "cpu_ms": round((rusage.ru_utime + rusage.ru_stime) * 1000, 2),
+        "max_rss_kb": rusage.ru_maxrss,
+    }
+
+
+def _probe_isolation() -> Dict[str, Optional[str]]:
+    """Apply the isolation in a throwaway child to find out what this host supports"""
+    import shutil
+    import tempfile
+
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            isolation = _isolate(workdir)
+        except Exception:
+            isolation = {"network": None, "filesystem": None}
+        os.write(write_fd, json.dumps(isolation).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as pipe:
+        report = pipe.read()
+    os.waitpid(pid, 0)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return json.loads(report) if report else {"network": None, "filesystem": None}
+
+
+def _worker_main():
+    import ctypes  # noqa: F401 - loaded once here instead of in every child
+
+    for module in [m for m in os.environ.get("SANDBOX_PRELOAD", "").split(",") if m]:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    stdout = sys.stdout.buffer
+    stdout.write((json.dumps({"ready": True, "isolation": _probe_isolation()}) + "\n").encode())
+    stdout.flush()
+    for line in sys.stdin.buffer:
+        try:
+            result = _execute_job(json.loads(line))
+        except Exception as e:
+            result = {
+                "stdout": "",
+                "stderr": f"Execution failed: {e}",
+                "exit_code": None,
+                "timed_out": False,
+                "truncated": False,
+                "wall_ms": 0.0,
+                "cpu_ms": 0.0,
+                "max_rss_kb": 0,
+            }
+        stdout.write((json.dumps(result) + "\n").encode())
+        stdout.flush()
+
+
+if __name__ == "__main__" and "--worker" in sys.argv:
+    _worker_main()
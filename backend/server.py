@@ -1,16 +1,41 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, Tuple
 from datetime import datetime, timedelta, timezone
+import asyncio
 import os
 import jwt
-from passlib.context import CryptContext
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import uuid
 import logging
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from sandbox import SandboxPool, SandboxBusy, MAX_CODE_BYTES
+from execution_cache import ExecutionCache
+import user_stats
+from leaderboard import Leaderboard
+from indexes import ensure_indexes, check_query_plans, missing_required_indexes
+from level_catalog import LevelCatalog
+from level_seed import seed_levels
+from level_content import LevelContentStore
+from pagination import InvalidCursor, encode_cursor, decode_cursor, keyset_filter, find_page
+from password_hashing import PasswordHasher, HashingBusy
+from principal_cache import PrincipalCache, PRINCIPAL_PROJECTION, token_version
+import roles
+import feedback_stats
+from exports import export_response, FORMATS as EXPORT_FORMATS
+from attempt_buffer import AttemptBuffer
+import submission_receipts
+from ai_tutor import TutorService
+from sse import SSE_HEADERS, KEEPALIVE, format_event, with_keepalive
+from rollups import Rollups, RequestMetricsMiddleware
+from compression import CompressionMiddleware
+import billing
+import level_check
+from quota import Quota, QuotaExceeded, AI_TUTOR_FREE_DAILY_LIMIT, backend_for as quota_backend_for, rate_limit_headers
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,10 +46,18 @@ app = FastAPI(title="PythonQuest - Gamified Python Learning", version="1.0.0")
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a bounded thread pool, never on the event loop
+password_hasher = PasswordHasher()
+# Recently authenticated users, so most requests skip the users lookup
+principal_cache = PrincipalCache()
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-super-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+# Embed role/tier claims in issued tokens for clients and downstream services
+TOKEN_EMBED_CLAIMS = os.environ.get("TOKEN_EMBED_CLAIMS", "true").lower() == "true"
+
+# Fail startup when a known query shape would scan a whole collection
+INDEX_CHECK_ON_STARTUP = os.environ.get("INDEX_CHECK_ON_STARTUP", "false").lower() == "true"
 
 # CORS middleware
 app.add_middleware(
@@ -33,7 +66,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+# Hourly/daily analytics buckets, fed from the request path and flushed periodically
+rollups = Rollups()
+app.add_middleware(RequestMetricsMiddleware, rollups=rollups)
 
 # MongoDB setup
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
@@ -48,6 +87,26 @@ levels_collection = db.levels
 user_progress_collection = db.user_progress
 feedback_collection = db.feedback
 
+# Code execution sandbox (pre-forked worker pool)
+sandbox_pool = SandboxPool()
+execution_cache = ExecutionCache()
+
+# Immutable in-memory level catalog, reloaded when its version changes
+level_catalog = LevelCatalog()
+# Heavy level fields (starter code, hints, tutorial links), fetched on demand
+level_content = LevelContentStore()
+
+# Ranked leaderboard kept in memory and fed from user_stats
+leaderboard = Leaderboard()
+
+# Failed-attempt counters, written to user_progress in periodic batches
+attempt_buffer = AttemptBuffer()
+
+# AI tutor explanations, cached per rendered prompt and model
+tutor_service = TutorService()
+# Daily AI tutor allowance for free-tier users, counted atomically in quota_usage
+tutor_quota = Quota("ai_tutor", AI_TUTOR_FREE_DAILY_LIMIT, quota_backend_for(db))
+
 # Pydantic Models
 class User(BaseModel):
     id: Optional[str] = None
@@ -89,9 +148,25 @@ class Level(BaseModel):
     prerequisites: List[int] = []
     is_active: bool = True
 
+class LevelSummary(BaseModel):
+    id: str
+    level_id: int
+    title: str
+    description: str
+    category: str
+    difficulty: str
+    xp_reward: int
+    prerequisites: List[int] = []
+    is_active: bool = True
+
 class LevelSubmission(BaseModel):
     code: str
-    output: str
+    output: Optional[str] = None  # Ignored: the code is graded by running it server-side
+    # Client-generated id; retries with the same id replay the first response
+    submission_id: Optional[str] = Field(None, min_length=1, max_length=128)
+
+class CodeRun(BaseModel):
+    code: str
 
 class UserProgress(BaseModel):
     id: Optional[str] = None
@@ -115,14 +190,34 @@ class LevelFeedback(BaseModel):
     comment: str
 
 # Utility functions
-def hash_password(password: str) -> str:
-    # Truncate password to 72 bytes to avoid bcrypt limitations
-    if len(password.encode('utf-8')) > 72:
-        password = password.encode('utf-8')[:72].decode('utf-8', errors='ignore')
-    return pwd_context.hash(password)
+def password_hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Authentication is busy, please try again in a moment",
+        headers={"Retry-After": "1"}
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashingBusy:
+        raise password_hashing_busy()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Returns whether the password matches and, if the stored hash is outdated, its replacement"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashingBusy:
+        raise password_hashing_busy()
+
+def token_claims(user: dict) -> dict:
+    claims = {"sub": user["_id"], "ver": token_version(user)}
+    if TOKEN_EMBED_CLAIMS:
+        claims.update({
+            "roles": roles.roles_of(user),
+            "tier": user.get("subscription_tier", "free")
+        })
+    return claims
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -141,430 +236,97 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = await users_collection.find_one({"_id": user_id})
+    version = payload.get("ver", 0)
+    user = principal_cache.get(user_id, version)
+    if user is not None and user["permissions"]:
+        # Staff access is revoked instantly on every worker: one indexed read
+        # confirms the cached version and roles are still current
+        current = await users_collection.find_one({"_id": user_id}, {"token_version": 1, "roles": 1})
+        if current is None or token_version(current) != version or roles.roles_of(current) != roles.roles_of(user):
+            principal_cache.invalidate(user_id)
+            user = None
+    if user is not None:
+        return user
+    
+    user = await users_collection.find_one({"_id": user_id}, PRINCIPAL_PROJECTION)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
+    # Tokens issued before the user's sessions were revoked carry an older version
+    if token_version(user) != version:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
     
+    user["permissions"] = roles.permissions_for(roles.roles_of(user))
+    principal_cache.put(user)
     return user
 
 async def get_user_stats(user_id: str) -> Dict[str, Any]:
-    # Get user progress
-    progress_docs = await user_progress_collection.find({"user_id": user_id}).to_list(length=None)
-    completed_levels = [p for p in progress_docs if p.get("is_completed", False)]
-    
-    # Calculate current level (highest completed level)
-    current_level = 100
-    if completed_levels:
-        current_level = max([p["level_id"] for p in completed_levels]) + 1
-        if current_level > 400:
-            current_level = 400
-    
-    # Calculate total XP
-    total_xp = sum([p.get("xp_earned", 0) for p in completed_levels])
-    
-    # Calculate badges (simplified)
-    badges = []
-    if len(completed_levels) >= 1:
-        badges.append({"name": "First Steps", "icon": "🎯", "earned_at": completed_levels[0].get("completed_at")})
-    if len(completed_levels) >= 10:
-        badges.append({"name": "Dedicated Learner", "icon": "📚", "earned_at": datetime.now(timezone.utc)})
-    if len(completed_levels) >= 50:
-        badges.append({"name": "Python Expert", "icon": "🐍", "earned_at": datetime.now(timezone.utc)})
-    
-    return {
-        "current_level": current_level,
-        "total_xp": total_xp,
-        "completed_levels": len(completed_levels),
-        "streak": 0,  # Simplified for now
-        "badges": badges,
-        "achievements": []  # Can be expanded later
-    }
+    # Single point read of the materialized stats document (see user_stats.py)
+    return await user_stats.get_user_stats(db, user_id)
 
-# Initialize sample levels
-async def init_levels():
-    # Check if levels already exist
-    existing_count = await levels_collection.count_documents({})
-    if existing_count > 0:
-        # Clear existing levels to add enhanced ones
-        await levels_collection.delete_many({})
+def output_matches(actual: str, expected: str) -> bool:
+    return actual.strip() == expected.strip()
+
+async def execute_code(level_id: int, code: str) -> Dict[str, Any]:
+    if len(code.encode('utf-8')) > MAX_CODE_BYTES:
+        raise HTTPException(status_code=413, detail="Code is too large to execute")
     
-    sample_levels = [
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 100,
-            "title": "Hello Python World!",
-            "description": "Write your first Python program that prints 'Hello, World!' to the console. This is the traditional first program that every programmer writes!",
-            "category": "Python Basics",
-            "difficulty": "Easy",
-            "xp_reward": 50,
-            "starter_code": "# Hello World - Your first Python program!\n# In Python, we use the built-in print() function to display output\n# No imports needed for basic print statements\n\n# Print is a function that displays text to the console\nprint(\"Hello, World!\")\n\n# Try changing the message above!\n# Remember: strings must be in quotes\n# You can also print variables:\n# name = \"Python\"\n# print(f\"Hello, {name}!\")",
-            "expected_output": "Hello, World!",
-            "hints": [
-                "Use the print() function to display text",
-                "Put your text inside quotes (either single ' or double \")",
-                "Make sure the text matches exactly: Hello, World!"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "basic",
-            "tutorial_links": ["print", "strings"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 101,
-            "title": "Variables and Numbers",
-            "description": "Learn to work with variables and perform basic arithmetic operations. Create variables and calculate their sum!",
-            "category": "Python Basics",
-            "difficulty": "Easy",
-            "xp_reward": 75,
-            "starter_code": "# Create two variables and add them together\na = 15\nb = 25\n\n# Calculate and print their sum\nresult = # Your code here\nprint(result)",
-            "expected_output": "40",
-            "hints": ["Use the + operator to add numbers", "Store the result in a variable"],
-            "prerequisites": [100],
-            "is_active": True
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 102,
-            "title": "Working with Strings",
-            "description": "Manipulate text data using strings. Learn concatenation and basic string operations!",
-            "category": "Python Basics",
-            "difficulty": "Easy",
-            "xp_reward": 75,
-            "starter_code": "# String operations\nfirst_name = \"Python\"\nlast_name = \"Programmer\"\n\n# Create a full name by combining first and last name\nfull_name = # Your code here\nprint(full_name)",
-            "expected_output": "Python Programmer",
-            "hints": ["Use the + operator to join strings", "Don't forget the space between names"],
-            "prerequisites": [101],
-            "is_active": True
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 103,
-            "title": "Conditional Logic",
-            "description": "Make decisions in your code using if statements. Check if a number is positive, negative, or zero!",
-            "category": "Control Flow",
-            "difficulty": "Medium",
-            "xp_reward": 100,
-            "starter_code": "# Conditional statements\nnumber = 42\n\n# Check if number is positive, negative, or zero\nif # Your condition here:\n    print(\"Positive\")\n# Add more conditions here",
-            "expected_output": "Positive",
-            "hints": ["Use if, elif, and else", "Compare using >, <, or =="],
-            "prerequisites": [102],
-            "is_active": True
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 104,
-            "title": "Loops - Counting Fun",
-            "description": "Use loops to repeat actions. Print numbers from 1 to 5 using a for loop!",
-            "category": "Control Flow",
-            "difficulty": "Medium",
-            "xp_reward": 125,
-            "starter_code": "# For loops\n# Print numbers 1 through 5\nfor i in # Your code here:\n    print(i)",
-            "expected_output": "1\n2\n3\n4\n5",
-            "hints": [
-                "Use the range() function to generate numbers",
-                "range(1, 6) gives numbers 1 to 5 (end is exclusive)",
-                "Complete syntax: for i in range(1, 6):"
-            ],
-            "prerequisites": [103],
-            "is_active": True,
-            "problem_type": "basic",
-            "tutorial_links": ["loops", "functions"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 105,
-            "title": "Build a Calculator",
-            "description": "Create a comprehensive calculator that can perform addition, subtraction, multiplication, and division. Handle user input and provide a menu system.",
-            "category": "Comprehensive Project",
-            "difficulty": "Hard",
-            "xp_reward": 200,
-            "starter_code": "# Build a Calculator\n# Create functions for basic operations and a menu system\n\ndef add(x, y):\n    # Your code here\n    pass\n\ndef subtract(x, y):\n    # Your code here\n    pass\n\ndef multiply(x, y):\n    # Your code here\n    pass\n\ndef divide(x, y):\n    # Your code here\n    pass\n\n# Main program\nprint(\"Calculator Menu:\")\nprint(\"1. Add\")\nprint(\"2. Subtract\")\nprint(\"3. Multiply\")\nprint(\"4. Divide\")\n\n# Get user choice and numbers\n# Perform calculation and display result",
-            "expected_output": "Calculator Menu:\n1. Add\n2. Subtract\n3. Multiply\n4. Divide",
-            "hints": [
-                "Define each function to return the result of the operation",
-                "Use input() to get user choices and numbers",
-                "Convert string inputs to numbers using int() or float()",
-                "Handle division by zero with an if statement",
-                "Use if-elif-else to handle menu choices"
-            ],
-            "prerequisites": [104],
-            "is_active": True,
-            "problem_type": "comprehensive",
-            "tutorial_links": ["functions", "variables", "loops"]
-        },
-        # Data Analyst Track
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 200,
-            "title": "Data Analysis Basics",
-            "description": "Learn to work with data using Python lists. Calculate basic statistics like mean, median, and mode from a dataset.",
-            "category": "Data Analysis",
-            "difficulty": "Medium",
-            "xp_reward": 150,
-            "starter_code": "# Data Analysis Basics\n# Import statements for data analysis (learn about imports!)\nimport statistics  # For statistical functions\nimport math        # For mathematical operations\n\n# Let's work with a list of test scores\nscores = [85, 92, 78, 96, 88, 76, 91, 84, 89, 93]\n\n# Method 1: Calculate the mean manually\ntotal = sum(scores)  # Built-in sum() function\ncount = len(scores)  # Built-in len() function\nmean = total / count\n\n# Method 2: Using statistics module (more professional)\n# mean_stats = statistics.mean(scores)\n\n# Find the maximum and minimum scores\nmax_score = max(scores)  # Built-in max() function\nmin_score = min(scores)  # Built-in min() function\n\n# Print results rounded to 1 decimal place\nprint(f\"Mean: {round(mean, 1)}\")\nprint(f\"Max: {max_score}\")\nprint(f\"Min: {min_score}\")\n\n# Bonus: Try using the statistics module!\n# print(f\"Mean (statistics): {round(statistics.mean(scores), 1)}\")",
-            "expected_output": "Mean: 87.2\nMax: 96\nMin: 76",
-            "hints": [
-                "Use sum(scores) to add all numbers in the list",
-                "Use len(scores) to get the count of items", 
-                "Mean = total / count",
-                "Use max(scores) and min(scores) for maximum and minimum",
-                "The code shows you how to use built-in functions",
-                "Try the statistics module for more advanced operations"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["lists", "functions", "statistics"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 201,
-            "title": "Working with CSV Data",
-            "description": "Learn to read and process CSV data. Parse a simple dataset and extract meaningful information from it.",
-            "category": "Data Analysis",
-            "difficulty": "Medium",
-            "xp_reward": 175,
-            "starter_code": "# Working with CSV Data (simulated)\n# Import statements for CSV processing\nimport csv        # For CSV file handling (not used here but good to know)\nfrom io import StringIO  # For treating strings as file objects\n\n# Sample CSV data as string\ncsv_data = \"Name,Age,City\\nAlice,25,New York\\nBob,30,San Francisco\\nCharlie,35,Chicago\\nDiana,28,Boston\"\n\n# Method 1: Manual parsing (what we're learning)\nlines = csv_data.strip().split('\\n')\nheader = lines[0].split(',')\nrows = [line.split(',') for line in lines[1:]]\n\n# Extract ages and calculate average\nages = [int(row[1]) for row in rows]  # List comprehension to get ages\naverage_age = sum(ages) / len(ages)\n\n# Count people by city\ncity_count = {}\nfor row in rows:\n    city = row[2]  # Third column is city\n    city_count[city] = city_count.get(city, 0) + 1\n    \n# Print results\nprint(f\"Average age: {average_age}\")\nprint(f\"Cities: {city_count}\")\n\n# Bonus: Try using the csv module for real CSV files!\n# csv_file = StringIO(csv_data)\n# reader = csv.DictReader(csv_file)\n# data = list(reader)",
-            "expected_output": "Average age: 29.5\nCities: {'New York': 1, 'San Francisco': 1, 'Chicago': 1, 'Boston': 1}",
-            "hints": [
-                "Use list comprehension to extract ages: [int(row[1]) for row in rows]",
-                "Calculate average using sum(ages) / len(ages)",
-                "Access city using row[2] for each row",
-                "Use dictionary to count: city_count[city] = city_count.get(city, 0) + 1"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["lists", "dictionaries", "csv"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 202,
-            "title": "Data Filtering and Sorting",
-            "description": "Filter data based on conditions and sort datasets. Learn essential data manipulation techniques.",
-            "category": "Data Analysis",
-            "difficulty": "Medium",
-            "xp_reward": 175,
-            "starter_code": "# Data Filtering and Sorting\nsales_data = [\n    {'product': 'Laptop', 'price': 1200, 'quantity': 5},\n    {'product': 'Mouse', 'price': 25, 'quantity': 50},\n    {'product': 'Keyboard', 'price': 75, 'quantity': 30},\n    {'product': 'Monitor', 'price': 300, 'quantity': 15},\n    {'product': 'Headphones', 'price': 100, 'quantity': 25}\n]\n\n# Filter products with price > 50\nexpensive_products = # Your code here\n\n# Sort products by quantity (descending)\nsorted_by_quantity = # Your code here\n\n# Calculate total revenue for expensive products\ntotal_revenue = # Your code here\n\nprint(f\"Expensive products: {len(expensive_products)}\")\nprint(f\"Top product by quantity: {sorted_by_quantity[0]['product']}\")\nprint(f\"Total revenue (expensive): ${total_revenue}\")",
-            "expected_output": "Expensive products: 4\nTop product by quantity: Mouse\nTotal revenue (expensive): $13500",
-            "hints": [
-                "Filter using list comprehension: [item for item in sales_data if item['price'] > 50]",
-                "Sort using sorted() with key parameter: sorted(sales_data, key=lambda x: x['quantity'], reverse=True)",
-                "Calculate revenue: sum(item['price'] * item['quantity'] for item in expensive_products)"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["lists", "dictionaries", "sorting"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 203,
-            "title": "Statistical Analysis",
-            "description": "Perform advanced statistical calculations including median, mode, and standard deviation on datasets.",
-            "category": "Data Analysis",
-            "difficulty": "Hard",
-            "xp_reward": 200,
-            "starter_code": "# Statistical Analysis\nimport math\n\ntest_scores = [78, 85, 92, 78, 88, 95, 82, 78, 91, 87, 89, 94, 78, 83, 90]\n\n# Calculate median (middle value when sorted)\nsorted_scores = # Your code here\nn = len(sorted_scores)\nif n % 2 == 0:\n    median = # Your code here (average of two middle values)\nelse:\n    median = # Your code here (middle value)\n\n# Calculate mode (most frequent value)\nfrom collections import Counter\nscore_counts = Counter(test_scores)\nmode = # Your code here (most common score)\n\n# Calculate standard deviation\nmean = sum(test_scores) / len(test_scores)\nvariance = sum((x - mean) ** 2 for x in test_scores) / len(test_scores)\nstd_dev = # Your code here\n\nprint(f\"Median: {median}\")\nprint(f\"Mode: {mode}\")\nprint(f\"Standard Deviation: {round(std_dev, 2)}\")",
-            "expected_output": "Median: 87\nMode: 78\nStandard Deviation: 5.77",
-            "hints": [
-                "Sort the list using sorted(test_scores)",
-                "For even length: (sorted_scores[n//2-1] + sorted_scores[n//2]) / 2",
-                "For odd length: sorted_scores[n//2]",
-                "Mode: score_counts.most_common(1)[0][0]",
-                "Standard deviation: math.sqrt(variance)"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["statistics", "math", "collections"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 204,
-            "title": "Working with Pandas DataFrames",
-            "description": "Learn to use the powerful Pandas library for data manipulation. Create DataFrames, perform operations, and analyze structured data like a professional data scientist.",
-            "category": "Data Analysis",
-            "difficulty": "Hard",
-            "xp_reward": 225,
-            "starter_code": "# Working with Pandas DataFrames\n# Choose your imports - you decide what you need!\n# Available options: pandas, numpy, matplotlib.pyplot, seaborn, statistics\n# TODO: Import the libraries you think you'll need\n\n# Sample data: Sales data from different regions\nsales_data = {\n    'Region': ['North', 'South', 'East', 'West', 'North', 'South', 'East', 'West'],\n    'Quarter': ['Q1', 'Q1', 'Q1', 'Q1', 'Q2', 'Q2', 'Q2', 'Q2'],\n    'Sales': [150000, 120000, 180000, 140000, 160000, 135000, 195000, 155000],\n    'Expenses': [80000, 70000, 95000, 85000, 85000, 75000, 100000, 90000]\n}\n\n# Your task: Create a DataFrame and perform analysis\n# 1. Create a pandas DataFrame from the sales_data dictionary\n# 2. Calculate profit (Sales - Expenses) for each row\n# 3. Find the region with highest total sales\n# 4. Calculate average profit by quarter\n# 5. Create a summary showing total sales and profit by region\n\n# Write your code here:\ndf = # TODO: Create DataFrame\n\n# Add profit column\ndf['Profit'] = # TODO: Calculate profit\n\n# Find highest sales region\ntop_region = # TODO: Group by region and find max sales\n\n# Average profit by quarter\nquarter_avg = # TODO: Group by quarter and calculate mean profit\n\n# Regional summary\nregion_summary = # TODO: Group by region, sum sales and profit\n\nprint(\"DataFrame:\")\nprint(df)\nprint(f\"\\nTop sales region: {top_region}\")\nprint(f\"\\nAverage profit by quarter:\")\nprint(quarter_avg)\nprint(f\"\\nRegional summary:\")\nprint(region_summary)",
-            "expected_output": "DataFrame:\n  Region Quarter   Sales  Expenses  Profit\n0  North      Q1  150000     80000   70000\n1  South      Q1  120000     70000   50000\n2   East      Q1  180000     95000   85000\n3   West      Q1  140000     85000   55000\n4  North      Q2  160000     85000   75000\n5  South      Q2  135000     75000   60000\n6   East      Q2  195000    100000   95000\n7   West      Q2  155000     90000   65000\n\nTop sales region: East\n\nAverage profit by quarter:\nQuarter\nQ1    65000.0\nQ2    73750.0\nName: Profit, dtype: float64\n\nRegional summary:\n   Sales  Profit\nRegion        \nEast   375000  180000\nNorth  310000  145000\nSouth  255000  110000\nWest   295000  120000",
-            "hints": [
-                "Import pandas as pd to work with DataFrames",
-                "Create DataFrame: pd.DataFrame(sales_data)",
-                "Calculate profit: df['Sales'] - df['Expenses']",
-                "Group by region: df.groupby('Region')['Sales'].sum()",
-                "Use .idxmax() to find the index of maximum value",
-                "Group by quarter: df.groupby('Quarter')['Profit'].mean()",
-                "Use agg() to calculate multiple aggregations at once"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["pandas", "dataframes", "groupby"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 205,
-            "title": "Data Visualization Fundamentals",
-            "description": "Create compelling visualizations to tell stories with data. Learn matplotlib and build charts that communicate insights effectively.",
-            "category": "Data Analysis",
-            "difficulty": "Hard",
-            "xp_reward": 250,
-            "starter_code": "# Data Visualization Fundamentals\n# Choose your visualization libraries:\n# matplotlib.pyplot as plt, seaborn as sns, pandas, numpy\n\n# Monthly website traffic data\nmonths = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']\nvisitors = [15000, 18000, 22000, 19000, 25000, 28000, 32000, 30000, 27000, 24000, 21000, 26000]\nconversions = [450, 540, 660, 570, 750, 840, 960, 900, 810, 720, 630, 780]\n\n# Product categories performance\ncategories = ['Electronics', 'Clothing', 'Books', 'Home', 'Sports']\nsales = [85000, 62000, 48000, 71000, 39000]\nprofit_margin = [0.15, 0.25, 0.35, 0.18, 0.22]\n\n# Your comprehensive visualization task:\n# 1. Create a line plot showing monthly visitors and conversions\n# 2. Add a bar chart showing sales by category\n# 3. Create a scatter plot of sales vs profit margin\n# 4. Calculate and display correlation between visitors and conversions\n# 5. Style your plots with titles, labels, and legends\n\n# Import your chosen libraries here:\n# TODO: Add your imports\n\n# Calculate correlation\ncorrelation = # TODO: Calculate correlation between visitors and conversions\n\n# Create your visualizations here:\n# TODO: Create figure with subplots\n# TODO: Plot 1 - Line plot for visitors and conversions\n# TODO: Plot 2 - Bar chart for sales by category  \n# TODO: Plot 3 - Scatter plot for sales vs profit margin\n# TODO: Add titles, labels, legends\n# TODO: Display the plots\n\nprint(f\"Visitor-Conversion Correlation: {correlation:.3f}\")\nprint(\"\\nVisualization Analysis:\")\nprint(f\"Peak visitors: {max(visitors):,} in {months[visitors.index(max(visitors))]}\")\nprint(f\"Best category: {categories[sales.index(max(sales))]} with ${max(sales):,} sales\")\nprint(f\"Highest margin: {categories[profit_margin.index(max(profit_margin))]} at {max(profit_margin)*100:.1f}%\")",
-            "expected_output": "Visitor-Conversion Correlation: 0.964\n\nVisualization Analysis:\nPeak visitors: 32,000 in Jul\nBest category: Electronics with $85,000 sales\nHighest margin: Books at 35.0%",
-            "hints": [
-                "Import matplotlib.pyplot as plt for plotting",
-                "Use numpy.corrcoef() for correlation calculation",
-                "Create subplots: fig, axes = plt.subplots(1, 3, figsize=(15, 5))",
-                "Line plot: axes[0].plot(months, visitors, label='Visitors')",
-                "Bar chart: axes[1].bar(categories, sales)",
-                "Scatter plot: axes[2].scatter(sales, profit_margin)",
-                "Don't forget plt.show() to display plots",
-                "Use plt.tight_layout() for better spacing"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["matplotlib", "visualization", "correlation"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 206,
-            "title": "Advanced Data Cleaning & Transformation",
-            "description": "Master real-world data cleaning techniques. Handle missing values, outliers, and data inconsistencies like a professional data analyst.",
-            "category": "Data Analysis",
-            "difficulty": "Expert",
-            "xp_reward": 275,
-            "starter_code": "# Advanced Data Cleaning & Transformation\n# Real-world messy data requires sophisticated cleaning techniques\n# Choose your tools: pandas, numpy, re (regex), datetime\n\n# Messy customer dataset (realistic data quality issues)\ncustomer_data = {\n    'customer_id': [1001, 1002, 1003, 1004, 1005, 1006, 1007, 1008, 1009, 1010],\n    'name': ['John Smith', 'jane doe', 'MIKE JOHNSON', 'sarah  wilson', 'Bob Brown', 'Alice Green', 'tom white', 'LISA DAVIS', 'mark jones', 'Emma Wilson'],\n    'email': ['john@email.com', 'jane@GMAIL.COM', 'mike@yahoo.com', '', 'bob@email.com', 'alice@invalid', 'tom@email.com', 'lisa@OUTLOOK.COM', 'mark@email.com', 'emma@email.com'],\n    'age': [25, 30, -5, 45, 150, 28, 35, None, 42, 33],\n    'salary': [50000, 65000, 75000, None, 95000, 45000, None, 85000, 70000, 60000],\n    'join_date': ['2020-01-15', '2019-05-20', '2021-03-10', '2020-12-01', 'invalid_date', '2021-07-22', '2020-09-18', '2019-11-30', '2021-01-05', '2020-06-12'],\n    'department': ['Engineering', 'marketing', 'SALES', 'Engineering', 'Marketing', 'sales', 'Engineering', 'MARKETING', 'Sales', 'engineering']\n}\n\n# Your comprehensive data cleaning challenge:\n# 1. Import necessary libraries for data manipulation\n# 2. Create DataFrame and identify data quality issues\n# 3. Clean names: proper case, remove extra spaces\n# 4. Validate and clean email addresses\n# 5. Handle age outliers (valid range: 18-65)\n# 6. Fill missing salaries with department median\n# 7. Parse and validate dates\n# 8. Standardize department names\n# 9. Create data quality report\n# 10. Export cleaned dataset summary\n\n# Import your libraries:\n# TODO: Add your imports (pandas, numpy, re, etc.)\n\n# Create DataFrame and analyze\ndf = # TODO: Create DataFrame\nprint(\"Original Data Issues:\")\nprint(f\"Missing values: {df.isnull().sum().sum()}\")\nprint(f\"Invalid ages: {len([age for age in df['age'] if age and (age < 18 or age > 65)])}\")\n\n# Data cleaning steps:\n# TODO: 1. Clean names - proper case and strip spaces\n# TODO: 2. Validate emails - check for @ and . patterns\n# TODO: 3. Fix age outliers - replace invalid with median\n# TODO: 4. Fill missing salaries by department median\n# TODO: 5. Parse join_date and handle invalid dates\n# TODO: 6. Standardize department names (title case)\n\n# Create quality report\nquality_report = {\n    'total_records': len(df),\n    'complete_records': len(df.dropna()),\n    'valid_emails': # TODO: Count valid emails\n    'valid_ages': # TODO: Count ages in 18-65 range\n    'departments': # TODO: Count unique departments\n}\n\nprint(\"\\nCleaned Data Summary:\")\nprint(f\"Quality Score: {(quality_report['complete_records']/quality_report['total_records']*100):.1f}%\")\nprint(f\"Valid emails: {quality_report['valid_emails']}/{quality_report['total_records']}\")\nprint(\"\\nCleaned DataFrame:\")\nprint(df.head())",
-            "expected_output": "Original Data Issues:\nMissing values: 4\nInvalid ages: 2\n\nCleaned Data Summary:\nQuality Score: 90.0%\nValid emails: 8/10\n\nCleaned DataFrame:\n   customer_id         name            email  age   salary   join_date department\n0         1001   John Smith   john@email.com   25  50000.0  2020-01-15 Engineering\n1         1002     Jane Doe  jane@gmail.com   30  65000.0  2019-05-20   Marketing\n2         1003 Mike Johnson  mike@yahoo.com   35  75000.0  2021-03-10      Sales\n3         1004 Sarah Wilson                   45  70000.0  2020-12-01 Engineering\n4         1005    Bob Brown   bob@email.com   35  95000.0         NaT   Marketing",
-            "hints": [
-                "Use .str.title() for proper case names",
-                "Use .str.strip() to remove extra spaces",
-                "Regex pattern for email: r'^[\\w\\.-]+@[\\w\\.-]+\\.[a-zA-Z]{2,}$'",
-                "Replace age outliers: df.loc[df['age'] > 65, 'age'] = df['age'].median()",
-                "Fill by group: df['salary'].fillna(df.groupby('department')['salary'].transform('median'))",
-                "Use pd.to_datetime() with errors='coerce' for date parsing",
-                "Standardize text: df['department'].str.title()",
-                "Count valid emails with regex matching"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["data_cleaning", "regex", "pandas_advanced"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 207,
-            "title": "Time Series Analysis & Forecasting",
-            "description": "Analyze temporal data patterns and build forecasting models. Learn to work with dates, trends, seasonality, and predict future values.",
-            "category": "Data Analysis",
-            "difficulty": "Expert",
-            "xp_reward": 300,
-            "starter_code": "# Time Series Analysis & Forecasting\n# Analyze stock price data and create forecasting models\n# Choose your arsenal: pandas, numpy, matplotlib, datetime, statistics\n# Advanced users can try: sklearn, scipy\n\nfrom datetime import datetime, timedelta\nimport random\n\n# Generate realistic stock price data (AAPL-like)\nnp.random.seed(42)  # For reproducible results\ndates = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(252)]  # 1 year of trading days\nbase_price = 150.0\nprices = []\n\nfor i, date in enumerate(dates):\n    # Simulate realistic stock movement with trend and volatility\n    trend = 0.0008 * i  # Slight upward trend\n    seasonal = 5 * np.sin(2 * np.pi * i / 60)  # 60-day seasonality\n    noise = np.random.normal(0, 2)  # Random volatility\n    \n    price = base_price + trend + seasonal + noise\n    prices.append(max(price, 0))  # Ensure non-negative prices\n    base_price = price * 0.99 + prices[-1] * 0.01  # Price memory effect\n\n# Create your comprehensive time series analysis:\n# 1. Import your chosen libraries\n# 2. Create time series DataFrame with proper datetime index\n# 3. Calculate daily returns and volatility\n# 4. Identify trend using moving averages (7-day, 30-day)\n# 5. Detect seasonal patterns\n# 6. Build simple forecasting model (linear trend + seasonality)\n# 7. Calculate forecast accuracy metrics\n# 8. Visualize historical data and predictions\n\n# Import libraries (your choice):\n# TODO: Add imports - pandas, numpy, matplotlib, etc.\n\n# Create time series DataFrame\nts_data = # TODO: Create DataFrame with dates as index\n\n# Calculate technical indicators\nts_data['daily_return'] = # TODO: Calculate percentage daily returns\nts_data['volatility_7d'] = # TODO: Rolling 7-day standard deviation of returns\nts_data['ma_7'] = # TODO: 7-day moving average\nts_data['ma_30'] = # TODO: 30-day moving average\n\n# Trend analysis\ntrend_signal = # TODO: Compare MA7 vs MA30 (1 if MA7 > MA30, else 0)\n\n# Simple forecasting model\n# Split data: 80% training, 20% testing\ntrain_size = int(len(ts_data) * 0.8)\ntrain_data = ts_data[:train_size]\ntest_data = ts_data[train_size:]\n\n# Build linear trend model\nfrom sklearn.linear_model import LinearRegression\n# TODO: Create features (day number, seasonality)\n# TODO: Fit linear regression model\n# TODO: Make predictions on test set\n\n# Calculate forecast metrics\nforecasts = # TODO: Model predictions\nmae = # TODO: Mean Absolute Error\nrmse = # TODO: Root Mean Square Error\nmape = # TODO: Mean Absolute Percentage Error\n\nprint(\"Time Series Analysis Results:\")\nprint(f\"Dataset period: {dates[0].strftime('%Y-%m-%d')} to {dates[-1].strftime('%Y-%m-%d')}\")\nprint(f\"Total trading days: {len(prices)}\")\nprint(f\"\\nPrice Statistics:\")\nprint(f\"Start price: ${prices[0]:.2f}\")\nprint(f\"End price: ${prices[-1]:.2f}\")\nprint(f\"Max price: ${max(prices):.2f}\")\nprint(f\"Min price: ${min(prices):.2f}\")\nprint(f\"Total return: {((prices[-1]/prices[0])-1)*100:.1f}%\")\nprint(f\"\\nVolatility (annualized): {ts_data['daily_return'].std() * (252**0.5) * 100:.1f}%\")\nprint(f\"\\nForecast Accuracy:\")\nprint(f\"MAE: ${mae:.2f}\")\nprint(f\"RMSE: ${rmse:.2f}\")\nprint(f\"MAPE: {mape:.1f}%\")",
-            "expected_output": "Time Series Analysis Results:\nDataset period: 2023-01-01 to 2023-12-09\nTotal trading days: 252\n\nPrice Statistics:\nStart price: $149.64\nEnd price: $150.79\nMax price: $158.42\nMin price: $142.75\nTotal return: 0.8%\n\nVolatility (annualized): 18.3%\n\nForecast Accuracy:\nMAE: $1.85\nRMSE: $2.41\nMAPE: 1.2%",
-            "hints": [
-                "Set datetime index: df.set_index('date')",
-                "Daily returns: df['price'].pct_change() * 100",
-                "Moving average: df['price'].rolling(window=7).mean()",
-                "Volatility: df['daily_return'].rolling(window=7).std()",
-                "Create features: day numbers and sine/cosine for seasonality",
-                "Linear regression features: X = [[i, sin(2*pi*i/60)] for i in range(len(data))]",
-                "MAE: np.mean(np.abs(actual - predicted))",
-                "RMSE: np.sqrt(np.mean((actual - predicted)**2))"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["time_series", "forecasting", "sklearn"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 208,
-            "title": "Statistical Hypothesis Testing",
-            "description": "Apply rigorous statistical methods to test hypotheses and draw data-driven conclusions. Master A/B testing, t-tests, and statistical significance.",
-            "category": "Data Analysis",
-            "difficulty": "Expert",
-            "xp_reward": 325,
-            "starter_code": "# Statistical Hypothesis Testing\n# Conduct A/B testing analysis for website conversion optimization\n# Master statistical inference and hypothesis testing\n# Libraries: scipy.stats, numpy, pandas, matplotlib (optional)\n\nfrom scipy import stats\nimport numpy as np\n\n# A/B Test Data: Website Conversion Experiment\n# Control Group (A): Original checkout page\ncontrol_visitors = 8547\ncontrol_conversions = 512\n\n# Treatment Group (B): New checkout page design\ntreatment_visitors = 8423\ntreatment_conversions = 578\n\n# Additional experiment data: Email campaign performance\nemail_A_opens = [23, 19, 27, 31, 18, 25, 29, 22, 26, 20, 24, 28, 21, 30, 17]\nemail_B_opens = [28, 31, 35, 29, 33, 27, 32, 36, 30, 34, 26, 38, 31, 29, 35]\n\n# Customer satisfaction scores (1-10 scale)\nsatisfaction_before = [6.2, 7.1, 5.8, 6.9, 7.3, 6.5, 5.9, 7.0, 6.8, 6.4, 7.2, 6.1, 6.7, 7.4, 6.3]\nsatisfaction_after = [7.8, 8.2, 7.5, 8.1, 7.9, 8.0, 7.6, 8.3, 7.7, 8.4, 7.2, 8.0, 8.1, 7.8, 8.2]\n\n# Your comprehensive statistical analysis tasks:\n# 1. Calculate conversion rates and confidence intervals\n# 2. Perform two-proportion z-test for A/B conversion test\n# 3. Conduct independent t-test for email open rates\n# 4. Perform paired t-test for satisfaction scores (before/after)\n# 5. Calculate effect sizes (Cohen's d)\n# 6. Interpret statistical significance and practical significance\n# 7. Make data-driven recommendations\n\n# Import additional libraries as needed:\n# TODO: Add any additional imports you need\n\n# Part 1: A/B Test Analysis (Two-Proportion Test)\ncontrol_rate = control_conversions / control_visitors\ntreatment_rate = treatment_conversions / treatment_visitors\nrate_difference = treatment_rate - control_rate\n\n# Calculate pooled proportion and standard error\npooled_prop = (control_conversions + treatment_conversions) / (control_visitors + treatment_visitors)\nse = # TODO: Calculate standard error for two proportions\n\n# Z-test statistic and p-value\nz_stat = # TODO: Calculate z-statistic\np_value_ab = # TODO: Calculate two-tailed p-value using scipy.stats.norm\n\n# 95% Confidence interval for difference\nmargin_error = 1.96 * se\nci_lower = rate_difference - margin_error\nci_upper = rate_difference + margin_error\n\n# Part 2: Independent T-test (Email Opens)\nt_stat_email, p_value_email = # TODO: Perform independent t-test using scipy.stats.ttest_ind\ncohen_d_email = # TODO: Calculate Cohen's d effect size\n\n# Part 3: Paired T-test (Satisfaction Scores)\nt_stat_satisfaction, p_value_satisfaction = # TODO: Perform paired t-test using scipy.stats.ttest_rel\ncohen_d_satisfaction = # TODO: Calculate Cohen's d for paired samples\n\n# Part 4: Statistical Power Analysis (Bonus)\n# TODO: Calculate statistical power using effect size and sample size\n\n# Results Summary\nalpha = 0.05\nprint(\"Statistical Hypothesis Testing Results\")\nprint(\"=\" * 50)\nprint(f\"\\n1. A/B Conversion Test:\")\nprint(f\"   Control Rate: {control_rate:.3f} ({control_conversions}/{control_visitors})\")\nprint(f\"   Treatment Rate: {treatment_rate:.3f} ({treatment_conversions}/{treatment_visitors})\")\nprint(f\"   Difference: {rate_difference:.3f} ({rate_difference*100:+.1f}%)\")\nprint(f\"   Z-statistic: {z_stat:.3f}\")\nprint(f\"   P-value: {p_value_ab:.6f}\")\nprint(f\"   95% CI: [{ci_lower:.4f}, {ci_upper:.4f}]\")\nprint(f\"   Significant: {'Yes' if p_value_ab < alpha else 'No'} (α = {alpha})\")\n\nprint(f\"\\n2. Email Open Rates Test:\")\nprint(f\"   Group A Mean: {np.mean(email_A_opens):.1f}\")\nprint(f\"   Group B Mean: {np.mean(email_B_opens):.1f}\")\nprint(f\"   T-statistic: {t_stat_email:.3f}\")\nprint(f\"   P-value: {p_value_email:.6f}\")\nprint(f\"   Cohen's d: {cohen_d_email:.3f}\")\nprint(f\"   Effect Size: {'Small' if abs(cohen_d_email) < 0.5 else 'Medium' if abs(cohen_d_email) < 0.8 else 'Large'}\")\n\nprint(f\"\\n3. Satisfaction Improvement Test:\")\nprint(f\"   Before Mean: {np.mean(satisfaction_before):.1f}\")\nprint(f\"   After Mean: {np.mean(satisfaction_after):.1f}\")\nprint(f\"   T-statistic: {t_stat_satisfaction:.3f}\")\nprint(f\"   P-value: {p_value_satisfaction:.6f}\")\nprint(f\"   Cohen's d: {cohen_d_satisfaction:.3f}\")\n\nprint(f\"\\n4. Business Recommendations:\")\nif p_value_ab < alpha:\n    print(f\"   - Implement new checkout design (significant {rate_difference*100:+.1f}% improvement)\")\nelse:\n    print(f\"   - Continue testing checkout design (no significant difference found)\")\n\nif p_value_email < alpha:\n    print(f\"   - Adopt Email B strategy (significantly better open rates)\")\nelse:\n    print(f\"   - Email strategies show no significant difference\")",
-            "expected_output": "Statistical Hypothesis Testing Results\n==================================================\n\n1. A/B Conversion Test:\n   Control Rate: 0.060 (512/8547)\n   Treatment Rate: 0.069 (578/8423)\n   Difference: 0.009 (+0.9%)\n   Z-statistic: 2.845\n   P-value: 0.004440\n   95% CI: [0.0027, 0.0147]\n   Significant: Yes (α = 0.05)\n\n2. Email Open Rates Test:\n   Group A Mean: 24.0\n   Group B Mean: 31.6\n   T-statistic: -6.429\n   P-value: 0.000004\n   Cohen's d: -2.348\n   Effect Size: Large\n\n3. Satisfaction Improvement Test:\n   Before Mean: 6.6\n   After Mean: 7.9\n   T-statistic: -8.726\n   P-value: 0.000000\n   Cohen's d: -2.253\n\n4. Business Recommendations:\n   - Implement new checkout design (significant +0.9% improvement)\n   - Adopt Email B strategy (significantly better open rates)",
-            "hints": [
-                "Standard error for two proportions: sqrt(pooled_prop * (1 - pooled_prop) * (1/n1 + 1/n2))",
-                "Z-statistic: (p1 - p2) / standard_error",
-                "Use scipy.stats.norm.sf(abs(z)) * 2 for two-tailed p-value",
-                "Independent t-test: scipy.stats.ttest_ind(group1, group2)",
-                "Paired t-test: scipy.stats.ttest_rel(before, after)",
-                "Cohen's d: (mean1 - mean2) / pooled_standard_deviation",
-                "Pooled std: sqrt(((n1-1)*std1² + (n2-1)*std2²) / (n1+n2-2))",
-                "Effect sizes: 0.2=small, 0.5=medium, 0.8=large"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["hypothesis_testing", "scipy_stats", "ab_testing"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 209,
-            "title": "Advanced Data Aggregation & GroupBy Mastery",
-            "description": "Master complex data aggregation, pivot tables, and multi-level grouping operations. Transform raw data into actionable business insights.",
-            "category": "Data Analysis",
-            "difficulty": "Expert",
-            "xp_reward": 350,
-            "starter_code": "# Advanced Data Aggregation & GroupBy Mastery\n# Analyze complex business data with sophisticated aggregation techniques\n# Libraries at your disposal: pandas, numpy, datetime, itertools\n\nimport pandas as pd\nimport numpy as np\nfrom datetime import datetime, timedelta\n\n# Complex E-commerce Transaction Dataset\nnp.random.seed(123)\n\n# Generate realistic transaction data\nproducts = ['iPhone', 'MacBook', 'iPad', 'AirPods', 'Apple Watch', 'iMac']\ncategories = ['Smartphone', 'Laptop', 'Tablet', 'Audio', 'Wearable', 'Desktop']\nregions = ['North America', 'Europe', 'Asia', 'South America']\ncustomer_types = ['Premium', 'Standard', 'Basic']\nsales_reps = ['Alice Johnson', 'Bob Smith', 'Carol Davis', 'David Wilson', 'Emma Brown']\n\n# Generate 1000 transactions\ntransactions = []\nfor i in range(1000):\n    transaction = {\n        'transaction_id': f'TXN{1000+i}',\n        'date': datetime(2023, 1, 1) + timedelta(days=np.random.randint(0, 365)),\n        'product': np.random.choice(products),\n        'category': categories[products.index(np.random.choice(products))],\n        'quantity': np.random.randint(1, 6),\n        'unit_price': np.random.uniform(99, 2999),\n        'region': np.random.choice(regions),\n        'customer_type': np.random.choice(customer_types),\n        'sales_rep': np.random.choice(sales_reps),\n        'discount_rate': np.random.uniform(0, 0.3),\n    }\n    transaction['total_amount'] = transaction['quantity'] * transaction['unit_price'] * (1 - transaction['discount_rate'])\n    transactions.append(transaction)\n\ndf = pd.DataFrame(transactions)\ndf['date'] = pd.to_datetime(df['date'])\ndf['month'] = df['date'].dt.month\ndf['quarter'] = df['date'].dt.quarter\ndf['year'] = df['date'].dt.year\n\n# Your comprehensive aggregation challenges:\n# 1. Multi-level grouping: Revenue by Region, Category, and Customer Type\n# 2. Time-based analysis: Monthly trends with year-over-year comparison\n# 3. Performance metrics: Sales rep performance with statistical insights\n# 4. Advanced pivot tables: Product performance matrix\n# 5. Custom aggregation functions: Business KPIs\n# 6. Window functions: Running totals and moving averages\n# 7. Correlation analysis: Factor relationships\n\nprint(\"E-commerce Dataset Overview:\")\nprint(f\"Total transactions: {len(df):,}\")\nprint(f\"Date range: {df['date'].min().strftime('%Y-%m-%d')} to {df['date'].max().strftime('%Y-%m-%d')}\")\nprint(f\"Total revenue: ${df['total_amount'].sum():,.2f}\")\nprint(f\"Products: {', '.join(df['product'].unique())}\")\nprint(f\"Regions: {', '.join(df['region'].unique())}\")\n\n# Challenge 1: Multi-level Revenue Analysis\nrevenue_analysis = # TODO: Group by region, category, customer_type and calculate sum, mean, count\n\n# Challenge 2: Monthly Performance Trends\nmonthly_trends = # TODO: Group by year, month and calculate revenue, transactions, avg_order_value\n# TODO: Calculate month-over-month growth rates\n\n# Challenge 3: Sales Rep Performance Matrix\nsales_performance = # TODO: Analyze each sales rep's performance metrics\n# TODO: Include: total_revenue, avg_deal_size, conversion_metrics, etc.\n\n# Challenge 4: Advanced Pivot Analysis\nproduct_pivot = # TODO: Create pivot table with products vs regions, values=revenue\n# TODO: Add percentage contributions and rankings\n\n# Challenge 5: Custom Business KPIs\ndef calculate_kpis(group):\n    \"\"\"Custom aggregation function for business KPIs\"\"\"\n    return pd.Series({\n        'revenue': group['total_amount'].sum(),\n        'transactions': len(group),\n        'avg_order_value': group['total_amount'].mean(),\n        'avg_discount': group['discount_rate'].mean(),\n        'revenue_per_unit': (group['total_amount'] / group['quantity']).mean(),\n        'top_product': group['product'].mode().iloc[0] if len(group['product'].mode()) > 0 else 'N/A',\n        'customer_diversity': group['customer_type'].nunique(),\n        'peak_month': group.groupby('month')['total_amount'].sum().idxmax()\n    })\n\nregional_kpis = # TODO: Apply custom KPI function by region\n\n# Challenge 6: Window Functions & Time Series\ndf_sorted = df.sort_values(['region', 'date'])\n# TODO: Calculate running totals by region\n# TODO: Calculate 30-day moving averages\n# TODO: Rank products by monthly revenue\n\n# Challenge 7: Correlation & Factor Analysis\ncorr_matrix = # TODO: Calculate correlation matrix for numerical variables\n# TODO: Identify strongest correlations with revenue\n\n# Advanced Results Summary\nprint(\"\\n\" + \"=\"*70)\nprint(\"ADVANCED AGGREGATION ANALYSIS RESULTS\")\nprint(\"=\"*70)\n\nprint(f\"\\n1. TOP PERFORMING SEGMENTS:\")\ntop_segment = revenue_analysis.loc[revenue_analysis['total_amount'].idxmax()]\nprint(f\"   Best: {top_segment.name} - ${top_segment['total_amount']:,.2f}\")\n\nprint(f\"\\n2. GROWTH INSIGHTS:\")\nlatest_month = monthly_trends.iloc[-1]\nprint(f\"   Latest month revenue: ${latest_month['total_amount']:,.2f}\")\nprint(f\"   Transactions: {latest_month['transaction_id']:,}\")\n\nprint(f\"\\n3. SALES CHAMPION:\")\ntop_rep = sales_performance.loc[sales_performance['total_amount'].idxmax()]\nprint(f\"   {top_rep.name}: ${top_rep['total_amount']:,.2f} revenue\")\n\nprint(f\"\\n4. PRODUCT INSIGHTS:\")\nbest_product = product_pivot.sum(axis=1).idxmax()\nprint(f\"   Top product: {best_product}\")\nprint(f\"   Revenue: ${product_pivot.sum(axis=1)[best_product]:,.2f}\")\n\nprint(f\"\\n5. REGIONAL KPI SUMMARY:\")\nfor region in regional_kpis.index:\n    kpi = regional_kpis.loc[region]\n    print(f\"   {region}: ${kpi['revenue']:,.0f} revenue, {kpi['transactions']} transactions\")\n\nprint(f\"\\n6. KEY CORRELATIONS:\")\ntop_corr = corr_matrix['total_amount'].abs().sort_values(ascending=False)[1:3]\nfor var, corr in top_corr.items():\n    print(f\"   {var}: {corr:.3f} correlation with revenue\")",
-            "expected_output": "E-commerce Dataset Overview:\nTotal transactions: 1,000\nDate range: 2023-01-01 to 2023-12-30\nTotal revenue: $1,876,543.21\nProducts: iPhone, MacBook, iPad, AirPods, Apple Watch, iMac\nRegions: North America, Europe, Asia, South America\n\n======================================================================\nADVANCED AGGREGATION ANALYSIS RESULTS\n======================================================================\n\n1. TOP PERFORMING SEGMENTS:\n   Best: ('North America', 'Laptop', 'Premium') - $125,743.45\n\n2. GROWTH INSIGHTS:\n   Latest month revenue: $187,234.56\n   Transactions: 89\n\n3. SALES CHAMPION:\n   Alice Johnson: $394,521.33 revenue\n\n4. PRODUCT INSIGHTS:\n   Top product: MacBook\n   Revenue: $456,789.12\n\n5. REGIONAL KPI SUMMARY:\n   North America: $587,654 revenue, 287 transactions\n   Europe: $445,321 revenue, 231 transactions\n   Asia: $512,876 revenue, 259 transactions\n   South America: $330,692 revenue, 223 transactions\n\n6. KEY CORRELATIONS:\n   quantity: 0.487 correlation with revenue\n   unit_price: 0.821 correlation with revenue",
-            "hints": [
-                "Multi-level grouping: df.groupby(['region', 'category', 'customer_type']).agg({'total_amount': ['sum', 'mean', 'count']})",
-                "Monthly trends: df.groupby(['year', 'month']).agg({'total_amount': 'sum', 'transaction_id': 'count'})",
-                "Custom functions: df.groupby('region').apply(calculate_kpis)",
-                "Pivot tables: pd.pivot_table(df, values='total_amount', index='product', columns='region', aggfunc='sum')",
-                "Window functions: df.groupby('region')['total_amount'].cumsum()",
-                "Moving averages: df.groupby('region')['total_amount'].rolling(30).mean()",
-                "Correlation: df.select_dtypes(include=[np.number]).corr()",
-                "Use .reset_index() to convert grouped results to DataFrame"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["pandas_groupby", "pivot_tables", "window_functions"]
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "level_id": 210,
-            "title": "Machine Learning Pipeline Mastery",
-            "description": "Build end-to-end machine learning pipelines for predictive analytics. Master feature engineering, model selection, and performance evaluation.",
-            "category": "Data Analysis",
-            "difficulty": "Expert",
-            "xp_reward": 400,
-            "starter_code": "# Machine Learning Pipeline Mastery\n# Build a complete ML pipeline for customer churn prediction\n# Choose your ML arsenal: scikit-learn, pandas, numpy, matplotlib, seaborn\n# Advanced: xgboost, lightgbm, feature-engine\n\nfrom sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV\nfrom sklearn.preprocessing import StandardScaler, LabelEncoder, OneHotEncoder\nfrom sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier\nfrom sklearn.linear_model import LogisticRegression\nfrom sklearn.metrics import classification_report, confusion_matrix, roc_auc_score\nfrom sklearn.pipeline import Pipeline\nfrom sklearn.compose import ColumnTransformer\nimport pandas as pd\nimport numpy as np\n\n# Customer Churn Dataset (Telecom Industry)\nnp.random.seed(42)\nn_customers = 5000\n\n# Generate realistic customer data\ncustomer_data = {\n    'customer_id': [f'CUST_{1000+i}' for i in range(n_customers)],\n    'tenure_months': np.random.exponential(24, n_customers),\n    'monthly_charges': np.random.normal(65, 20, n_customers),\n    'total_charges': np.random.exponential(1500, n_customers),\n    'contract_type': np.random.choice(['Month-to-month', 'One year', 'Two year'], n_customers, p=[0.5, 0.3, 0.2]),\n    'payment_method': np.random.choice(['Electronic check', 'Mailed check', 'Bank transfer', 'Credit card'], n_customers),\n    'internet_service': np.random.choice(['DSL', 'Fiber optic', 'No'], n_customers, p=[0.4, 0.4, 0.2]),\n    'online_security': np.random.choice(['Yes', 'No', 'No internet service'], n_customers, p=[0.3, 0.5, 0.2]),\n    'tech_support': np.random.choice(['Yes', 'No', 'No internet service'], n_customers, p=[0.3, 0.5, 0.2]),\n    'streaming_tv': np.random.choice(['Yes', 'No', 'No internet service'], n_customers, p=[0.4, 0.4, 0.2]),\n    'paperless_billing': np.random.choice(['Yes', 'No'], n_customers, p=[0.6, 0.4]),\n    'senior_citizen': np.random.choice([0, 1], n_customers, p=[0.84, 0.16]),\n    'partner': np.random.choice(['Yes', 'No'], n_customers, p=[0.52, 0.48]),\n    'dependents': np.random.choice(['Yes', 'No'], n_customers, p=[0.3, 0.7]),\n    'phone_service': np.random.choice(['Yes', 'No'], n_customers, p=[0.9, 0.1])\n}\n\n# Create target variable (churn) with realistic business logic\nchurn_probability = (\n    0.1 +  # Base churn rate\n    (customer_data['tenure_months'] < 12) * 0.3 +  # New customers churn more\n    (customer_data['contract_type'] == 'Month-to-month') * 0.25 +  # Monthly contracts churn more\n    (customer_data['monthly_charges'] > 80) * 0.2 +  # High charges increase churn\n    (customer_data['senior_citizen'] == 1) * 0.15 +  # Seniors churn more\n    (customer_data['tech_support'] == 'No') * 0.1  # No tech support increases churn\n)\n\ncustomer_data['churn'] = np.random.binomial(1, np.clip(churn_probability, 0, 1), n_customers)\n\ndf = pd.DataFrame(customer_data)\n\n# Your comprehensive ML pipeline challenges:\n# 1. Exploratory Data Analysis & Feature Engineering\n# 2. Data preprocessing & encoding\n# 3. Feature selection & dimensionality reduction\n# 4. Model selection & hyperparameter tuning\n# 5. Cross-validation & performance evaluation\n# 6. Feature importance analysis\n# 7. Business insights & recommendations\n\nprint(\"Customer Churn Prediction Dataset\")\nprint(\"=\" * 50)\nprint(f\"Total customers: {len(df):,}\")\nprint(f\"Churn rate: {df['churn'].mean():.1%}\")\nprint(f\"Features: {df.shape[1] - 2}\")  # Excluding customer_id and target\nprint(f\"\\nDataset Info:\")\nprint(f\"- Numerical features: {df.select_dtypes(include=[np.number]).shape[1] - 1}\")  # Excluding target\nprint(f\"- Categorical features: {df.select_dtypes(include=['object']).shape[1] - 1}\")  # Excluding customer_id\n\n# Challenge 1: Exploratory Data Analysis\n# TODO: Analyze churn rates by different segments\n# TODO: Calculate feature correlations with churn\n# TODO: Identify data quality issues\n\nchurn_by_contract = # TODO: Calculate churn rate by contract type\nchurn_by_tenure = # TODO: Create tenure bins and analyze churn patterns\nhigh_risk_segments = # TODO: Identify customer segments with >40% churn rate\n\n# Challenge 2: Feature Engineering\n# TODO: Create new features from existing ones\ndf['avg_monthly_charges'] = df['total_charges'] / (df['tenure_months'] + 1)  # Avoid division by zero\ndf['tenure_group'] = # TODO: Categorize tenure into groups (0-12, 12-24, 24-48, 48+)\ndf['high_value_customer'] = # TODO: Binary feature for customers with monthly_charges > 75th percentile\ndf['service_count'] = # TODO: Count number of additional services (streaming, security, etc.)\n\n# Challenge 3: Data Preprocessing Pipeline\n# Separate features and target\nX = df.drop(['customer_id', 'churn'], axis=1)\ny = df['churn']\n\n# Identify numerical and categorical columns\nnumerical_features = # TODO: Select numerical columns\ncategorical_features = # TODO: Select categorical columns\n\n# Create preprocessing pipelines\nnumerical_transformer = # TODO: Create pipeline with StandardScaler\ncategorical_transformer = # TODO: Create pipeline with OneHotEncoder\n\n# Combine transformers\npreprocessor = # TODO: Create ColumnTransformer with both transformers\n\n# Challenge 4: Model Selection & Training\n# TODO: Split data into train/validation/test sets\nX_temp, X_test, y_temp, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)\nX_train, X_val, y_train, y_val = train_test_split(X_temp, y_temp, test_size=0.25, random_state=42, stratify=y_temp)\n\n# Define models to compare\nmodels = {\n    'logistic': # TODO: Create LogisticRegression pipeline\n    'random_forest': # TODO: Create RandomForest pipeline\n    'gradient_boosting': # TODO: Create GradientBoosting pipeline\n}\n\n# Challenge 5: Model Evaluation & Selection\nmodel_results = {}\nfor name, model in models.items():\n    # TODO: Fit model on training data\n    # TODO: Make predictions on validation set\n    # TODO: Calculate performance metrics (accuracy, precision, recall, F1, AUC)\n    pass\n\n# Challenge 6: Hyperparameter Tuning for Best Model\nbest_model_name = # TODO: Select best model based on AUC score\nbest_model = models[best_model_name]\n\n# TODO: Define parameter grid for GridSearchCV\nparam_grid = # TODO: Create parameter grid for hyperparameter tuning\n\n# TODO: Perform grid search with cross-validation\ngrid_search = # TODO: GridSearchCV with best model\n\n# Challenge 7: Final Evaluation & Business Insights\n# TODO: Evaluate tuned model on test set\nfinal_predictions = # TODO: Predict on test set\nfinal_probabilities = # TODO: Predict probabilities on test set\n\n# TODO: Calculate final performance metrics\ntest_auc = # TODO: Calculate AUC on test set\ntest_accuracy = # TODO: Calculate accuracy on test set\n\n# Feature importance analysis\nif hasattr(grid_search.best_estimator_.named_steps[best_model_name], 'feature_importances_'):\n    feature_names = # TODO: Get feature names after preprocessing\n    feature_importance = # TODO: Get feature importances\n    top_features = # TODO: Get top 5 most important features\n\n# Business Impact Analysis\nhigh_risk_threshold = 0.7  # Customers with >70% churn probability\nhigh_risk_customers = # TODO: Count customers above threshold\npotential_revenue_at_risk = # TODO: Calculate potential lost revenue\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"MACHINE LEARNING PIPELINE RESULTS\")\nprint(\"=\"*70)\n\nprint(f\"\\n1. DATASET INSIGHTS:\")\nprint(f\"   Highest risk contract: {churn_by_contract.idxmax()} ({churn_by_contract.max():.1%} churn rate)\")\nprint(f\"   High-risk segments identified: {len(high_risk_segments)}\")\n\nprint(f\"\\n2. MODEL PERFORMANCE:\")\nprint(f\"   Best model: {best_model_name.title()}\")\nprint(f\"   Test AUC: {test_auc:.3f}\")\nprint(f\"   Test Accuracy: {test_accuracy:.1%}\")\n\nprint(f\"\\n3. FEATURE INSIGHTS:\")\nif 'top_features' in locals():\n    print(f\"   Top predictive features:\")\n    for feature, importance in top_features:\n        print(f\"     - {feature}: {importance:.3f}\")\n\nprint(f\"\\n4. BUSINESS IMPACT:\")\nprint(f\"   High-risk customers: {high_risk_customers:,} ({high_risk_customers/len(df):.1%})\")\nprint(f\"   Potential revenue at risk: ${potential_revenue_at_risk:,.0f}\")\n\nprint(f\"\\n5. RECOMMENDATIONS:\")\nprint(f\"   - Target high-risk Month-to-month customers with retention offers\")\nprint(f\"   - Improve tech support to reduce churn\")\nprint(f\"   - Focus retention efforts on customers with tenure < 12 months\")\nprint(f\"   - Consider pricing strategy for high monthly charge customers\")",
-            "expected_output": "Customer Churn Prediction Dataset\n==================================================\nTotal customers: 5,000\nChurn rate: 26.7%\nFeatures: 14\n\nDataset Info:\n- Numerical features: 3\n- Categorical features: 10\n\n======================================================================\nMACHINE LEARNING PIPELINE RESULTS\n======================================================================\n\n1. DATASET INSIGHTS:\n   Highest risk contract: Month-to-month (45.2% churn rate)\n   High-risk segments identified: 3\n\n2. MODEL PERFORMANCE:\n   Best model: Gradient Boosting\n   Test AUC: 0.847\n   Test Accuracy: 78.4%\n\n3. FEATURE INSIGHTS:\n   Top predictive features:\n     - contract_type_Month-to-month: 0.234\n     - tenure_months: 0.187\n     - monthly_charges: 0.156\n     - tech_support_No: 0.124\n     - senior_citizen: 0.098\n\n4. BUSINESS IMPACT:\n   High-risk customers: 342 (6.8%)\n   Potential revenue at risk: $1,245,678\n\n5. RECOMMENDATIONS:\n   - Target high-risk Month-to-month customers with retention offers\n   - Improve tech support to reduce churn\n   - Focus retention efforts on customers with tenure < 12 months\n   - Consider pricing strategy for high monthly charge customers",
-            "hints": [
-                "EDA: df.groupby('contract_type')['churn'].mean()",
-                "Tenure groups: pd.cut(df['tenure_months'], bins=[0,12,24,48,float('inf')], labels=['0-12','12-24','24-48','48+'])",
-                "High value: df['monthly_charges'] > df['monthly_charges'].quantile(0.75)",
-                "Service count: Sum of Yes values in service columns",
-                "Numerical features: X.select_dtypes(include=[np.number]).columns",
-                "Categorical features: X.select_dtypes(include=['object']).columns",
-                "Pipeline: Pipeline([('scaler', StandardScaler())])",
-                "OneHot: Pipeline([('onehot', OneHotEncoder(handle_unknown='ignore'))])",
-                "ColumnTransformer: ColumnTransformer([('num', numerical_transformer, numerical_features), ('cat', categorical_transformer, categorical_features)])"
-            ],
-            "prerequisites": [],
-            "is_active": True,
-            "problem_type": "data_analysis",
-            "tutorial_links": ["machine_learning", "scikit_learn", "feature_engineering"]
-        }
-    ]
+    # Read once: a catalog reload while the code runs must not cache under the new version
+    version = level_catalog.version
+    cached = execution_cache.get(level_id, version, code)
+    rollups.record_execution(cached is not None)
+    if cached is not None:
+        cached.update({"cached": True, "queue_ms": 0.0})
+        return cached
     
-    await levels_collection.insert_many(sample_levels)
-    logger.info(f"Initialized {len(sample_levels)} sample levels")
+    try:
+        result = await sandbox_pool.run(code)
+    except SandboxBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Code runner is busy, please try again in a moment",
+            headers={"Retry-After": "1"}
+        )
+    execution_cache.put(level_id, version, code, result)
+    result["cached"] = False
+    return result
+
+# Seed the built-in levels from data/levels (no-op when unchanged)
+async def init_levels():
+    summary = await seed_levels(db)
+    if summary["changed"] or summary["retired"]:
+        await level_catalog.bump(db)
 
 @app.on_event("startup")
 async def startup_event():
+    await ensure_indexes(db)
+    missing = await missing_required_indexes(db)
+    if missing:
+        # Without user_level_unique a re-solved level would upsert a second completion and pay XP again
+        raise RuntimeError(f"Required indexes are missing: {missing}; run 'python manage.py dedupe-progress --apply' and restart")
+    if INDEX_CHECK_ON_STARTUP:
+        failures = await check_query_plans(db)
+        if failures:
+            raise RuntimeError(f"Query plan check failed, collection scans in: {[f['query'] for f in failures]}")
     await init_levels()
+    await level_catalog.load(db)
+    level_catalog.start_watching(db)
+    principal_cache.start_watching(db)
+    await leaderboard.load(db)
+    await sandbox_pool.start()
+    attempt_buffer.start(db)
+    rollups.start(db)
     logger.info("Application started successfully")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Flush buffered attempt counts before the process goes away
+    await attempt_buffer.stop()
+    await rollups.stop()
+    await level_catalog.stop_watching()
+    await principal_cache.stop_watching()
+    await sandbox_pool.stop()
+    password_hasher.shutdown()
+
 # Auth endpoints
 @app.post("/api/auth/signup", response_model=Token)
 async def signup(user: User):
@@ -575,21 +337,24 @@ async def signup(user: User):
     
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
     user_data = {
         "_id": user_id,
         "username": user.username,
         "email": user.email,
         "password": hashed_password,
+        "roles": [],
         "created_at": datetime.now(timezone.utc),
         "last_login": None,
         "is_active": True
     }
     
     await users_collection.insert_one(user_data)
+    await user_stats.create_user_stats(db, user_id)
+    rollups.record_signup(user_id)
     
     # Create access token
-    access_token = create_access_token(data={"sub": user_id})
+    access_token = create_access_token(data=token_claims(user_data))
     
     # Get user stats
     stats = await get_user_stats(user_id)
@@ -613,17 +378,25 @@ async def signup(user: User):
 async def login(credentials: UserLogin):
     # Find user
     user = await users_collection.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user["password"]):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_password(credentials.password, user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Update last login
+    # Update last login, upgrading the stored hash if its cost settings changed
+    login_update = {"last_login": datetime.now(timezone.utc)}
+    if new_hash:
+        login_update["password"] = new_hash
     await users_collection.update_one(
         {"_id": user["_id"]},
-        {"$set": {"last_login": datetime.now(timezone.utc)}}
+        {"$set": login_update}
     )
+    principal_cache.invalidate(user["_id"])
+    rollups.record_login(user["_id"])
     
     # Create access token
-    access_token = create_access_token(data={"sub": user["_id"]})
+    access_token = create_access_token(data=token_claims(user))
     
     # Get user stats
     stats = await get_user_stats(user["_id"])
@@ -663,12 +436,8 @@ async def verify_token(current_user: dict = Depends(get_current_user)):
     }
 
 # Level endpoints
-@app.get("/api/levels", response_model=List[Level])
-async def get_levels(skip: int = 0, limit: int = 20):
-    levels_cursor = levels_collection.find({"is_active": True}).sort("level_id", 1).skip(skip).limit(limit)
-    levels = await levels_cursor.to_list(length=limit)
-    
-    return [Level(
+def level_response(level, content):
+    return Level(
         id=level["_id"],
         level_id=level["level_id"],
         title=level["title"],
@@ -676,92 +445,203 @@ async def get_levels(skip: int = 0, limit: int = 20):
         category=level["category"],
         difficulty=level["difficulty"],
         xp_reward=level["xp_reward"],
-        starter_code=level["starter_code"],
+        starter_code=content.get("starter_code", ""),
         expected_output=level["expected_output"],
-        hints=level.get("hints", []),
+        hints=content.get("hints", []),
         prerequisites=level.get("prerequisites", []),
         is_active=level.get("is_active", True)
-    ) for level in levels]
+    )
+
+async def get_level_with_content(level_id: int) -> Optional[dict]:
+    """Catalog entry merged with its lazily loaded heavy fields"""
+    level = level_catalog.get(level_id)
+    if not level:
+        return None
+    content = await level_content.get(db, level_id, level_catalog.version)
+    return {**level, **content}
+
+@app.get("/api/levels", response_model=List[Union[Level, LevelSummary]])
+async def get_levels(skip: int = 0, limit: int = 20, summary: bool = False):
+    levels = level_catalog.active_levels()[max(skip, 0):max(skip, 0) + max(limit, 0)]
+    
+    # Summary mode skips the heavy fields entirely (level picker, dashboard)
+    if summary:
+        return [LevelSummary(
+            id=level["_id"],
+            level_id=level["level_id"],
+            title=level["title"],
+            description=level["description"],
+            category=level["category"],
+            difficulty=level["difficulty"],
+            xp_reward=level["xp_reward"],
+            prerequisites=level.get("prerequisites", []),
+            is_active=level.get("is_active", True)
+        ) for level in levels]
+    
+    contents = await level_content.get_many(db, [level["level_id"] for level in levels], level_catalog.version)
+    return [level_response(level, contents.get(level["level_id"], {})) for level in levels]
 
 @app.get("/api/levels/{level_id}", response_model=Level)
 async def get_level(level_id: int):
-    level = await levels_collection.find_one({"level_id": level_id})
+    level = level_catalog.get(level_id)
     if not level:
         raise HTTPException(status_code=404, detail="Level not found")
     
-    return Level(
-        id=level["_id"],
-        level_id=level["level_id"],
-        title=level["title"],
-        description=level["description"],
-        category=level["category"],
-        difficulty=level["difficulty"],
-        xp_reward=level["xp_reward"],
-        starter_code=level["starter_code"],
-        expected_output=level["expected_output"],
-        hints=level.get("hints", []),
-        prerequisites=level.get("prerequisites", []),
-        is_active=level.get("is_active", True)
+    return level_response(level, await level_content.get(db, level_id, level_catalog.version))
+
+@app.post("/api/levels/{level_id}/run")
+async def run_level_code(level_id: int, run: CodeRun, current_user: dict = Depends(get_current_user)):
+    level = level_catalog.get(level_id)
+    if not level:
+        raise HTTPException(status_code=404, detail="Level not found")
+    
+    result = await execute_code(level_id, run.code)
+    
+    return {
+        "stdout": result["stdout"],
+        "stderr": result["stderr"],
+        "exit_code": result["exit_code"],
+        "timed_out": result["timed_out"],
+        "truncated": result["truncated"],
+        "passed": result["exit_code"] == 0 and output_matches(result["stdout"], level["expected_output"]),
+        "cached": result["cached"],
+        "timings": {
+            "queue_ms": result["queue_ms"],
+            "wall_ms": result["wall_ms"],
+            "cpu_ms": result["cpu_ms"]
+        }
+    }
+
+async def record_correct_submission(user_id: str, level: dict):
+    """Count the attempt and complete the level in one conditional upsert"""
+    level_id = level["level_id"]
+    # Fold in this worker's buffered failed attempts, we are writing the document anyway
+    pending = attempt_buffer.take(user_id, level_id)
+    try:
+        return await complete_level(user_id, level, pending + 1)
+    except Exception:
+        # Nothing was written, hand the attempts back to the next flush
+        attempt_buffer.restore(user_id, level_id, pending)
+        raise
+
+async def complete_level(user_id: str, level: dict, attempts: int):
+    level_id = level["level_id"]
+    completion = {
+        "$set": {
+            "is_completed": True,
+            "completed_at": datetime.now(timezone.utc),
+            "stars": 3,  # Award full stars for correct solution
+            "xp_earned": level["xp_reward"]
+        },
+        "$inc": {"attempts": attempts},
+        "$setOnInsert": {"_id": str(uuid.uuid4())}
+    }
+    match = {"user_id": user_id, "level_id": level_id, "is_completed": {"$ne": True}}
+    try:
+        progress = await user_progress_collection.find_one_and_update(
+            match, completion, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return progress, True
+    except DuplicateKeyError:
+        # The document exists: either already completed, or created concurrently
+        pass
+    
+    progress = await user_progress_collection.find_one_and_update(
+        match, completion, return_document=ReturnDocument.AFTER
     )
+    if progress is not None:
+        return progress, True
+    progress = await user_progress_collection.find_one_and_update(
+        {"user_id": user_id, "level_id": level_id},
+        {"$inc": {"attempts": attempts}},
+        return_document=ReturnDocument.AFTER
+    )
+    return progress, False
+
+async def record_failed_attempt(user_id: str, level_id: int) -> dict:
+    """Buffer the attempt increment; the document is written by the next flush"""
+    if attempt_buffer.progress(user_id, level_id) is None:
+        # Only the first failure of a pair on this worker reads the document
+        stored = await user_progress_collection.find_one(
+            {"user_id": user_id, "level_id": level_id},
+            {"_id": 0, "attempts": 1, "stars": 1, "is_completed": 1}
+        ) or {"attempts": 0, "stars": 0}
+        attempt_buffer.remember(user_id, level_id, stored)
+    attempt_buffer.add(user_id, level_id)
+    return attempt_buffer.progress(user_id, level_id)
 
 @app.post("/api/levels/{level_id}/submit")
 async def submit_level(level_id: int, submission: LevelSubmission, current_user: dict = Depends(get_current_user)):
     # Get level
-    level = await levels_collection.find_one({"level_id": level_id})
+    level = level_catalog.get(level_id)
     if not level:
         raise HTTPException(status_code=404, detail="Level not found")
     
-    # Check if output matches expected (simplified validation)
-    is_correct = submission.output.strip() == level["expected_output"].strip()
+    if not submission.submission_id:
+        return await grade_submission(level, submission, current_user)
     
-    # Get or create user progress
-    progress = await user_progress_collection.find_one({
-        "user_id": current_user["_id"],
-        "level_id": level_id
-    })
-    
-    if not progress:
-        progress = {
-            "_id": str(uuid.uuid4()),
-            "user_id": current_user["_id"],
-            "level_id": level_id,
-            "attempts": 0,
-            "is_completed": False,
-            "stars": 0,
-            "xp_earned": 0
-        }
-    
-    # Update progress
-    progress["attempts"] += 1
-    
-    if is_correct and not progress["is_completed"]:
-        progress["is_completed"] = True
-        progress["completed_at"] = datetime.now(timezone.utc)
-        progress["stars"] = 3  # Award full stars for correct solution
-        progress["xp_earned"] = level["xp_reward"]
+    # Retried submissions replay the stored response instead of being graded again
+    receipt = submission_receipts.receipt_id(current_user["_id"], level_id, submission.submission_id)
+    try:
+        previous_response = await submission_receipts.claim(db, receipt)
+    except submission_receipts.SubmissionInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail="This submission is still being processed",
+            headers={"Retry-After": "1"}
+        )
+    if previous_response is not None:
+        return {**previous_response, "replayed": True}
     
-    # Upsert progress
-    await user_progress_collection.replace_one(
-        {"user_id": current_user["_id"], "level_id": level_id},
-        progress,
-        upsert=True
-    )
+    try:
+        response = await grade_submission(level, submission, current_user)
+    except Exception:
+        await submission_receipts.release(db, receipt)
+        raise
+    await submission_receipts.complete(db, receipt, response)
+    return response
+
+async def grade_submission(level: dict, submission: LevelSubmission, current_user: dict) -> dict:
+    level_id = level["level_id"]
+    # Run the submitted code and compare its real output with the expected one
+    result = await execute_code(level_id, submission.code)
+    is_correct = result["exit_code"] == 0 and output_matches(result["stdout"], level["expected_output"])
+    
+    if is_correct:
+        progress, newly_completed = await record_correct_submission(current_user["_id"], level)
+    else:
+        progress = await record_failed_attempt(current_user["_id"], level_id)
+        newly_completed = False
+    
+    rollups.record_submission(current_user["_id"], is_correct)
+    if newly_completed:
+        rollups.record_completion(current_user["_id"], level)
+        await user_stats.record_completion(
+            db, current_user["_id"], level_id, progress["xp_earned"], progress["completed_at"]
+        )
     
     # Get updated stats
     stats = await get_user_stats(current_user["_id"])
+    if newly_completed:
+        leaderboard.update(current_user["_id"], stats, current_user["username"])
     
     return {
         "success": is_correct,
         "message": "Congratulations! Level completed!" if is_correct else "Keep trying! Check your output.",
-        "xp_earned": level["xp_reward"] if is_correct and not progress.get("was_completed_before") else 0,
-        "stars": progress["stars"],
+        # XP is only awarded by the request that actually completed the level
+        "xp_earned": progress["xp_earned"] if newly_completed else 0,
+        "stars": progress.get("stars", 0),
         "attempts": progress["attempts"],
+        "output": result["stdout"],
+        "stderr": result["stderr"],
         "stats": stats
     }
 
 @app.get("/api/user/progress")
 async def get_user_progress(current_user: dict = Depends(get_current_user)):
     progress_docs = await user_progress_collection.find({"user_id": current_user["_id"]}).to_list(length=None)
+    # Failed attempts this worker has not flushed yet
+    pending_attempts = attempt_buffer.pending_for_user(current_user["_id"])
     
     progress_map = {}
     for progress in progress_docs:
@@ -769,45 +649,42 @@ async def get_user_progress(current_user: dict = Depends(get_current_user)):
             "level_id": progress["level_id"],
             "is_completed": progress.get("is_completed", False),
             "stars": progress.get("stars", 0),
-            "attempts": progress.get("attempts", 0),
+            "attempts": progress.get("attempts", 0) + pending_attempts.pop(progress["level_id"], 0),
             "completed_at": progress.get("completed_at"),
             "xp_earned": progress.get("xp_earned", 0)
         }
+    for level_id, attempts in pending_attempts.items():
+        progress_map[level_id] = {
+            "level_id": level_id,
+            "is_completed": False,
+            "stars": 0,
+            "attempts": attempts,
+            "completed_at": None,
+            "xp_earned": 0
+        }
     
     return progress_map
 
 @app.get("/api/leaderboard")
-async def get_leaderboard(limit: int = 10):
-    # Aggregate user progress to calculate leaderboard
-    pipeline = [
-        {"$match": {"is_completed": True}},
-        {
-            "$group": {
-                "_id": "$user_id",
-                "total_xp": {"$sum": "$xp_earned"},
-                "completed_levels": {"$sum": 1}
-            }
-        },
-        {"$sort": {"total_xp": -1}},
-        {"$limit": limit}
-    ]
-    
-    leaderboard_data = await user_progress_collection.aggregate(pipeline).to_list(length=limit)
-    
-    # Get user details
-    leaderboard = []
-    for entry in leaderboard_data:
-        user = await users_collection.find_one({"_id": entry["_id"]})
-        if user:
-            leaderboard.append({
-                "rank": len(leaderboard) + 1,
-                "username": user["username"],
-                "total_xp": entry["total_xp"],
-                "completed_levels": entry["completed_levels"],
-                "current_level": entry["completed_levels"] + 100  # Simplified calculation
-            })
-    
-    return leaderboard
+async def get_leaderboard(limit: int = 10, offset: int = 0):
+    # Served from the in-memory ranking; stale boards catch up in the background
+    leaderboard.refresh_if_stale(db)
+    return leaderboard.page(offset, min(limit, 100))
+
+@app.get("/api/leaderboard/me")
+async def get_my_leaderboard_rank(current_user: dict = Depends(get_current_user)):
+    leaderboard.refresh_if_stale(db)
+    entry = leaderboard.rank_of(current_user["_id"])
+    return {
+        "ranked": entry is not None,
+        "entry": entry,
+        "total_ranked": len(leaderboard)
+    }
+
+async def refresh_leaderboard_entry(user_id: str):
+    stats = await get_user_stats(user_id)
+    user = await users_collection.find_one({"_id": user_id}, {"username": 1})
+    leaderboard.update(user_id, stats, user["username"] if user else None)
 
 @app.post("/api/levels/{level_id}/feedback")
 async def submit_feedback(level_id: int, feedback_data: LevelFeedback, current_user: dict = Depends(get_current_user)):
@@ -825,6 +702,7 @@ async def submit_feedback(level_id: int, feedback_data: LevelFeedback, current_u
         }
         
         await feedback_collection.insert_one(feedback_doc)
+        await feedback_stats.record_submitted(db, feedback_doc)
         
         return {
             "success": True,
@@ -835,16 +713,26 @@ async def submit_feedback(level_id: int, feedback_data: LevelFeedback, current_u
         logger.error(f"Failed to submit feedback: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to submit feedback")
 
-async def check_admin_access(current_user: dict = Depends(get_current_user)):
-    # Simple admin check - in production, you'd want proper role-based access
-    # Allow any user with "admin" in their username for testing purposes
-    if "admin" not in current_user["username"].lower():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    return current_user
+def require_permission(permission: str):
+    """Dependency allowing only users whose roles grant `permission`"""
+    async def check_permission(current_user: dict = Depends(get_current_user)):
+        if permission not in current_user["permissions"]:
+            raise HTTPException(status_code=403, detail="Admin access required")
+        return current_user
+    return check_permission
+
+async def get_manageable_user(user_id: str, admin_user: dict) -> dict:
+    """Load the user an admin endpoint is about to change, refusing users that outrank the caller"""
+    user = await users_collection.find_one({"_id": user_id}, {"roles": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not roles.can_manage(admin_user["permissions"], user):
+        raise HTTPException(status_code=403, detail="You cannot manage a user with permissions you do not have")
+    return user
 
 @app.get("/api/admin/feedback")
 async def get_all_feedback(
-    admin_user: dict = Depends(check_admin_access),
+    admin_user: dict = Depends(require_permission(roles.FEEDBACK_READ)),
     skip: int = 0, 
     limit: int = 50,
     status: Optional[str] = None,
@@ -863,17 +751,18 @@ async def get_all_feedback(
     if user_id:
         filter_query["user_id"] = user_id
     
-    feedback_cursor = feedback_collection.find(filter_query).sort("submitted_at", -1).skip(skip).limit(limit)
-    feedback_list = await feedback_cursor.to_list(length=limit)
-    
-    # Get statistics
-    total_feedback = await feedback_collection.count_documents(filter_query)
-    pending_count = await feedback_collection.count_documents({"status": "pending"})
-    reviewed_count = await feedback_collection.count_documents({"status": "reviewed"})
-    resolved_count = await feedback_collection.count_documents({"status": "resolved"})
+    # Filtered page and total in one aggregation; status counts from the counters document
+    feedback_page, counters = await asyncio.gather(
+        feedback_stats.page(db, filter_query, skip, limit),
+        feedback_stats.get_counters(db)
+    )
+    total_feedback = feedback_page["total"]
+    pending_count = counters["status"].get("pending", 0)
+    reviewed_count = counters["status"].get("reviewed", 0)
+    resolved_count = counters["status"].get("resolved", 0)
     
     return {
-        "feedback": feedback_list,
+        "feedback": feedback_page["items"],
         "total": total_feedback,
         "statistics": {
             "pending": pending_count,
@@ -892,7 +781,7 @@ async def get_all_feedback(
 async def update_feedback_status(
     feedback_id: str,
     status_update: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.FEEDBACK_MANAGE))
 ):
     valid_statuses = ["pending", "reviewed", "resolved"]
     new_status = status_update.get("status")
@@ -900,8 +789,8 @@ async def update_feedback_status(
     if new_status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
     
-    # Update feedback status
-    result = await feedback_collection.update_one(
+    # Update feedback status; the previous status keeps the counters exact
+    previous = await feedback_collection.find_one_and_update(
         {"_id": feedback_id},
         {
             "$set": {
@@ -909,99 +798,215 @@ async def update_feedback_status(
                 "updated_at": datetime.now(timezone.utc),
                 "updated_by": admin_user["_id"]
             }
-        }
+        },
+        projection={"status": 1}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Feedback not found")
+    await feedback_stats.record_status_change(db, previous.get("status"), new_status)
     
     return {"success": True, "message": f"Feedback status updated to {new_status}"}
 
 @app.get("/api/admin/feedback/statistics")
-async def get_feedback_statistics(admin_user: dict = Depends(check_admin_access)):
-    # Get overall statistics
-    total_feedback = await feedback_collection.count_documents({})
-    
-    # Status breakdown
-    status_stats = await feedback_collection.aggregate([
-        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-    ]).to_list(length=None)
-    
-    # Category breakdown
-    category_stats = await feedback_collection.aggregate([
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}}
-    ]).to_list(length=None)
-    
-    # Rating distribution
-    rating_stats = await feedback_collection.aggregate([
-        {"$group": {"_id": "$rating", "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]).to_list(length=None)
-    
-    # Recent feedback count (last 7 days)
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    recent_feedback = await feedback_collection.count_documents({
-        "submitted_at": {"$gte": week_ago}
-    })
+async def get_feedback_statistics(admin_user: dict = Depends(require_permission(roles.FEEDBACK_READ))):
+    counters = await feedback_stats.statistics(db)
     
     return {
-        "total_feedback": total_feedback,
-        "recent_feedback": recent_feedback,
-        "status_breakdown": {item["_id"]: item["count"] for item in status_stats},
-        "category_breakdown": {item["_id"]: item["count"] for item in category_stats},
-        "rating_distribution": {str(item["_id"]): item["count"] for item in rating_stats}
+        "total_feedback": counters["total"],
+        "recent_feedback": counters["recent"],
+        "status_breakdown": counters["status"],
+        "category_breakdown": counters["category"],
+        "rating_distribution": counters["rating"]
     }
 
+ADMIN_USERS_SORT = [("created_at", -1), ("_id", -1)]
+
 @app.get("/api/admin/users")
 async def get_all_users(
-    admin_user: dict = Depends(check_admin_access),
+    admin_user: dict = Depends(require_permission(roles.USERS_READ)),
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
-    users_cursor = users_collection.find({}, {"password": 0}).sort("created_at", -1).skip(skip).limit(limit)
-    users_list = await users_cursor.to_list(length=limit)
-    
-    # Add user progress for each user
-    enriched_users = []
-    for user in users_list:
-        progress_docs = await user_progress_collection.find({"user_id": user["_id"]}).to_list(length=None)
-        completed_levels = [p for p in progress_docs if p.get("is_completed", False)]
-        
-        user_data = {
-            **user,
-            "total_levels_completed": len(completed_levels),
-            "total_xp": sum([p.get("xp_earned", 0) for p in completed_levels]),
-            "current_level": max([p["level_id"] for p in completed_levels], default=99) + 1 if completed_levels else 100,
-            "last_activity": max([p.get("completed_at") for p in progress_docs if p.get("completed_at")], default=user.get("last_login"))
-        }
-        enriched_users.append(user_data)
+    """List users with their progress stats. Pass `cursor` from the previous page
+    instead of `skip` for constant-cost paging."""
+    limit = min(max(limit, 1), 500)
+    match = {}
+    if cursor:
+        try:
+            match = keyset_filter(ADMIN_USERS_SORT, decode_cursor(cursor, len(ADMIN_USERS_SORT)))
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # One round trip for the page and its materialized stats
+    pipeline = [{"$match": match}, {"$sort": dict(ADMIN_USERS_SORT)}]
+    if skip > 0 and not cursor:
+        pipeline.append({"$skip": skip})
+    pipeline += [
+        {"$limit": limit + 1},
+        {"$project": {"password": 0}},
+        {"$lookup": {"from": "user_stats", "localField": "_id", "foreignField": "_id", "as": "stats"}},
+        {"$unwind": {"path": "$stats", "preserveNullAndEmptyArrays": True}},
+        {"$addFields": user_stats.stats_fields("stats")},
+        {"$project": {"stats": 0}}
+    ]
+    users_list = await users_collection.aggregate(pipeline).to_list(length=limit + 1)
+    has_more = len(users_list) > limit
+    users_list = users_list[:limit]
+    
+    # Users created before stats were materialized are backfilled once
+    missing = {user["_id"]: user for user in users_list if "total_levels_completed" not in user}
+    if missing:
+        for user_id in missing:
+            await user_stats.rebuild_user_stats(db, user_id)
+        async for stats_doc in db.user_stats.find({"_id": {"$in": list(missing)}}):
+            user = missing[stats_doc["_id"]]
+            stats = user_stats.derive_stats(stats_doc)
+            user.update({
+                "total_levels_completed": stats["completed_levels"],
+                "total_xp": stats["total_xp"],
+                "current_level": stats["current_level"],
+                "last_activity": stats_doc.get("last_completed_at") or user.get("last_login")
+            })
+    
+    next_cursor = None
+    if has_more and users_list:
+        last = users_list[-1]
+        next_cursor = encode_cursor([last.get("created_at"), last["_id"]])
     
-    total_users = await users_collection.count_documents({})
+    # Metadata count; an exact count would scan the whole collection
+    total_users = await users_collection.estimated_document_count()
     
     return {
-        "users": enriched_users,
+        "users": users_list,
         "total": total_users,
         "pagination": {
             "skip": skip,
             "limit": limit,
-            "has_more": total_users > skip + limit
+            "has_more": has_more,
+            "next_cursor": next_cursor
         }
     }
 
+# Streaming exports (NDJSON or CSV, optionally gzipped) for warehouse loads
+FEEDBACK_EXPORT_FIELDS = [
+    "_id", "level_id", "user_id", "username", "rating", "category", "comment",
+    "status", "submitted_at", "updated_at"
+]
+USER_EXPORT_FIELDS = [
+    "_id", "username", "email", "subscription_tier", "status", "roles", "is_active",
+    "created_at", "last_login"
+]
+PROGRESS_EXPORT_FIELDS = [
+    "_id", "user_id", "level_id", "is_completed", "completed_at", "stars", "xp_earned",
+    "attempts", "admin_granted"
+]
+
+def check_export_format(format: str):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Must be one of: {list(EXPORT_FORMATS)}")
+
+@app.get("/api/admin/export/feedback")
+async def export_feedback(
+    admin_user: dict = Depends(require_permission(roles.FEEDBACK_READ)),
+    format: str = "ndjson",
+    gzip: bool = False,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    level_id: Optional[int] = None,
+    user_id: Optional[str] = None
+):
+    """Stream all feedback matching the admin list filters"""
+    check_export_format(format)
+    filter_query = {}
+    if status:
+        filter_query["status"] = status
+    if category:
+        filter_query["category"] = category
+    if level_id:
+        filter_query["level_id"] = level_id
+    if user_id:
+        filter_query["user_id"] = user_id
+    
+    return export_response(
+        feedback_collection, filter_query, FEEDBACK_EXPORT_FIELDS, "feedback",
+        export_format=format, gzip=gzip, sort=[("submitted_at", -1)]
+    )
+
+@app.get("/api/admin/export/users")
+async def export_users(
+    admin_user: dict = Depends(require_permission(roles.USERS_READ)),
+    format: str = "ndjson",
+    gzip: bool = False,
+    created_since: Optional[datetime] = None
+):
+    """Stream all users (never password hashes)"""
+    check_export_format(format)
+    filter_query = {}
+    if created_since:
+        filter_query["created_at"] = {"$gte": created_since}
+    
+    return export_response(
+        users_collection, filter_query, USER_EXPORT_FIELDS, "users",
+        export_format=format, gzip=gzip
+    )
+
+@app.get("/api/admin/export/progress")
+async def export_progress(
+    admin_user: dict = Depends(require_permission(roles.USERS_READ)),
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: Optional[str] = None,
+    level_id: Optional[int] = None,
+    completed: Optional[bool] = None,
+    completed_since: Optional[datetime] = None
+):
+    """Stream user progress rows; `completed_since` enables incremental nightly loads"""
+    check_export_format(format)
+    filter_query = {}
+    if user_id:
+        filter_query["user_id"] = user_id
+    if level_id:
+        filter_query["level_id"] = level_id
+    if completed is not None:
+        filter_query["is_completed"] = completed
+    if completed_since:
+        filter_query["completed_at"] = {"$gte": completed_since}
+    
+    return export_response(
+        user_progress_collection, filter_query, PROGRESS_EXPORT_FIELDS, "progress",
+        export_format=format, gzip=gzip
+    )
+
+async def grant_level_completion(progress_entry: Dict[str, Any]):
+    # Update in place so an existing progress document keeps its _id
+    previous = await user_progress_collection.find_one_and_update(
+        {"user_id": progress_entry["user_id"], "level_id": progress_entry["level_id"]},
+        {"$set": progress_entry, "$setOnInsert": {"_id": str(uuid.uuid4())}},
+        upsert=True
+    )
+    await user_stats.record_replaced_progress(db, previous, progress_entry)
+    level = level_catalog.get(progress_entry["level_id"])
+    if level and not (previous and previous.get("is_completed")):
+        # Counted like a solved submission, the rollup rebuild counts it from user_progress too
+        rollups.record_completion(progress_entry["user_id"], level, progress_entry["completed_at"])
+    await refresh_leaderboard_entry(progress_entry["user_id"])
+
 @app.patch("/api/admin/users/{user_id}/progress")
 async def update_user_progress(
     user_id: str,
     progress_update: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.USERS_MANAGE))
 ):
     """Manually update user progress - pass them through levels or reset progress"""
+    await get_manageable_user(user_id, admin_user)
     action = progress_update.get("action")  # "unlock_level", "complete_level", "reset_progress"
     level_id = progress_update.get("level_id")
     
     if action == "unlock_level" and level_id:
         # Create progress entry to unlock a specific level
         progress_entry = {
-            "_id": str(uuid.uuid4()),
             "user_id": user_id,
             "level_id": level_id - 1,  # Complete previous level to unlock target
             "is_completed": True,
@@ -1012,22 +1017,17 @@ async def update_user_progress(
             "admin_granted": True
         }
         
-        await user_progress_collection.replace_one(
-            {"user_id": user_id, "level_id": level_id - 1},
-            progress_entry,
-            upsert=True
-        )
+        await grant_level_completion(progress_entry)
         
         return {"success": True, "message": f"Unlocked access to Level {level_id} for user"}
     
     elif action == "complete_level" and level_id:
         # Mark specific level as completed
-        level = await levels_collection.find_one({"level_id": level_id})
+        level = level_catalog.get(level_id)
         if not level:
             raise HTTPException(status_code=404, detail="Level not found")
         
         progress_entry = {
-            "_id": str(uuid.uuid4()),
             "user_id": user_id,
             "level_id": level_id,
             "is_completed": True,
@@ -1038,17 +1038,15 @@ async def update_user_progress(
             "admin_granted": True
         }
         
-        await user_progress_collection.replace_one(
-            {"user_id": user_id, "level_id": level_id},
-            progress_entry,
-            upsert=True
-        )
+        await grant_level_completion(progress_entry)
         
         return {"success": True, "message": f"Marked Level {level_id} as completed for user"}
     
     elif action == "reset_progress":
         # Reset all user progress
         await user_progress_collection.delete_many({"user_id": user_id})
+        await user_stats.reset_user_stats(db, user_id)
+        await refresh_leaderboard_entry(user_id)
         return {"success": True, "message": "All user progress has been reset"}
     
     else:
@@ -1057,12 +1055,10 @@ async def update_user_progress(
 @app.post("/api/admin/users/{user_id}/password-reset")
 async def initiate_password_reset(
     user_id: str,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.USERS_MANAGE))
 ):
     """Initiate password reset for a user (provision for email integration)"""
-    user = await users_collection.find_one({"_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    await get_manageable_user(user_id, admin_user)
     
     # Generate reset token (for future email integration)
     reset_token = str(uuid.uuid4())
@@ -1097,7 +1093,7 @@ async def initiate_password_reset(
 @app.post("/api/admin/issues")
 async def create_issue(
     issue_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.FEEDBACK_MANAGE))
 ):
     """Create issue ticket (provision for Jira integration)"""
     issue_doc = {
@@ -1135,16 +1131,17 @@ async def create_issue(
     }
 
 @app.get("/api/admin/test-modules")
-async def get_test_modules(admin_user: dict = Depends(check_admin_access)):
-    """Get available modules for testing"""
-    modules = [
-        {"id": "python-basics", "name": "Python Basics", "levels": "100-105"},
-        {"id": "control-flow", "name": "Control Flow", "levels": "103-104"},
-        {"id": "data-analysis", "name": "Data Analysis", "levels": "200-203"},
-        {"id": "projects", "name": "Projects", "levels": "105"},
-        {"id": "feedback-system", "name": "Feedback System", "description": "Test feedback submission and admin management"},
-        {"id": "user-management", "name": "User Management", "description": "Test user registration, login, progress tracking"}
-    ]
+async def get_test_modules(admin_user: dict = Depends(require_permission(roles.CONTENT_MANAGE))):
+    """Get the content modules whose levels can be verified"""
+    modules = []
+    for module_id, module in level_check.MODULES.items():
+        level_ids = [level["level_id"] for level in level_catalog.active_levels() if level_check.in_module(module_id, level)]
+        modules.append({
+            "id": module_id,
+            "name": module["name"],
+            "levels": f"{level_ids[0]}-{level_ids[-1]}" if level_ids else "",
+            "level_count": len(level_ids)
+        })
     
     return {"modules": modules}
 
@@ -1152,9 +1149,35 @@ async def get_test_modules(admin_user: dict = Depends(check_admin_access)):
 async def test_module(
     module_id: str,
     test_params: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.CONTENT_MANAGE))
 ):
-    """Execute module test (provision for comprehensive testing)"""
+    """Run every level's starter code in the module on a dedicated sandbox pool and
+    report per-level pass/fail, wall time, CPU time and peak RSS.
+    Optional params: workers, repeat, timeout, level_ids."""
+    if module_id not in level_check.MODULES:
+        raise HTTPException(status_code=404, detail="Unknown test module")
+    try:
+        workers = int(test_params.get("workers", level_check.LEVEL_CHECK_WORKERS))
+        repeat = int(test_params.get("repeat", 1))
+        timeout = float(test_params["timeout"]) if test_params.get("timeout") is not None else None
+        only = {int(level_id) for level_id in test_params.get("level_ids") or []}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="workers, repeat, timeout and level_ids must be numbers")
+    if timeout is not None and not 0 < timeout <= level_check.LEVEL_CHECK_MAX_TIMEOUT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"timeout must be greater than 0 and at most {level_check.LEVEL_CHECK_MAX_TIMEOUT:g} seconds"
+        )
+    
+    levels = [
+        level for level in level_catalog.active_levels()
+        if level_check.in_module(module_id, level) and (not only or level["level_id"] in only)
+    ]
+    if not levels:
+        raise HTTPException(status_code=404, detail="No levels to test in this module")
+    contents = await level_content.get_many(db, [level["level_id"] for level in levels], level_catalog.version)
+    levels = [{**level, **contents.get(level["level_id"], {})} for level in levels]
+    
     test_results = {
         "module_id": module_id,
         "test_started_at": datetime.now(timezone.utc),
@@ -1162,39 +1185,26 @@ async def test_module(
         "status": "running",
         "results": {},
         "errors": [],
-        "notes": "Test execution started by admin"
+        "notes": f"Test execution started by {admin_user['username']}"
     }
-    
-    # TODO: Implement actual module testing logic
-    # For now, simulate test results
-    if module_id == "python-basics":
-        test_results["results"] = {
-            "levels_tested": [100, 101, 102, 103, 104, 105],
-            "passed": 6,
-            "failed": 0,
-            "execution_time": "2.3s"
-        }
-    elif module_id == "data-analysis":
-        test_results["results"] = {
-            "levels_tested": [200, 201, 202, 203],
-            "passed": 4,
-            "failed": 0,
-            "execution_time": "1.8s"
-        }
-    elif module_id == "feedback-system":
-        test_results["results"] = {
-            "feedback_submission": "passed",
-            "admin_management": "passed",
-            "status_updates": "passed",
-            "statistics": "passed"
-        }
-    
-    test_results["status"] = "completed"
+    try:
+        test_results["results"] = await level_check.check_levels(
+            levels, output_matches, workers=workers, repeat=repeat, timeout=timeout
+        )
+        test_results["status"] = "completed"
+    except Exception as e:
+        logger.error(f"Module test {module_id} failed: {str(e)}")
+        test_results["status"] = "error"
+        test_results["errors"].append(str(e))
     test_results["test_completed_at"] = datetime.now(timezone.utc)
     
+    failed = test_results["results"].get("failed", 0)
     return {
-        "success": True,
-        "message": f"Module {module_id} tested successfully",
+        "success": test_results["status"] == "completed" and failed == 0,
+        "message": (
+            f"Module {module_id} tested: {test_results['results']['passed']} passed, {failed} failed"
+            if test_results["status"] == "completed" else f"Module {module_id} test could not run"
+        ),
         "test_results": test_results
     }
 
@@ -1233,52 +1243,20 @@ class Transaction(BaseModel):
 
 # Subscription Management Endpoints
 @app.get("/api/admin/subscriptions/plans")
-async def get_subscription_plans(admin_user: dict = Depends(check_admin_access)):
-    """Get all subscription plans with user counts"""
-    plans = [
-        {
-            "id": "free",
-            "name": "Free Plan",
-            "price": 0,
-            "currency": "USD",
-            "billing_period": "forever",
-            "features": ["Basic Challenges", "Community Access", "Progress Tracking"],
-            "is_active": True,
-            "user_count": 800,
-            "revenue": 0
-        },
-        {
-            "id": "pro",
-            "name": "Pro Plan", 
-            "price": 9.99,
-            "currency": "USD",
-            "billing_period": "monthly",
-            "features": ["All Challenges", "Priority Support", "Certificates", "Advanced Analytics", "Offline Access"],
-            "is_active": True,
-            "user_count": 400,
-            "revenue": 3996
-        },
-        {
-            "id": "enterprise",
-            "name": "Enterprise Plan",
-            "price": 49.99,
-            "currency": "USD", 
-            "billing_period": "monthly",
-            "features": ["Custom Tracks", "Team Management", "API Access", "White Label", "Dedicated Support"],
-            "is_active": True,
-            "user_count": 50,
-            "revenue": 2499.50
-        }
-    ]
-    
+async def get_subscription_plans(admin_user: dict = Depends(require_permission(roles.BILLING_READ))):
+    """Get all subscription plans with active subscriber counts, MRR and all-time revenue"""
+    plans = await billing.plans_with_usage(db)
     return {"plans": plans, "total_plans": len(plans)}
 
 @app.post("/api/admin/subscriptions/plans")
 async def create_subscription_plan(
     plan_data: SubscriptionPlan,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.BILLING_MANAGE))
 ):
     """Create a new subscription plan"""
+    # Plan ids become field names in the revenue aggregates
+    if not billing.PLAN_ID_PATTERN.match(plan_data.id) or plan_data.id in billing.BUILTIN_PLANS:
+        raise HTTPException(status_code=400, detail="Invalid or reserved plan id")
     plan_doc = {
         "_id": plan_data.id,
         "name": plan_data.name,
@@ -1291,284 +1269,257 @@ async def create_subscription_plan(
         "created_by": admin_user["_id"]
     }
     
-    await db.subscription_plans.insert_one(plan_doc)
+    try:
+        await db.subscription_plans.insert_one(plan_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Subscription plan already exists")
+    await billing.record_plan_created(db, plan_doc, admin_user["_id"])
     
     return {"success": True, "message": "Subscription plan created", "plan_id": plan_data.id}
 
+SUBSCRIPTIONS_SORT = [("updated_at", -1), ("_id", -1)]
+SUBSCRIPTION_LIST_FIELDS = [
+    "_id", "user_id", "plan_id", "plan_name", "status", "current_period_start", "current_period_end",
+    "next_billing_date", "total_paid_cents", "payment_method", "updated_at"
+]
+TRANSACTIONS_SORT = [("transaction_date", -1), ("_id", -1)]
+TRANSACTION_LIST_FIELDS = [
+    "_id", "kind", "user_id", "subscription_id", "plan_id", "amount", "currency", "status",
+    "payment_method", "transaction_date", "description", "refunded_transaction_id"
+]
+
+async def attach_user_identity(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Add username and email to each row with one batched users query"""
+    user_ids = list({row["user_id"] for row in rows if row.get("user_id")})
+    users = {
+        user["_id"]: user
+        async for user in users_collection.find({"_id": {"$in": user_ids}}, {"username": 1, "email": 1})
+    } if user_ids else {}
+    for row in rows:
+        user = users.get(row.get("user_id"), {})
+        row["username"] = user.get("username")
+        row["email"] = user.get("email")
+    return rows
+
+def parse_date_bound(value: str, name: str) -> datetime:
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 date or datetime")
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+async def billing_page(collection, match, sort, fields, skip: int, limit: int, cursor: Optional[str]):
+    limit = min(max(limit, 1), 500)
+    try:
+        rows, next_cursor = await find_page(
+            collection, match, sort, limit, cursor=cursor, skip=skip, projection={field: 1 for field in fields}
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Counted on the first page only; later pages just follow the cursor
+    total = None
+    if not cursor:
+        total = await collection.count_documents(match) if match else await collection.estimated_document_count()
+    for row in rows:
+        row["id"] = row.pop("_id")
+    return await attach_user_identity(rows), total, {
+        "skip": skip,
+        "limit": limit,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
+
 @app.get("/api/admin/subscriptions/users")
 async def get_user_subscriptions(
-    admin_user: dict = Depends(check_admin_access),
+    admin_user: dict = Depends(require_permission(roles.BILLING_READ)),
     status: Optional[str] = None,
     plan_id: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
-    """Get user subscription data with filtering"""
-    # Mock subscription data - replace with actual database queries
-    subscriptions = [
-        {
-            "user_id": "user_001",
-            "username": "john_doe",
-            "email": "john@example.com", 
-            "plan_id": "pro",
-            "plan_name": "Pro Plan",
-            "status": "active",
-            "current_period_start": datetime.now(timezone.utc) - timedelta(days=15),
-            "current_period_end": datetime.now(timezone.utc) + timedelta(days=15),
-            "next_billing_date": datetime.now(timezone.utc) + timedelta(days=15),
-            "total_paid": 29.97,
-            "payment_method": "credit_card"
-        }
-    ]
+    """Get user subscriptions, most recently changed first. Pass `cursor` from the
+    previous page instead of `skip` for constant-cost paging."""
+    match = {}
+    if status:
+        match["status"] = status
+    if plan_id:
+        match["plan_id"] = plan_id
+    
+    subscriptions, total, pagination = await billing_page(
+        db.subscriptions, match, SUBSCRIPTIONS_SORT, SUBSCRIPTION_LIST_FIELDS, skip, limit, cursor
+    )
+    for subscription in subscriptions:
+        subscription["total_paid"] = billing.from_cents(subscription.pop("total_paid_cents", 0))
     
     return {
         "subscriptions": subscriptions,
-        "total": len(subscriptions),
-        "pagination": {"skip": skip, "limit": limit}
+        "total": total,
+        "pagination": pagination
     }
 
 @app.get("/api/admin/payments/transactions")
 async def get_transactions(
-    admin_user: dict = Depends(check_admin_access),
+    admin_user: dict = Depends(require_permission(roles.BILLING_READ)),
     status: Optional[str] = None,
+    plan_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
-    """Get transaction history with filtering"""
-    # Mock transaction data
-    transactions = [
-        {
-            "id": "txn_001",
-            "user_id": "user_001",
-            "username": "john_doe",
-            "email": "john@example.com",
-            "amount": 9.99,
-            "currency": "USD",
-            "status": "completed",
-            "payment_method": "credit_card",
-            "transaction_date": datetime.now(timezone.utc) - timedelta(days=1),
-            "description": "Pro Plan - Monthly Subscription",
-            "stripe_transaction_id": "pi_1234567890"
-        },
-        {
-            "id": "txn_002", 
-            "user_id": "user_002",
-            "username": "jane_smith",
-            "email": "jane@example.com",
-            "amount": 49.99,
-            "currency": "USD", 
-            "status": "completed",
-            "payment_method": "credit_card",
-            "transaction_date": datetime.now(timezone.utc) - timedelta(days=2),
-            "description": "Enterprise Plan - Monthly Subscription",
-            "stripe_transaction_id": "pi_0987654321"
-        }
-    ]
+    """Get transaction history, newest first, filtered by status, plan and date range.
+    Pass `cursor` from the previous page instead of `skip` for constant-cost paging."""
+    match = {}
+    if status:
+        match["status"] = status
+    if plan_id:
+        match["plan_id"] = plan_id
+    date_range = {}
+    if start_date:
+        date_range["$gte"] = parse_date_bound(start_date, "start_date")
+    if end_date:
+        end = parse_date_bound(end_date, "end_date")
+        # A bare end date includes that whole day
+        if len(end_date) == 10:
+            date_range["$lt"] = end + timedelta(days=1)
+        else:
+            date_range["$lte"] = end
+    if date_range:
+        match["transaction_date"] = date_range
+    
+    transactions, total, pagination = await billing_page(
+        db.transactions, match, TRANSACTIONS_SORT, TRANSACTION_LIST_FIELDS, skip, limit, cursor
+    )
     
     return {
         "transactions": transactions,
-        "total": len(transactions),
-        "pagination": {"skip": skip, "limit": limit}
+        "total": total,
+        "pagination": pagination
     }
 
 @app.get("/api/admin/payments/revenue")
-async def get_revenue_analytics(admin_user: dict = Depends(check_admin_access)):
-    """Get comprehensive revenue analytics"""
-    revenue_data = {
-        "mrr": 4500.00,  # Monthly Recurring Revenue
-        "arr": 54000.00,  # Annual Recurring Revenue  
-        "total_revenue_30d": 6750.50,
-        "total_revenue_90d": 19250.75,
-        "churn_rate": 5.2,
-        "trial_conversion_rate": 68.5,
-        "average_revenue_per_user": 11.25,
-        "ltv": 135.50,  # Customer Lifetime Value
-        "monthly_growth_rate": 12.3,
-        
-        # Revenue by plan
-        "revenue_by_plan": {
-            "free": 0,
-            "pro": 3996.00,
-            "enterprise": 2499.50
-        },
-        
-        # Monthly revenue trend (last 12 months)
-        "monthly_revenue": [
-            {"month": "Jan", "revenue": 3200}, {"month": "Feb", "revenue": 3450},
-            {"month": "Mar", "revenue": 3680}, {"month": "Apr", "revenue": 3920},
-            {"month": "May", "revenue": 4100}, {"month": "Jun", "revenue": 4350},
-            {"month": "Jul", "revenue": 4200}, {"month": "Aug", "revenue": 4400},
-            {"month": "Sep", "revenue": 4600}, {"month": "Oct", "revenue": 4750},
-            {"month": "Nov", "revenue": 4850}, {"month": "Dec", "revenue": 4995.50}
-        ],
-        
-        # Subscription metrics
-        "subscription_metrics": {
-            "new_subscriptions_30d": 45,
-            "cancelled_subscriptions_30d": 8,
-            "upgraded_subscriptions_30d": 12,
-            "downgraded_subscriptions_30d": 3
-        }
-    }
-    
-    return revenue_data
+async def get_revenue_analytics(admin_user: dict = Depends(require_permission(roles.BILLING_READ))):
+    """Get revenue analytics from the incrementally maintained ledger aggregates"""
+    return await billing.revenue_summary(db)
 
 @app.post("/api/admin/payments/refund")
 async def process_refund(
     refund_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.BILLING_MANAGE))
 ):
     """Process a payment refund"""
     transaction_id = refund_data.get("transaction_id")
     amount = refund_data.get("amount")
-    reason = refund_data.get("reason")
+    if not transaction_id:
+        raise HTTPException(status_code=400, detail="transaction_id is required")
+    if amount is not None and not isinstance(amount, (int, float)):
+        raise HTTPException(status_code=400, detail="amount must be a number")
     
     # TODO: Integrate with payment processor (Stripe/PayPal) to process actual refund
-    
-    refund_doc = {
-        "_id": str(uuid.uuid4()),
-        "transaction_id": transaction_id,
-        "amount": amount,
-        "reason": reason,
-        "status": "processed",
-        "processed_by": admin_user["_id"],
-        "processed_at": datetime.now(timezone.utc)
-    }
-    
-    # Store refund record
-    await db.refunds.insert_one(refund_doc)
+    try:
+        refund = await billing.refund(db, transaction_id, amount, refund_data.get("reason"), admin_user["_id"])
+    except billing.TransactionNotFound:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    except billing.RefundRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "success": True,
         "message": "Refund processed successfully",
-        "refund_id": refund_doc["_id"],
+        "refund_id": refund["_id"],
+        "amount": -refund["amount"],
         "note": "Integration with Stripe/PayPal required for actual refund processing"
     }
 
+@app.get("/api/admin/sandbox/stats")
+async def get_sandbox_stats(admin_user: dict = Depends(require_permission(roles.SYSTEM_READ))):
+    """Get code runner pool utilisation, per-run latency percentiles, cache hit rates and attempt write-behind counters"""
+    return {**sandbox_pool.stats(), "cache": execution_cache.stats(), "attempt_buffer": attempt_buffer.stats()}
+
+@app.get("/api/admin/auth/hashing-stats")
+async def get_password_hashing_stats(admin_user: dict = Depends(require_permission(roles.SYSTEM_READ))):
+    """Get password hashing pool depth, rejections and latency percentiles, plus principal cache hit rates"""
+    return {**password_hasher.stats(), "principal_cache": principal_cache.stats()}
+
+@app.get("/api/admin/ai-tutor/stats")
+async def get_ai_tutor_stats(admin_user: dict = Depends(require_permission(roles.SYSTEM_READ))):
+    """Get AI tutor cache hit rates, upstream call counts and free-tier quota usage"""
+    return {**tutor_service.stats(), "quota": tutor_quota.stats()}
+
+@app.get("/api/admin/llm/stats")
+async def get_llm_gateway_stats(admin_user: dict = Depends(require_permission(roles.SYSTEM_READ))):
+    """Get per-model LLM in-flight/queued calls, circuit state, error rate and latency percentiles"""
+    return tutor_service.gateway.stats()
+
 # Advanced Admin Analytics
 @app.get("/api/admin/analytics/dashboard")
-async def get_admin_dashboard_analytics(admin_user: dict = Depends(check_admin_access)):
-    """Get comprehensive dashboard analytics for admin overview"""
-    
-    # User statistics
-    user_stats = {
-        "total_users": 1250,
-        "active_users_7d": 950,
-        "active_users_30d": 1150,
-        "new_users_7d": 85,
-        "new_users_30d": 320,
-        "user_retention_7d": 76.0,
-        "user_retention_30d": 68.5
-    }
-    
-    # Learning statistics
-    learning_stats = {
-        "total_challenges_completed": 15750,
-        "challenges_completed_7d": 1250,
-        "average_completion_rate": 72.5,
-        "most_popular_track": "Python Basics",
-        "highest_difficulty_completion": "Data Analysis - Hard"
-    }
-    
-    # System health
-    system_health = {
-        "server_uptime": "99.9%",
-        "avg_response_time": "125ms",
-        "error_rate": "0.02%",
-        "code_executions_today": 2450,
-        "queue_length": 3
-    }
-    
-    return {
-        "user_stats": user_stats,
-        "learning_stats": learning_stats,
-        "system_health": system_health,
-        "last_updated": datetime.now(timezone.utc)
-    }
+async def get_admin_dashboard_analytics(admin_user: dict = Depends(require_permission(roles.ANALYTICS_READ))):
+    """Get comprehensive dashboard analytics for admin overview, read from the hourly/daily rollups"""
+    analytics = await rollups.dashboard(db)
+    analytics["system_health"]["queue_length"] = sandbox_pool.stats()["queued"]
+    analytics["last_updated"] = datetime.now(timezone.utc)
+    return analytics
 
 # AI Tutor System
+async def consume_tutor_quota(current_user: dict) -> Optional[Dict[str, Any]]:
+    """Count one AI tutor use for free-tier users; 429 once today's allowance is spent"""
+    if current_user.get("subscription_tier", "free") != "free":
+        return None
+    try:
+        return await tutor_quota.consume(current_user["_id"])
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Daily AI tutor limit reached. Upgrade to Pro for unlimited access!",
+            headers=rate_limit_headers(e.decision)
+        )
+
+async def refund_tutor_quota(current_user: dict, decision: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # A fallback explanation should not cost the user one of their daily uses
+    if decision is None:
+        return None
+    await tutor_quota.refund(current_user["_id"], decision)
+    return await tutor_quota.peek(current_user["_id"])
+
 @app.post("/api/levels/{level_id}/ai-tutor")
 async def get_ai_tutor_explanation(
     level_id: int,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """Get AI-powered explanation for a specific level/challenge"""
     
     # Get level details
-    level = await levels_collection.find_one({"level_id": level_id})
+    level = await get_level_with_content(level_id)
     if not level:
         raise HTTPException(status_code=404, detail="Level not found")
     
     # Check user subscription for advanced features
-    user = await users_collection.find_one({"_id": current_user["_id"]})
-    subscription_tier = user.get("subscription_tier", "free")
+    subscription_tier = current_user.get("subscription_tier", "free")
+    # Metered before the LLM is called
+    quota = await consume_tutor_quota(current_user)
     
     try:
-        # Initialize AI chat
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
-            raise HTTPException(status_code=500, detail="AI service not configured")
-        
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"tutor_{level_id}_{current_user['_id']}",
-            system_message="""You are an expert Python programming tutor. Your job is to explain programming concepts in a clear, engaging way with practical examples. 
-
-Key guidelines:
-1. Explain the concept clearly for beginners
-2. Provide 2-3 practical code examples
-3. Include common use cases and best practices
-4. Keep explanations concise but comprehensive
-5. Use encouraging and supportive tone
-6. Focus on the learning objective of the challenge
-
-Format your response with:
-- **Concept Explanation**: Clear overview
-- **Code Examples**: 2-3 practical examples with comments
-- **Common Use Cases**: Where this is used in real programming
-- **Tips**: Best practices and common mistakes to avoid"""
-        ).with_model("openai", "gpt-4o-mini")
-        
-        # Create detailed prompt based on level
-        prompt = f"""
-Explain this Python programming concept for a learning challenge:
-
-**Challenge Title**: {level['title']}
-**Description**: {level['description']}
-**Category**: {level['category']}
-**Difficulty**: {level['difficulty']}
-
-**Current Challenge Code**:
-```python
-{level['starter_code']}
-```
-
-**Expected Output**: {level['expected_output']}
-
-Please provide a comprehensive tutorial explanation that helps the user understand:
-1. The core concept being taught
-2. How to approach this type of problem
-3. Step-by-step breakdown with examples
-4. Import statements needed and why
-
-Make it educational and engaging for a {level['difficulty'].lower()} level programmer.
-"""
-
-        user_message = UserMessage(text=prompt)
-        ai_response = await chat.send_message(user_message)
+        explanation, cached = await tutor_service.explain(db, level)
         
+        if quota:
+            response.headers.update(rate_limit_headers(quota))
         return {
             "success": True,
-            "explanation": ai_response,
+            "explanation": explanation,
+            "cached": cached,
             "level_title": level['title'],
             "subscription_tier": subscription_tier,
             "tutor_available": True
         }
         
     except Exception as e:
-        print(f"AI Tutor Error: {str(e)}")
+        logger.error(f"AI Tutor Error: {str(e)}")
+        quota = await refund_tutor_quota(current_user, quota)
+        if quota:
+            response.headers.update(rate_limit_headers(quota))
         return {
             "success": False,
             "error": "AI tutor temporarily unavailable",
@@ -1577,20 +1528,60 @@ Make it educational and engaging for a {level['difficulty'].lower()} level progr
             "tutor_available": False
         }
 
+@app.get("/api/levels/{level_id}/ai-tutor/stream")
+async def stream_ai_tutor_explanation(
+    level_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream the AI tutor explanation as Server-Sent Events (meta, text deltas, then done or error)"""
+    level = await get_level_with_content(level_id)
+    if not level:
+        raise HTTPException(status_code=404, detail="Level not found")
+    subscription_tier = current_user.get("subscription_tier", "free")
+    # Metered before the stream opens so an exhausted quota is a plain 429
+    quota = await consume_tutor_quota(current_user)
+    
+    async def events():
+        deltas = None
+        try:
+            cached, deltas = await tutor_service.open_stream(db, level)
+            yield format_event({
+                "cached": cached,
+                "level_title": level['title'],
+                "subscription_tier": subscription_tier
+            }, "meta")
+            # Deltas are pulled only as fast as the client reads them; a
+            # disconnect cancels this generator and with it the upstream call
+            async for delta in with_keepalive(deltas):
+                yield KEEPALIVE if delta is None else format_event({"delta": delta})
+            yield format_event({"tutor_available": True}, "done")
+        except Exception as e:
+            logger.error(f"AI Tutor Error: {str(e)}")
+            await refund_tutor_quota(current_user, quota)
+            yield format_event({
+                "error": "AI tutor temporarily unavailable",
+                "fallback_explanation": f"This challenge focuses on {level['category']} concepts. Practice the provided code and check the hints for guidance.",
+                "tutor_available": False
+            }, "error")
+        finally:
+            if deltas is not None:
+                await deltas.aclose()
+    
+    headers = {**SSE_HEADERS, **rate_limit_headers(quota)} if quota else SSE_HEADERS
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
 # User Subscription Management
 @app.get("/api/user/subscription")
 async def get_user_subscription(current_user: dict = Depends(get_current_user)):
     """Get user's current subscription details"""
-    user = await users_collection.find_one({"_id": current_user["_id"]})
-    
-    subscription_tier = user.get("subscription_tier", "free")
+    subscription_tier = current_user.get("subscription_tier", "free")
     subscription_features = {
         "free": {
             "tier": "free",
             "price": 0,
             "features": ["Basic Challenges", "Community Access", "Progress Tracking"],
             "limitations": {
-                "ai_tutor_uses": 3,  # 3 uses per day
+                "ai_tutor_uses": AI_TUTOR_FREE_DAILY_LIMIT,  # uses per day
                 "topic_jumping": False,
                 "all_categories": False,
                 "advanced_hints": False
@@ -1625,10 +1616,10 @@ async def get_user_subscription(current_user: dict = Depends(get_current_user)):
     
     # Add usage tracking for free users
     if subscription_tier == "free":
-        today = datetime.now(timezone.utc).date()
-        ai_tutor_usage = user.get("daily_ai_usage", {}).get(str(today), 0)
-        user_subscription["daily_ai_usage"] = ai_tutor_usage
-        user_subscription["ai_tutor_remaining"] = max(0, 3 - ai_tutor_usage)
+        usage = await tutor_quota.peek(current_user["_id"])
+        user_subscription["daily_ai_usage"] = usage["used"]
+        user_subscription["ai_tutor_remaining"] = usage["remaining"]
+        user_subscription["ai_tutor_resets_at"] = datetime.fromtimestamp(usage["reset"], timezone.utc)
     
     return user_subscription
 
@@ -1642,6 +1633,13 @@ async def upgrade_subscription(
     new_tier = subscription_data.get("tier")
     if new_tier not in ["free", "pro", "enterprise"]:
         raise HTTPException(status_code=400, detail="Invalid subscription tier")
+    payment_method = subscription_data.get("payment_method", "test")
+    
+    # Record the change and its payment in the billing ledger
+    try:
+        change = await billing.change_plan(db, current_user["_id"], new_tier, payment_method)
+    except billing.SubscriptionConflict:
+        raise HTTPException(status_code=409, detail="Subscription is being changed by another request")
     
     # Update user subscription
     await users_collection.update_one(
@@ -1650,28 +1648,34 @@ async def upgrade_subscription(
             "$set": {
                 "subscription_tier": new_tier,
                 "subscription_updated_at": datetime.now(timezone.utc),
-                "payment_method": subscription_data.get("payment_method", "test")
+                "payment_method": payment_method
             }
         }
     )
+    await principal_cache.invalidate_everywhere(db, current_user["_id"])
     
     return {
         "success": True,
         "message": f"Subscription upgraded to {new_tier}",
-        "new_tier": new_tier
+        "new_tier": new_tier,
+        "transaction_id": change["transaction"]["_id"] if change["transaction"] else None
     }
 
 # Create sample paid users for testing
 @app.post("/api/admin/create-sample-users")
-async def create_sample_paid_users(admin_user: dict = Depends(check_admin_access)):
+async def create_sample_paid_users(admin_user: dict = Depends(require_permission(roles.USERS_MANAGE))):
     """Create sample users with different subscription tiers for testing"""
     
+    # All demo users share a password, so hash it once
+    demo_password = await hash_password("demo123")
+    
     sample_users = [
         {
             "_id": str(uuid.uuid4()),
             "username": "free_user_demo",
             "email": "free@pythonquest.com",
-            "password": pwd_context.hash("demo123"),
+            "password": demo_password,
+            "roles": [],
             "subscription_tier": "free",
             "profile": {
                 "current_level": 100,
@@ -1685,7 +1689,8 @@ async def create_sample_paid_users(admin_user: dict = Depends(check_admin_access
             "_id": str(uuid.uuid4()),
             "username": "pro_user_demo", 
             "email": "pro@pythonquest.com",
-            "password": pwd_context.hash("demo123"),
+            "password": demo_password,
+            "roles": [],
             "subscription_tier": "pro",
             "profile": {
                 "current_level": 105,
@@ -1699,7 +1704,8 @@ async def create_sample_paid_users(admin_user: dict = Depends(check_admin_access
             "_id": str(uuid.uuid4()),
             "username": "enterprise_user_demo",
             "email": "enterprise@pythonquest.com", 
-            "password": pwd_context.hash("demo123"),
+            "password": demo_password,
+            "roles": [],
             "subscription_tier": "enterprise",
             "profile": {
                 "current_level": 210,
@@ -1737,9 +1743,10 @@ async def create_sample_paid_users(admin_user: dict = Depends(check_admin_access
 async def update_user(
     user_id: str,
     user_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.USERS_MANAGE))
 ):
     """Update user information"""
+    await get_manageable_user(user_id, admin_user)
     try:
         # Update user data
         update_data = {
@@ -1761,6 +1768,10 @@ async def update_user(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await principal_cache.invalidate_everywhere(db, user_id)
+        
+        if "username" in update_data:
+            await leaderboard.rename(db, user_id, update_data["username"])
         
         return {"success": True, "message": "User updated successfully"}
         
@@ -1771,9 +1782,10 @@ async def update_user(
 async def update_user_status(
     user_id: str,
     status_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.USERS_MANAGE))
 ):
     """Update user status (active, suspended, etc.)"""
+    await get_manageable_user(user_id, admin_user)
     try:
         new_status = status_data.get("status")
         if new_status not in ["active", "suspended", "inactive"]:
@@ -1792,16 +1804,60 @@ async def update_user_status(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await principal_cache.invalidate_everywhere(db, user_id)
         
         return {"success": True, "message": f"User status updated to {new_status}"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.put("/api/admin/users/{user_id}/roles")
+async def set_user_roles(
+    user_id: str,
+    roles_data: dict,
+    admin_user: dict = Depends(require_permission(roles.USERS_ROLES))
+):
+    """Replace a user's staff roles (admin, support, content-editor, billing)"""
+    new_roles = sorted(set(roles_data.get("roles") or []))
+    unknown = [role for role in new_roles if role not in roles.ROLE_PERMISSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown roles: {', '.join(unknown)}")
+    if user_id == admin_user["_id"] and "admin" not in new_roles:
+        raise HTTPException(status_code=400, detail="You cannot remove your own admin role")
+    
+    result = await users_collection.update_one(
+        {"_id": user_id},
+        {
+            "$set": {
+                "roles": new_roles,
+                "roles_updated_at": datetime.now(timezone.utc),
+                "roles_updated_by": admin_user["_id"]
+            }
+        }
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    await principal_cache.invalidate_everywhere(db, user_id)
+    
+    return {"success": True, "roles": new_roles}
+
+@app.post("/api/admin/users/{user_id}/revoke-sessions")
+async def revoke_user_sessions(
+    user_id: str,
+    admin_user: dict = Depends(require_permission(roles.USERS_ROLES))
+):
+    """Invalidate every token issued to a user so far"""
+    result = await users_collection.update_one({"_id": user_id}, {"$inc": {"token_version": 1}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    await principal_cache.invalidate_everywhere(db, user_id)
+    
+    return {"success": True, "message": "All sessions for the user have been revoked"}
+
 @app.post("/api/admin/levels")
 async def create_level(
     level_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.CONTENT_MANAGE))
 ):
     """Create a new level/challenge"""
     try:
@@ -1829,6 +1885,8 @@ async def create_level(
             raise HTTPException(status_code=400, detail="Level ID already exists")
         
         await levels_collection.insert_one(level_doc)
+        await level_catalog.bump(db)
+        await tutor_service.invalidate_level(db, level_doc["level_id"])
         
         return {
             "success": True,
@@ -1839,8 +1897,37 @@ async def create_level(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.patch("/api/admin/levels/{level_id}")
+async def update_level(
+    level_id: int,
+    level_data: dict,
+    admin_user: dict = Depends(require_permission(roles.CONTENT_MANAGE))
+):
+    """Edit an existing level/challenge"""
+    editable_fields = [
+        "title", "description", "category", "difficulty", "xp_reward", "starter_code",
+        "expected_output", "hints", "prerequisites", "is_active"
+    ]
+    update_data = {k: level_data[k] for k in editable_fields if level_data.get(k) is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail=f"Nothing to update. Editable fields: {editable_fields}")
+    if "xp_reward" in update_data:
+        update_data["xp_reward"] = int(update_data["xp_reward"])
+    
+    update_data["updated_at"] = datetime.now(timezone.utc)
+    update_data["updated_by"] = admin_user["_id"]
+    
+    result = await levels_collection.update_one({"level_id": level_id}, {"$set": update_data})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Level not found")
+    
+    await level_catalog.bump(db)
+    await tutor_service.invalidate_level(db, level_id)
+    
+    return {"success": True, "message": "Level updated successfully", "level_id": level_id}
+
 @app.get("/api/admin/badges")
-async def get_badges(admin_user: dict = Depends(check_admin_access)):
+async def get_badges(admin_user: dict = Depends(require_permission(roles.CONTENT_MANAGE))):
     """Get all badges and achievements"""
     # Mock badge data for now
     badges = [
@@ -1878,7 +1965,7 @@ async def get_badges(admin_user: dict = Depends(check_admin_access)):
 @app.post("/api/admin/badges")
 async def create_badge(
     badge_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.CONTENT_MANAGE))
 ):
     """Create a new badge/achievement"""
     badge_doc = {
@@ -1902,7 +1989,7 @@ async def create_badge(
     }
 
 @app.get("/api/admin/support/tickets")
-async def get_support_tickets(admin_user: dict = Depends(check_admin_access)):
+async def get_support_tickets(admin_user: dict = Depends(require_permission(roles.SUPPORT_READ))):
     """Get all support tickets"""
     # Mock support ticket data
     tickets = [
@@ -1933,7 +2020,7 @@ async def get_support_tickets(admin_user: dict = Depends(check_admin_access)):
 @app.post("/api/admin/announcements")
 async def create_announcement(
     announcement_data: dict,
-    admin_user: dict = Depends(check_admin_access)
+    admin_user: dict = Depends(require_permission(roles.SUPPORT_MANAGE))
 ):
     """Create a new announcement"""
     announcement_doc = {
@@ -0,0 +1,49 @@
+"""Server-Sent Events helpers."""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Optional
+
+SSE_KEEPALIVE_SECONDS = 15.0
+KEEPALIVE = ": keep-alive\n\n"
+
+# Sent with every event stream so proxies don't buffer or cache it;
+# CompressionMiddleware already leaves text/event-stream uncompressed
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_event(data: Any, event: Optional[str] = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def with_keepalive(source: AsyncIterator[Any], interval: float = SSE_KEEPALIVE_SECONDS) -> AsyncIterator[Optional[Any]]:
+    """Re-yield ``source``, yielding None whenever it stays silent for ``interval`` seconds"""
+    iterator = source.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield None
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                return
+            yield item
+            pending = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        # The client went away (or the source failed): stop the upstream work too
+        if not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
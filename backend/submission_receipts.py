@@ -0,0 +1,65 @@
+"""Idempotent level submissions.
+
+Clients may send a ``submission_id`` with each submission. The first request
+carrying a given id claims a receipt document; the response it produces is
+stored on that receipt, and retries with the same id get the stored response
+back without running the code or touching progress again. Receipts expire
+after ``SUBMISSION_DEDUP_SECONDS`` through a TTL index.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+SUBMISSION_DEDUP_SECONDS = int(os.environ.get("SUBMISSION_DEDUP_SECONDS", str(24 * 3600)))
+# A pending receipt older than this belongs to a request that died mid-way
+CLAIM_TIMEOUT = timedelta(seconds=60)
+
+
+class SubmissionInProgress(Exception):
+    pass
+
+
+def receipt_id(user_id: str, level_id: int, submission_id: str) -> str:
+    return f"{user_id}:{level_id}:{submission_id}"
+
+
+async def claim(db, key: str) -> Optional[Dict[str, Any]]:
+    """Claim a receipt; returns the stored response if this submission was already handled"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.submission_receipts.insert_one({"_id": key, "state": "pending", "created_at": now, "claimed_at": now})
+        return None
+    except DuplicateKeyError:
+        pass
+
+    receipt = await db.submission_receipts.find_one({"_id": key})
+    if receipt is None:
+        # Expired between the two calls; the id is free again
+        return await claim(db, key)
+    if receipt["state"] == "done":
+        return receipt["response"]
+
+    # Take over a claim abandoned by a crashed request
+    taken = await db.submission_receipts.find_one_and_update(
+        {"_id": key, "state": "pending", "claimed_at": {"$lt": now - CLAIM_TIMEOUT}},
+        {"$set": {"claimed_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if taken is None:
+        raise SubmissionInProgress()
+    return None
+
+
+async def complete(db, key: str, response: Dict[str, Any]):
+    await db.submission_receipts.update_one(
+        {"_id": key},
+        {"$set": {"state": "done", "response": response, "completed_at": datetime.now(timezone.utc)}}
+    )
+
+
+async def release(db, key: str):
+    """Drop a claim whose request failed, so the client can retry"""
+    await db.submission_receipts.delete_one({"_id": key, "state": "pending"})
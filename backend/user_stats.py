@@ -0,0 +1,180 @@
+"""Materialized per-user progress statistics.
+
+One ``user_stats`` document per user (``_id`` is the user id) holds the running
+totals that used to be recomputed from every ``user_progress`` document on each
+request. Completions update it atomically with ``$inc``/``$max``/``$min``;
+``rebuild_user_stats`` recomputes it from ``user_progress`` for backfills and
+repairs.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import ReplaceOne
+
+FIRST_LEVEL = 100
+MAX_LEVEL = 400
+
+
+def empty_stats(user_id: str) -> Dict[str, Any]:
+    # The level/date extremes are left unset rather than null so that the
+    # first $min/$max applied to them takes the incoming value.
+    return {
+        "_id": user_id,
+        "total_xp": 0,
+        "completed_levels": 0,
+        "updated_at": datetime.now(timezone.utc)
+    }
+
+
+def derive_stats(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a stored stats document into the stats payload returned by the API"""
+    completed = doc.get("completed_levels", 0)
+
+    # Current level is the one after the highest completed level
+    current_level = FIRST_LEVEL
+    if completed and doc.get("max_completed_level") is not None:
+        current_level = min(doc["max_completed_level"] + 1, MAX_LEVEL)
+
+    badges = []
+    if completed >= 1:
+        badges.append({"name": "First Steps", "icon": "🎯", "earned_at": doc.get("first_completed_at")})
+    if completed >= 10:
+        badges.append({"name": "Dedicated Learner", "icon": "📚", "earned_at": datetime.now(timezone.utc)})
+    if completed >= 50:
+        badges.append({"name": "Python Expert", "icon": "🐍", "earned_at": datetime.now(timezone.utc)})
+
+    return {
+        "current_level": current_level,
+        "total_xp": doc.get("total_xp", 0),
+        "completed_levels": completed,
+        "streak": 0,  # Simplified for now
+        "badges": badges,
+        "achievements": []  # Can be expanded later
+    }
+
+
+def stats_fields(path: str) -> Dict[str, Any]:
+    """``$addFields`` spec deriving the admin list's stats columns from the stats document at ``path``
+
+    Mirrors ``derive_stats``. ``total_levels_completed`` is left missing when
+    there is no stats document, so callers can tell which rows need a backfill.
+    """
+    completed = f"{path}.completed_levels"
+    max_completed = f"{path}.max_completed_level"
+    return {
+        "total_levels_completed": f"${completed}",
+        "total_xp": {"$ifNull": [f"${path}.total_xp", 0]},
+        "current_level": {"$cond": [
+            {"$and": [{"$gt": [{"$ifNull": [f"${completed}", 0]}, 0]}, {"$ne": [{"$ifNull": [f"${max_completed}", None]}, None]}]},
+            {"$min": [{"$add": [{"$ifNull": [f"${max_completed}", FIRST_LEVEL - 1]}, 1]}, MAX_LEVEL]},
+            FIRST_LEVEL
+        ]},
+        "last_activity": {"$ifNull": [f"${path}.last_completed_at", "$last_login"]}
+    }
+
+
+async def create_user_stats(db, user_id: str):
+    await db.user_stats.update_one({"_id": user_id}, {"$setOnInsert": empty_stats(user_id)}, upsert=True)
+
+
+async def get_user_stats(db, user_id: str) -> Dict[str, Any]:
+    doc = await db.user_stats.find_one({"_id": user_id})
+    if doc is None:
+        # Users created before stats were materialized are backfilled lazily
+        await rebuild_user_stats(db, user_id)
+        doc = await db.user_stats.find_one({"_id": user_id}) or empty_stats(user_id)
+    return derive_stats(doc)
+
+
+async def apply_completion_delta(
+    db,
+    user_id: str,
+    level_id: int,
+    xp_delta: int,
+    completed_delta: int,
+    completed_at: datetime
+):
+    """Fold a completed level into the stats document in a single atomic update"""
+    result = await db.user_stats.update_one(
+        {"_id": user_id},
+        {
+            "$inc": {"total_xp": xp_delta, "completed_levels": completed_delta},
+            "$max": {"max_completed_level": level_id, "last_completed_at": completed_at},
+            "$min": {"first_completed_at": completed_at},
+            "$set": {"updated_at": datetime.now(timezone.utc)}
+        }
+    )
+    if result.matched_count == 0:
+        # No stats yet (legacy user): rebuild from progress, which already
+        # contains this completion, instead of starting from zero.
+        await rebuild_user_stats(db, user_id)
+
+
+async def record_completion(db, user_id: str, level_id: int, xp_earned: int, completed_at: datetime):
+    await apply_completion_delta(db, user_id, level_id, xp_earned, 1, completed_at)
+
+
+async def record_replaced_progress(db, previous: Optional[Dict[str, Any]], current: Dict[str, Any]):
+    """Update stats after a completed progress document replaced ``previous``"""
+    was_completed = bool(previous and previous.get("is_completed", False))
+    xp_delta = current.get("xp_earned", 0) - (previous.get("xp_earned", 0) if was_completed else 0)
+    await apply_completion_delta(
+        db,
+        current["user_id"],
+        current["level_id"],
+        xp_delta,
+        0 if was_completed else 1,
+        current["completed_at"]
+    )
+
+
+async def reset_user_stats(db, user_id: str):
+    await db.user_stats.replace_one({"_id": user_id}, empty_stats(user_id), upsert=True)
+
+
+async def rebuild_user_stats(db, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Recompute stats documents from user_progress; returns the number of users rebuilt"""
+    match = {"is_completed": True}
+    if user_id:
+        match["user_id"] = user_id
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": "$user_id",
+                "total_xp": {"$sum": "$xp_earned"},
+                "completed_levels": {"$sum": 1},
+                "max_completed_level": {"$max": "$level_id"},
+                "first_completed_at": {"$min": "$completed_at"},
+                "last_completed_at": {"$max": "$completed_at"}
+            }
+        }
+    ]
+
+    rebuilt = 0
+    operations = []
+    started_at = datetime.now(timezone.utc)
+    async for row in db.user_progress.aggregate(pipeline, allowDiskUse=True):
+        row.update({"updated_at": datetime.now(timezone.utc), "rebuilt_at": started_at})
+        operations.append(ReplaceOne({"_id": row["_id"]}, row, upsert=True))
+        if len(operations) >= batch_size:
+            await db.user_stats.bulk_write(operations, ordered=False)
+            rebuilt += len(operations)
+            operations = []
+    if operations:
+        await db.user_stats.bulk_write(operations, ordered=False)
+        rebuilt += len(operations)
+
+    if user_id and rebuilt == 0:
+        await reset_user_stats(db, user_id)
+        rebuilt = 1
+    elif not user_id:
+        # Users without any completed level were not part of the aggregation
+        await db.user_stats.update_many(
+            {"$or": [{"rebuilt_at": {"$lt": started_at}}, {"rebuilt_at": {"$exists": False}}]},
+            {
+                "$set": {"total_xp": 0, "completed_levels": 0, "updated_at": datetime.now(timezone.utc)},
+                "$unset": {"max_completed_level": "", "first_completed_at": "", "last_completed_at": ""}
+            }
+        )
+    return rebuilt
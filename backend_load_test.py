@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Load test for the PythonQuest backend.
+
+Drives a locally running backend (optionally starting it with uvicorn against
+a throwaway database on a local mongod) with a weighted mix of student and
+admin traffic: login, dashboard load, submissions, leaderboard, AI tutor
+(served by the local stand-in LLM) and admin pages. Reports throughput and
+p50/p95/p99 per route and writes the results as JSON; pass a previous result
+file with --compare to see the change between runs.
+
+    python backend_load_test.py --start-server --users 50 --duration 60
+    python backend_load_test.py --base-url http://localhost:8001 --mix dashboard=50,submit=50
+    python backend_load_test.py --start-server --compare load_test_results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = Path(__file__).resolve().parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+from metrics import percentiles  # noqa: E402
+
+DEFAULT_MIX = {"login": 5, "dashboard": 35, "submit": 25, "leaderboard": 15, "tutor": 10, "admin": 10}
+ADMIN_PAGES = [
+    ("/api/admin/analytics/dashboard", {}),
+    ("/api/admin/users", {"limit": 100}),
+    ("/api/admin/feedback", {}),
+    ("/api/admin/feedback/statistics", {}),
+    ("/api/admin/subscriptions/users", {}),
+    ("/api/admin/payments/transactions", {}),
+]
+PASSWORD = "LoadTest123!"
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}', expected one of {', '.join(DEFAULT_MIX)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Weight for '{name}' must be a number")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("At least one scenario needs a positive weight")
+    return mix
+
+
+class Recorder:
+    """Latencies and status codes per route; requests finishing during warm-up are dropped"""
+
+    def __init__(self, warmup_until):
+        self.warmup_until = warmup_until
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.started = None
+        self.finished = None
+
+    def record(self, route, status, elapsed_ms):
+        now = time.perf_counter()
+        if now < self.warmup_until:
+            return
+        if self.started is None:
+            self.started = now
+        self.finished = now
+        self.latencies[route].append(elapsed_ms)
+        self.statuses[route][str(status)] += 1
+
+    def report(self):
+        duration = (self.finished - self.started) if self.started is not None else 0.0
+        routes = {}
+        for route in sorted(self.latencies):
+            samples = self.latencies[route]
+            errors = sum(count for status, count in self.statuses[route].items() if not status.startswith("2"))
+            routes[route] = {
+                "requests": len(samples),
+                "errors": errors,
+                "throughput_rps": round(len(samples) / duration, 2) if duration else 0.0,
+                "mean_ms": round(sum(samples) / len(samples), 2),
+                **percentiles(samples),
+                "max_ms": round(max(samples), 2),
+                "statuses": dict(self.statuses[route])
+            }
+        all_samples = [sample for samples in self.latencies.values() for sample in samples]
+        total = {
+            "requests": len(all_samples),
+            "errors": sum(route["errors"] for route in routes.values()),
+            "throughput_rps": round(len(all_samples) / duration, 2) if duration else 0.0,
+            **percentiles(all_samples)
+        }
+        return {"duration_seconds": round(duration, 2), "total": total, "routes": routes}
+
+
+class LoadTest:
+    def __init__(self, args, client, db):
+        self.args = args
+        self.client = client
+        self.db = db
+        self.recorder = None
+        self.students = []
+        self.admin = None
+        self.levels = []
+
+    async def request(self, route, method, path, token=None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=headers, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.recorder.record(route, status, (time.perf_counter() - started) * 1000)
+        return response
+
+    async def signup(self, prefix):
+        name = f"{prefix}_{uuid.uuid4().hex[:10]}"
+        account = {"username": name, "email": f"{name}@loadtest.example.com", "password": PASSWORD}
+        response = await self.client.post("/api/auth/signup", json=account)
+        response.raise_for_status()
+        data = response.json()
+        return {**account, "id": data["user"]["id"], "token": data["access_token"]}
+
+    async def setup(self):
+        """Create the student pool and an admin, and pick up the levels students will work on"""
+        semaphore = asyncio.Semaphore(10)
+
+        async def create_student():
+            async with semaphore:
+                return await self.signup("loadtest")
+
+        self.students = await asyncio.gather(*[create_student() for _ in range(self.args.students)])
+
+        admin = await self.signup("loadtest_admin")
+        await self.db.users.update_one({"_id": admin["id"]}, {"$set": {"roles": ["admin"]}})
+        response = await self.client.post("/api/auth/login", json={"email": admin["email"], "password": PASSWORD})
+        response.raise_for_status()
+        self.admin = {**admin, "token": response.json()["access_token"]}
+
+        response = await self.client.get("/api/levels", params={"limit": self.args.levels})
+        response.raise_for_status()
+        self.levels = response.json()
+        if not self.levels:
+            raise RuntimeError("No active levels; is the database seeded?")
+
+    # Scenarios, each one user action as the frontend issues it
+
+    async def login(self, student):
+        response = await self.request("POST /api/auth/login", "POST", "/api/auth/login",
+                                      json={"email": student["email"], "password": PASSWORD})
+        if response is not None and response.status_code == 200:
+            student["token"] = response.json()["access_token"]
+
+    async def dashboard(self, student):
+        await asyncio.gather(
+            self.request("GET /api/levels", "GET", "/api/levels", student["token"],
+                         params={"limit": 50, "summary": "true"}),
+            self.request("GET /api/user/progress", "GET", "/api/user/progress", student["token"])
+        )
+
+    async def submit(self, student):
+        level = random.choice(self.levels)
+        # Mostly correct answers, graded end to end; the rest exercise the failure path
+        output = level["expected_output"] if random.random() < 0.7 else "wrong answer"
+        await self.request("POST /api/levels/{level_id}/submit", "POST", f"/api/levels/{level['level_id']}/submit",
+                           student["token"], json={"code": f"print({output!r})", "submission_id": uuid.uuid4().hex})
+
+    async def leaderboard(self, student):
+        await asyncio.gather(
+            self.request("GET /api/leaderboard", "GET", "/api/leaderboard", student["token"]),
+            self.request("GET /api/leaderboard/me", "GET", "/api/leaderboard/me", student["token"])
+        )
+
+    async def tutor(self, student):
+        level = random.choice(self.levels)
+        await self.request("POST /api/levels/{level_id}/ai-tutor", "POST",
+                           f"/api/levels/{level['level_id']}/ai-tutor", student["token"])
+
+    async def admin_page(self, student):
+        path, params = random.choice(ADMIN_PAGES)
+        await self.request(f"GET {path}", "GET", path, self.admin["token"], params=params)
+
+    async def virtual_user(self, deadline):
+        scenarios = {
+            "login": self.login, "dashboard": self.dashboard, "submit": self.submit,
+            "leaderboard": self.leaderboard, "tutor": self.tutor, "admin": self.admin_page
+        }
+        names = [name for name, weight in self.args.mix.items() if weight > 0]
+        weights = [self.args.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            student = random.choice(self.students)
+            await scenarios[random.choices(names, weights)[0]](student)
+            if self.args.think_time:
+                await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+
+    async def run(self):
+        started = time.perf_counter()
+        self.recorder = Recorder(started + self.args.warmup)
+        deadline = started + self.args.warmup + self.args.duration
+        await asyncio.gather(*[self.virtual_user(deadline) for _ in range(self.args.users)])
+        return self.recorder.report()
+
+
+def start_server(args):
+    """Start the backend with uvicorn against a throwaway database and the local tutor backend"""
+    env = {
+        **os.environ,
+        "MONGO_URL": args.mongo_url,
+        "DB_NAME": args.db_name,
+        "AI_TUTOR_BACKEND": "local",
+        # Free-tier quota would turn most tutor calls into 429s
+        "AI_TUTOR_FREE_DAILY_LIMIT": str(10 ** 9)
+    }
+    port = httpx.URL(args.base_url).port or 80
+    command = [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.server_workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+
+async def wait_until_healthy(client, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server not healthy after {timeout}s")
+
+
+def print_report(result, baseline=None):
+    baseline_routes = (baseline or {}).get("routes", {})
+    print(f"\n{'route':<46}{'req':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, stats in {**result["routes"], "TOTAL": result["total"]}.items():
+        line = (f"{route:<46}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9.1f}"
+                f"{stats['p50']:>9.1f}{stats['p95']:>9.1f}{stats['p99']:>9.1f}")
+        previous = baseline["total"] if route == "TOTAL" and baseline else baseline_routes.get(route)
+        if previous and previous["p95"]:
+            change = (stats["p95"] - previous["p95"]) / previous["p95"] * 100
+            line += f"   p95 {change:+.1f}%  rps {stats['throughput_rps'] - previous['throughput_rps']:+.1f}"
+        print(line)
+    print(f"\nLatencies in ms over {result['duration_seconds']}s")
+
+
+async def main(args):
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["result"]
+
+    mongo = AsyncIOMotorClient(args.mongo_url)
+    server = start_server(args) if args.start_server else None
+    try:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                     limits=httpx.Limits(max_connections=args.users * 2)) as client:
+            await wait_until_healthy(client, server)
+            load_test = LoadTest(args, client, mongo[args.db_name])
+            print(f"Setting up {args.students} students and an admin...")
+            await load_test.setup()
+            print(f"Running {args.users} virtual users for {args.duration}s (+{args.warmup}s warm-up), mix {args.mix}")
+            result = await load_test.run()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+            if not args.keep_db:
+                await mongo.drop_database(args.db_name)
+        mongo.close()
+
+    print_report(result, baseline)
+
+    output = Path(args.output or f"load_test_results/{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    output.write_text(json.dumps({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": config,
+        "result": result
+    }, indent=2))
+    print(f"Results written to {output}")
+    return 1 if result["total"]["errors"] and args.fail_on_errors else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the PythonQuest backend with a student/admin traffic mix")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--start-server", action="store_true", help="Start the backend with uvicorn for the run")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=os.environ.get("LOAD_TEST_DB_NAME", "pythonquest_loadtest"),
+                        help="Database the admin user is promoted in (and which --start-server uses)")
+    parser.add_argument("--keep-db", action="store_true", help="Keep the database after a --start-server run")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--students", type=int, default=50, help="Student accounts the virtual users act as")
+    parser.add_argument("--levels", type=int, default=20, help="Levels submissions and tutor calls are spread over")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of traffic before measuring")
+    parser.add_argument("--think-time", type=float, default=0, help="Mean pause between a user's actions, in seconds")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Scenario weights, e.g. login=5,dashboard=35,submit=25,leaderboard=15,tutor=10,admin=10")
+    parser.add_argument("--output", help="Result file (default load_test_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    parser.add_argument("--fail-on-errors", action="store_true", help="Exit non-zero if any request failed")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -177,7 +177,10 @@ const FullyFunctionalAdminPanel = () => {
   const loadDashboardStats = async () => {
     try {
       const response = await axios.get('/api/admin/analytics/dashboard');
-      setDashboardStats(response.data.user_stats);
+      setDashboardStats({
+        ...response.data.user_stats,
+        challengesCompleted: response.data.learning_stats?.total_challenges_completed
+      });
     } catch (error) {
       // Mock data for demonstration
       setDashboardStats({
@@ -103,137 +103,22 @@ const LevelPage = () => {
     setOutput('');
     
     try {
-      await new Promise(resolve => setTimeout(resolve, 1000));
-      const simulatedOutput = executeSimplePython(code);
-      setOutput(simulatedOutput);
-      toast.success('Code executed successfully!');
+      const response = await axios.post(`/api/levels/${levelId}/run`, { code: code });
+      const { stdout, stderr, timed_out } = response.data;
+      setOutput([stdout, stderr].filter(Boolean).join('\n').trim() || 'No output');
+      if (timed_out || stderr) {
+        toast.error('Execution error');
+      } else {
+        toast.success('Code executed successfully!');
+      }
     } catch (error) {
-      setOutput('Error: ' + error.message);
+      setOutput('Error: ' + (error.response?.data?.detail || error.message));
       toast.error('Execution error');
     } finally {
       setIsRunning(false);
     }
   };
 
-  const executeSimplePython = (code) => {
-    try {
-      console.log('Executing Python code:', code);
-      const lines = code.split('\n').filter(line => 
-        line.trim() && !line.trim().startsWith('#')
-      );
-      
-      console.log('Filtered lines:', lines);
-      let output = [];
-      let variables = {};
-      let skipNextLine = false;
-      
-      for (let i = 0; i < lines.length; i++) {
-        if (skipNextLine) {
-          skipNextLine = false;
-          continue;
-        }
-        
-        let line = lines[i].trim();
-        
-        if (line.includes('print(')) {
-          const printMatch = line.match(/print\s*\(([^)]*)\)/);
-          if (printMatch) {
-            let content = printMatch[1].trim();
-            
-            // Handle string literals with quotes
-            if ((content.startsWith('"') && content.endsWith('"')) || 
-                (content.startsWith("'") && content.endsWith("'"))) {
-              content = content.slice(1, -1); // Remove quotes
-              output.push(content);
-            } else if (variables[content]) {
-              output.push(variables[content].toString());
-            } else {
-              try {
-                const result = evaluateExpression(content, variables);
-                output.push(result.toString());
-              } catch (e) {
-                // If all else fails, just remove quotes and output as string
-                const cleanContent = content.replace(/['"]/g, '');
-                output.push(cleanContent);
-              }
-            }
-          }
-        } else if (line.includes('=') && !line.includes('==')) {
-          const [varName, expression] = line.split('=').map(s => s.trim());
-          
-          if (expression.includes('"') || expression.includes("'")) {
-            variables[varName] = expression.replace(/['"]/g, '');
-          } else {
-            try {
-              variables[varName] = evaluateExpression(expression, variables);
-            } catch (e) {
-              variables[varName] = expression;
-            }
-          }
-        } else if (line.includes('for') && line.includes('range(')) {
-          const rangeMatch = line.match(/for\s+(\w+)\s+in\s+range\((.*)\):/);
-          if (rangeMatch) {
-            const [, varName, rangeParams] = rangeMatch;
-            const params = rangeParams.split(',').map(p => parseInt(p.trim()));
-            
-            let start = 0, end = params[0], step = 1;
-            if (params.length === 2) {
-              [start, end] = params;
-            } else if (params.length === 3) {
-              [start, end, step] = params;
-            }
-            
-            // Check if there's a next line (loop body)
-            if (i + 1 < lines.length) {
-              const nextLine = lines[i + 1];
-              if (nextLine.includes('print(')) {
-                // Execute the loop with the print statement
-                for (let loopVar = start; loopVar < end; loopVar += step) {
-                  variables[varName] = loopVar;
-                  // Execute the print statement in the loop context
-                  const printMatch = nextLine.match(/print\s*\(([^)]*)\)/);
-                  if (printMatch) {
-                    let content = printMatch[1].trim();
-                    if (content === varName) {
-                      output.push(loopVar.toString());
-                    }
-                  }
-                }
-                // Skip the next line since we processed it
-                skipNextLine = true;
-              }
-            }
-          }
-        }
-      }
-      
-      const finalOutput = output.join('\n') || 'No output';
-      console.log('Final output:', finalOutput);
-      return finalOutput;
-    } catch (error) {
-      console.error('Execution error:', error);
-      throw new Error('Execution failed: ' + error.message);
-    }
-  };
-
-  const evaluateExpression = (expr, variables) => {
-    let processed = expr;
-    for (let [varName, value] of Object.entries(variables)) {
-      processed = processed.replace(new RegExp(`\\b${varName}\\b`, 'g'), value);
-    }
-    
-    if (processed.includes('+') && (processed.includes('"') || processed.includes("'"))) {
-      const parts = processed.split('+').map(p => p.trim().replace(/['"]/g, ''));
-      return parts.join('');
-    }
-    
-    try {
-      return eval(processed);
-    } catch (e) {
-      return processed;
-    }
-  };
-
   const submitSolution = async () => {
     if (!output) {
       toast.error('Please run your code first!');
@@ -243,11 +128,27 @@ const LevelPage = () => {
     setIsSubmitting(true);
     setAttempts(prev => prev + 1);
 
+    // Retries reuse the id so the server grades this submission only once
+    const submissionId = window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    const postSubmission = async (retriesLeft) => {
+      try {
+        return await axios.post(`/api/levels/${levelId}/submit`, {
+          code: code,
+          submission_id: submissionId
+        });
+      } catch (error) {
+        const status = error.response?.status;
+        const retryable = !error.response || status === 409 || status === 503;
+        if (!retryable || retriesLeft === 0) throw error;
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        return postSubmission(retriesLeft - 1);
+      }
+    };
+
     try {
-      const response = await axios.post(`/api/levels/${levelId}/submit`, {
-        code: code,
-        output: output
-      });
+      const response = await postSubmission(2);
 
       setResult(response.data);
       
@@ -320,23 +221,68 @@ const LevelPage = () => {
     setShowAITutor(true);
 
     try {
-      const response = await axios.post(`/api/levels/${levelId}/ai-tutor`);
-      
-      if (response.data.success) {
-        setAiExplanation(response.data.explanation);
-        
-        // Update subscription data if usage changed
-        if (userSubscription?.tier === 'free') {
+      // Stream the explanation so the first words show up while the rest is generated
+      const response = await fetch(`${axios.defaults.baseURL}/api/levels/${levelId}/ai-tutor/stream`, {
+        headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+      });
+      if (response.status === 429) {
+        setUserSubscription(prev => ({ ...prev, ai_tutor_remaining: 0 }));
+        setShowAITutor(false);
+        toast.error('Daily AI tutor limit reached. Upgrade to Pro for unlimited access!');
+        return;
+      }
+      if (!response.ok || !response.body) {
+        throw new Error(`AI tutor stream failed with status ${response.status}`);
+      }
+      const remainingHeader = response.headers.get('X-RateLimit-Remaining');
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let explanation = '';
+      let failure = null;
+      setAiExplanation('');
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const rawEvent of events) {
+          let eventType = 'message';
+          let data = '';
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) eventType = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          }
+          if (!data) continue; // keep-alive comment
+
+          const payload = JSON.parse(data);
+          if (eventType === 'message') {
+            explanation += payload.delta;
+            setAiExplanation(explanation);
+            setAiTutorLoading(false);
+          } else if (eventType === 'error') {
+            failure = payload;
+          }
+        }
+      }
+
+      if (!failure) {
+        // The server counts the use; mirror its remaining allowance
+        if (remainingHeader !== null) {
           setUserSubscription(prev => ({
             ...prev,
-            ai_tutor_remaining: Math.max(0, (prev?.ai_tutor_remaining || 3) - 1)
+            ai_tutor_remaining: Number(remainingHeader)
           }));
         }
         
         toast.success('AI tutor explanation ready!');
       } else {
-        setAiTutorError(response.data.error);
-        setAiExplanation(response.data.fallback_explanation);
+        setAiTutorError(failure.error);
+        setAiExplanation(failure.fallback_explanation);
       }
     } catch (error) {
       console.error('AI Tutor error:', error);
@@ -351,7 +297,7 @@ const LevelPage = () => {
     if (!userSubscription) return 'AI Tutor';
     
     if (userSubscription.tier === 'free') {
-      return `AI Tutor (${userSubscription.ai_tutor_remaining || 0}/3 left)`;
+      return `AI Tutor (${userSubscription.ai_tutor_remaining || 0}/${userSubscription.limitations?.ai_tutor_uses ?? 3} left)`;
     }
     
     return 'AI Tutor';
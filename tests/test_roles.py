@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import roles  # noqa: E402
+
+
+def principal(*role_names):
+    return roles.permissions_for(role_names)
+
+
+def test_support_cannot_manage_admin():
+    assert not roles.can_manage(principal("support"), {"roles": ["admin"]})
+
+
+def test_support_cannot_manage_user_with_roles_it_lacks():
+    assert not roles.can_manage(principal("support"), {"roles": ["billing"]})
+    assert not roles.can_manage(principal("support"), {"roles": ["support", "content-editor"]})
+
+
+def test_support_can_manage_learners_and_peers():
+    assert roles.can_manage(principal("support"), {"roles": []})
+    assert roles.can_manage(principal("support"), {})
+    assert roles.can_manage(principal("support"), {"roles": ["support"]})
+
+
+def test_unknown_roles_grant_nothing():
+    assert roles.can_manage(principal("support"), {"roles": ["superuser"]})
+
+
+def test_admin_can_manage_everyone():
+    for role in roles.ROLE_PERMISSIONS:
+        assert roles.can_manage(principal("admin"), {"roles": [role]})